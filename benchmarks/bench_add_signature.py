@@ -0,0 +1,44 @@
+"""
+Adding one more signature to a JWS General JSON Serialization of a 1 MiB
+payload with JWS.add_signature, compared with signing the payload again
+with every key using JWS.sign, for JWS with 1 to 8 existing signatures.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_add_signature.py
+"""
+import timeit
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.native import CryptographyModule
+
+PAYLOAD_LENGTH = 1024 * 1024
+SIGNATURE_COUNTS = (1, 2, 4, 8)
+NUMBER = 20
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jws = JWS(module)
+    payload = module.random_bytes(PAYLOAD_LENGTH)
+    algorithm = DigitalSignatureAlgorithm.HS256
+    keys = [Key(KeyType.oct, kid=str(i), k=module.random_bytes(32))
+            for i in range(max(SIGNATURE_COUNTS) + 1)]
+    print(f"{'existing':>8} {'sign all ms':>12} {'add ms':>8}")
+    for count in SIGNATURE_COUNTS:
+        signed = jws.sign(KeySet(keys[:count]), algorithm, payload,
+                          Serialization.GENERAL_JSON)
+        sign_all = timeit.timeit(
+            lambda: jws.sign(KeySet(keys[:count + 1]), algorithm, payload,
+                             Serialization.GENERAL_JSON),
+            number=NUMBER) / NUMBER
+        add = timeit.timeit(
+            lambda: jws.add_signature(signed, keys[count], algorithm),
+            number=NUMBER) / NUMBER
+        print(f"{count:>8} {sign_all * 1e3:>12.2f} {add * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Signing and verifying through the JOSE client, which prepares keys,
+headers and HMAC contexts when it is constructed, compared with calling
+JWS and JWT directly with the same key set. The key set has one signing key
+and, as while keys are rotated, KEYS verification only keys. Reports the
+time per call for a 64 byte payload.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_client.py
+"""
+import timeit
+
+from elfose.jose.client import JOSE
+from elfose.jose.core.encoding import json_dumps
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeyOp, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.native import CryptographyModule
+
+NUMBER = 20000
+KEYS = 100
+
+
+def main() -> None:
+    module = CryptographyModule()
+    keys = [Key(KeyType.oct, kid="signing", k=module.random_bytes(32))]
+    keys.extend(Key(KeyType.oct, kid=str(index), k=module.random_bytes(32),
+                    key_ops={KeyOp.verify}) for index in range(KEYS))
+    key_set = KeySet(keys)
+    algorithm = DigitalSignatureAlgorithm.HS256
+    payload = module.random_bytes(64)
+    claims_set = ClaimsSet(issuer="issuer", subject="subject",
+                           expires=2 ** 31)
+
+    jose = JOSE(key_set, module)
+    jws = JWS(module)
+    jwt = JWT(jws)
+    compact = jose.sign(payload, serialization=Serialization.COMPACT)
+    flattened = jose.sign(payload, serialization=Serialization.FLATTENED_JSON)
+    token = jose.tokenize(claims_set)
+
+    cases = (
+        ("sign compact",
+         lambda: jws.sign(key_set, algorithm, payload, Serialization.COMPACT),
+         lambda: jose.sign(payload, serialization=Serialization.COMPACT)),
+        ("sign flattened",
+         lambda: json_dumps(jws.sign(key_set, algorithm, payload,
+                                     Serialization.FLATTENED_JSON)),
+         lambda: jose.sign(payload,
+                           serialization=Serialization.FLATTENED_JSON)),
+        ("verify compact",
+         lambda: jws.verify(key_set, compact),
+         lambda: jose.verify(compact)),
+        ("verify flattened",
+         lambda: jws.verify(key_set, flattened),
+         lambda: jose.verify(flattened)),
+        ("tokenize",
+         lambda: jwt.create(key_set, algorithm, claims_set,
+                            Serialization.COMPACT),
+         lambda: jose.tokenize(claims_set)),
+        ("verify_token",
+         lambda: jwt.verify(key_set, token),
+         lambda: jose.verify_token(token)),
+    )
+    print(f"{'operation':<17} {'JWS/JWT us':>11} {'JOSE us':>8}")
+    for name, direct, client in cases:
+        assert direct() == client()
+        direct_time = timeit.timeit(direct, number=NUMBER) / NUMBER
+        client_time = timeit.timeit(client, number=NUMBER) / NUMBER
+        print(f"{name:<17} {direct_time * 1e6:>11.1f} "
+              f"{client_time * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Converting a JWS between serializations by verifying it and signing the
+payload again, compared with JWS.convert rearranging the encoded segments.
+Reports the time per conversion for a 1 KiB payload.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_convert.py
+"""
+import timeit
+
+from elfose.jose.core.encoding import json_dumps
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.native import CryptographyModule
+
+NUMBER = 20000
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jws = JWS(module)
+    key_set = KeySet([Key(KeyType.oct, kid="1", k=module.random_bytes(32))])
+    algorithm = DigitalSignatureAlgorithm.HS256
+    payload = module.random_bytes(1024)
+
+    print(f"{'conversion':<29} {'re-sign us':>11} {'convert us':>11}")
+    for source, target in ((Serialization.COMPACT,
+                            Serialization.FLATTENED_JSON),
+                           (Serialization.GENERAL_JSON,
+                            Serialization.COMPACT),
+                           (Serialization.FLATTENED_JSON,
+                            Serialization.GENERAL_JSON)):
+        signed = jws.sign(key_set, algorithm, payload, source)
+        serialized = signed if isinstance(signed, str) else json_dumps(signed)
+
+        def re_sign():
+            return jws.sign(key_set, algorithm,
+                            jws.verify(key_set, serialized), target)
+
+        def convert():
+            return JWS.convert(signed, target)
+
+        assert re_sign() == convert()
+        re_sign_time = timeit.timeit(re_sign, number=NUMBER) / NUMBER
+        convert_time = timeit.timeit(convert, number=NUMBER) / NUMBER
+        print(f"{source.name + ' > ' + target.name:<29} "
+              f"{re_sign_time * 1e6:>11.1f} {convert_time * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Looking up HMAC keys derived per tenant by DerivedKeySet. Cold lookups
+derive the key of a tenant that is not cached, warm lookups find the key in
+the cache. Verifying a compact JWS is measured the same way, cold verifying
+derives the key and prepares its HMAC context as well. Reports the time per
+operation and the memory held by a cache of CACHE_SIZE keys.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_derived_keys.py
+"""
+import timeit
+import tracemalloc
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.keystore import DerivedKeySet
+from elfose.jose.native import CryptographyModule
+
+NUMBER = 20000
+CACHE_SIZE = 10000
+
+
+def lookup(key_set: DerivedKeySet, jws: JWS, kids, tokens) -> None:
+    for kid in kids:
+        key_set.get_key_by_id(kid)
+
+
+def verify(key_set: DerivedKeySet, jws: JWS, kids, tokens) -> None:
+    for token in tokens:
+        jws.verify(key_set, token)
+
+
+def main() -> None:
+    module = CryptographyModule()
+    master_secret = module.random_bytes(32)
+
+    def new_key_set():
+        return DerivedKeySet(module, master_secret, epoch=1,
+                             cache_size=CACHE_SIZE)
+
+    key_set = new_key_set()
+    jws = JWS(module)
+    tokens = [jws.sign(key_set.for_tenant(f"tenant-{index}"),
+                       DigitalSignatureAlgorithm.HS256, b"payload",
+                       Serialization.COMPACT)
+              for index in range(NUMBER)]
+    kids = [f"tenant-{index}/1" for index in range(NUMBER)]
+
+    print(f"{'operation':<10} {'cold us':>8} {'warm us':>8}")
+    for name, operation in (("lookup", lookup), ("verify", verify)):
+        key_set = new_key_set()
+        jws = JWS(key_set.cryptography_module)
+        cold = timeit.timeit(
+            lambda: operation(key_set, jws, kids, tokens), number=1) / NUMBER
+
+        key_set = new_key_set()
+        jws = JWS(key_set.cryptography_module)
+        cached_kids, cached_tokens = kids[:CACHE_SIZE], tokens[:CACHE_SIZE]
+        operation(key_set, jws, cached_kids, cached_tokens)
+        warm = timeit.timeit(
+            lambda: operation(key_set, jws, cached_kids, cached_tokens),
+            number=NUMBER // CACHE_SIZE) / NUMBER
+        print(f"{name:<10} {cold * 1e6:>8.1f} {warm * 1e6:>8.1f}")
+
+    tracemalloc.start()
+    key_set = new_key_set()
+    verify(key_set, JWS(key_set.cryptography_module), kids, tokens)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{CACHE_SIZE} cached keys and HMAC contexts: "
+          f"{size / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
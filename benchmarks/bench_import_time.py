@@ -0,0 +1,39 @@
+"""
+Cumulative import time of the core package and its main modules as reported
+by python -X importtime, the best of several runs of a fresh interpreter.
+The test suite holds elfose.jose.core.jwt to a budget, see
+core/tests/test_core_import_time.py.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_import_time.py
+"""
+import subprocess
+import sys
+
+MODULES = ("elfose.jose.core", "elfose.jose.core.jwk", "elfose.jose.core.jws",
+           "elfose.jose.core.jwt", "elfose.jose.core.jwe",
+           "elfose.jose.native", "elfose.jose.client")
+RUNS = 5
+
+
+def import_time(module: str) -> int:
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import {module}"], stderr=subprocess.PIPE,
+                            check=True, universal_newlines=True).stderr
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if fields[-1].strip() == module:
+            return int(fields[1])
+    raise ValueError(f"No import time reported for {module}")
+
+
+def main() -> None:
+    print(f"{'module':<24} {'best ms':>8}")
+    for module in MODULES:
+        best = min(import_time(module) for _ in range(RUNS))
+        print(f"{module:<24} {best / 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+End-to-end JWE encrypt and decrypt latency with and without DEF compression
+for claim sets of increasing size.
+
+Run from the repository root with both packages installed:
+
+    python benchmarks/bench_jwe_compression.py
+"""
+import timeit
+
+from elfose.jose.core.encoding import json_dumps
+from elfose.jose.core.jwa import CompressionAlgorithm, \
+    ContentEncryptionAlgorithm, ContentEncryptionKeyAlgorithm
+from elfose.jose.core.jwe import JWE
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import Serialization
+from elfose.jose.pycryptodome import CryptographyModule
+
+CLAIM_COUNTS = (10, 100, 1000, 10000)
+
+
+def claims(count: int) -> bytes:
+    return json_dumps({
+        "sub": "user-1234",
+        "permissions": [{"resource": f"resource-{i % 50}",
+                         "actions": ["read", "write"]}
+                        for i in range(count)],
+    }).encode()
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jwe = JWE(module)
+    key_set = KeySet([Key(KeyType.oct, k=module.random_bytes(16))])
+    print(f"{'plaintext':>10} {'zip':>5} {'token':>10} {'encrypt us':>11} "
+          f"{'decrypt us':>11}")
+    for count in CLAIM_COUNTS:
+        plaintext = claims(count)
+        for compression in (None, CompressionAlgorithm.DEF):
+            token = jwe.encrypt(key_set, ContentEncryptionKeyAlgorithm.A128KW,
+                                ContentEncryptionAlgorithm.A128GCM, plaintext,
+                                Serialization.COMPACT,
+                                compression=compression)
+            number = max(10, 20000 // count)
+            encrypt = timeit.timeit(
+                lambda: jwe.encrypt(key_set,
+                                    ContentEncryptionKeyAlgorithm.A128KW,
+                                    ContentEncryptionAlgorithm.A128GCM,
+                                    plaintext, Serialization.COMPACT,
+                                    compression=compression),
+                number=number) / number
+            decrypt = timeit.timeit(lambda: jwe.decrypt(key_set, token),
+                                    number=number) / number
+            print(f"{len(plaintext):>10} "
+                  f"{'DEF' if compression else '-':>5} {len(token):>10} "
+                  f"{encrypt * 1e6:>11.1f} {decrypt * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
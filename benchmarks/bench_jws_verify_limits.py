@@ -0,0 +1,84 @@
+"""
+Cost of rejecting adversarial input in JWS.verify with the default
+VerificationLimits compared with limits large enough to be effectively
+unbounded. Every row except those starting with "valid" is rejected with a
+ValueError.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_jws_verify_limits.py
+"""
+import timeit
+
+from elfose.jose.core.encoding import base64_url_encode, json_dumps
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization, VerificationLimits
+from elfose.jose.native import CryptographyModule
+
+UNBOUNDED = 1 << 40
+
+
+def cases(jws: JWS, key_set: KeySet):
+    valid = jws.sign(key_set, DigitalSignatureAlgorithm.HS256, b"{}",
+                     Serialization.COMPACT)
+    header, payload, signature = valid.split(".")
+    yield "valid", valid
+    yield "valid JSON 512 KiB", json_dumps(jws.sign(
+        key_set, DigitalSignatureAlgorithm.HS256, b"x" * (384 << 10),
+        Serialization.FLATTENED_JSON))
+    yield "8 MiB token", header + "." + "A" * (8 << 20) + "." + signature
+    yield "1 MiB header", base64_url_encode(
+        b'{"alg":"HS256","x":"' + b"x" * (1 << 20) + b'"}') \
+        + "." + payload + "." + signature
+    yield "bad char at end", header + "." + "A" * (512 << 10) + "!." \
+        + signature
+    yield "1000 signatures", json_dumps({
+        "payload": payload,
+        "signatures": [{"protected": header, "signature": signature}] * 1000
+    })
+    yield "deep nesting", '{"payload":' + "[" * 200000
+    flattened = {"payload": payload, "protected": header,
+                 "signature": signature}
+    yield "JSON 512 KiB hdr", json_dumps(
+        dict(flattened, header={"x": "x" * (512 << 10)}))
+    yield "JSON deep header", json_dumps(flattened)[:-1] \
+        + ',"header":' + "[" * 200000
+    yield "JSON 50k members", json_dumps(flattened)[:-1] + "".join(
+        f',"x{i}":0' for i in range(50000)) + "}"
+    yield "JSON 300k sigs", json_dumps({
+        "payload": payload, "signatures": [{}] * 300000
+    })
+    yield "disallowed alg", base64_url_encode(b'{"alg":"none"}') + "." \
+        + payload + "." + signature
+
+
+def main() -> None:
+    module = CryptographyModule()
+    key_set = KeySet([Key(KeyType.oct, k=module.random_bytes(32))])
+    bounded = JWS(module, VerificationLimits(
+        allowed_algorithms={DigitalSignatureAlgorithm.HS256}))
+    unbounded = JWS(module, VerificationLimits(
+        max_token_length=UNBOUNDED, max_header_length=UNBOUNDED,
+        max_signatures=UNBOUNDED))
+
+    def verify(jws: JWS, token: str) -> None:
+        try:
+            jws.verify(key_set, token)
+        except (ValueError, NotImplementedError):
+            pass
+
+    print(f"{'input':>18} {'length':>9} {'bounded us':>11} "
+          f"{'unbounded us':>13}")
+    for name, token in cases(bounded, key_set):
+        number = 20 if len(token) > 10000 else 2000
+        bounded_time = timeit.timeit(lambda: verify(bounded, token),
+                                     number=number) / number
+        unbounded_time = timeit.timeit(lambda: verify(unbounded, token),
+                                       number=number) / number
+        print(f"{name:>18} {len(token):>9} {bounded_time * 1e6:>11.1f} "
+              f"{unbounded_time * 1e6:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
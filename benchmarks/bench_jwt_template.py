@@ -0,0 +1,75 @@
+"""
+JWT creation with JWT.create compared with a JWTTemplate from JWT.template,
+varying only exp, iat and jti. Reports time per token and the peak memory
+allocated while creating a token, as traced by tracemalloc.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_jwt_template.py
+"""
+import timeit
+import tracemalloc
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.native import CryptographyModule
+
+PRIVATE_CLAIM_COUNTS = (0, 5, 50)
+NUMBER = 5000
+
+
+def peak_allocated(create) -> int:
+    tracemalloc.start()
+    create()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    create()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - current
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jwt = JWT(JWS(module))
+    key_set = KeySet([Key(KeyType.oct, kid="key",
+                          k=module.random_bytes(32))])
+    algorithm = DigitalSignatureAlgorithm.HS256
+    print(f"{'claims':>7} {'create us':>10} {'template us':>12} "
+          f"{'create peak B':>14} {'template peak B':>16}")
+    for count in PRIVATE_CLAIM_COUNTS:
+        private_claims = {f"claim{i}": f"value{i}" for i in range(count)}
+        template_claims = dict(issuer="https://issuer.example.com",
+                               subject="service-a",
+                               audience="service-b", **private_claims)
+        template = jwt.template(key_set, algorithm,
+                                ClaimsSet(**template_claims))
+        issued = [1300819380]
+
+        def create():
+            issued[0] += 1
+            claims_set = ClaimsSet(expires=issued[0] + 300,
+                                   issued_at=issued[0],
+                                   jwt_id=str(issued[0]), **template_claims)
+            return jwt.create(key_set, algorithm, claims_set,
+                              Serialization.COMPACT)
+
+        def create_from_template():
+            issued[0] += 1
+            return template.create(expires=issued[0] + 300,
+                                   issued_at=issued[0],
+                                   jwt_id=str(issued[0]))
+
+        create_time = timeit.timeit(create, number=NUMBER) / NUMBER
+        template_time = timeit.timeit(create_from_template,
+                                      number=NUMBER) / NUMBER
+        print(f"{count:>7} {create_time * 1e6:>10.1f} "
+              f"{template_time * 1e6:>12.1f} "
+              f"{peak_allocated(create):>14} "
+              f"{peak_allocated(create_from_template):>16}")
+
+
+if __name__ == "__main__":
+    main()
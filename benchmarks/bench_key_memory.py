@@ -0,0 +1,42 @@
+"""
+Memory used by Key objects and by the KeySet holding them for key sets of
+10 thousand, 100 thousand and 1 million HMAC keys with a kid, use and
+key_ops, as traced by tracemalloc. The key material and kid strings are
+created before tracing starts, so only the Key objects and the KeySet
+containers and index are counted.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_key_memory.py
+"""
+import gc
+import os
+import tracemalloc
+
+from elfose.jose.core.jwk import Key, KeyOp, KeySet, KeyType, Use
+
+KEY_COUNTS = (10000, 100000, 1000000)
+
+
+def main() -> None:
+    print(f"{'keys':>9} {'bytes/key':>10} {'bytes/key in set':>17} "
+          f"{'total MiB':>10}")
+    for count in KEY_COUNTS:
+        material = [(f"tenant-{i:08d}", os.urandom(32)) for i in range(count)]
+        gc.collect()
+        tracemalloc.start()
+        keys = [Key(KeyType.oct, kid=kid, k=k, use=Use.sig,
+                    key_ops=[KeyOp.sign, KeyOp.verify])
+                for kid, k in material]
+        keys_size, _ = tracemalloc.get_traced_memory()
+        key_set = KeySet(keys)
+        total_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{count:>9} {keys_size / count:>10.1f} "
+              f"{(total_size - keys_size) / count:>17.1f} "
+              f"{total_size / 2 ** 20:>10.1f}")
+        del keys, key_set, material
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Opening a MappedKeySet over an index of 1 million HMAC keys compared with
+parsing the same keys into a KeySet, and the time of get_key_by_id for keys
+in and out of the hot key cache. Each key set is opened in a forked process
+and the growth of its resident set size is reported, split into private
+memory and shared file pages such as the index pages touched by lookups.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_mapped_key_set.py
+"""
+import json
+import os
+import random
+import tempfile
+import time
+import timeit
+
+from elfose.jose.core.jwk import Key, KeyOp, KeySet, KeyType, Use
+from elfose.jose.core.keystore import MappedKeySet, write_key_index
+
+KEY_COUNT = 1000000
+LOOKUPS = 100000
+
+
+def open_mapped(path: str):
+    return MappedKeySet(path, cache_size=1024)
+
+
+def open_parsed(path: str):
+    with open(path) as jwks_file:
+        return KeySet(Key.from_dict(jwk)
+                      for jwk in json.load(jwks_file)["keys"])
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as statm:
+        _, resident, shared = map(int, statm.read().split()[:3])
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    return (resident - shared) * page_size, shared * page_size
+
+
+def measure(name: str, open_key_set, path: str) -> None:
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        private, shared = resident_bytes()
+        started = time.perf_counter()
+        key_set = open_key_set(path)
+        opened = time.perf_counter() - started
+        hot = [f"tenant-{i:08d}" for i in range(512)]
+        cold = [f"tenant-{random.randrange(KEY_COUNT):08d}"
+                for _ in range(LOOKUPS)]
+        hot_time = timeit.timeit(
+            lambda: [key_set.get_key_by_id(kid) for kid in hot],
+            number=LOOKUPS // len(hot)) / LOOKUPS
+        cold_time = timeit.timeit(
+            lambda: [key_set.get_key_by_id(kid) for kid in cold],
+            number=1) / LOOKUPS
+        private = resident_bytes()[0] - private
+        shared = resident_bytes()[1] - shared
+        os.write(write, f"{opened} {hot_time} {cold_time} {private} "
+                        f"{shared}".encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as result:
+        opened, hot_time, cold_time, private, shared = map(
+            float, result.read().split())
+    os.waitpid(pid, 0)
+    print(f"{name:<10} {opened * 1e3:>10.1f} {hot_time * 1e6:>10.2f} "
+          f"{cold_time * 1e6:>11.2f} {private / 2 ** 20:>12.1f} "
+          f"{shared / 2 ** 20:>11.1f}")
+
+
+def main() -> None:
+    keys = [Key(KeyType.oct, kid=f"tenant-{i:08d}", k=os.urandom(32),
+                use=Use.sig, key_ops=[KeyOp.sign, KeyOp.verify])
+            for i in range(KEY_COUNT)]
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "keys.idx")
+        jwks_path = os.path.join(directory, "keys.json")
+        write_key_index(index_path, keys)
+        with open(jwks_path, "w") as jwks_file:
+            json.dump({"keys": [key.to_dict() for key in keys]}, jwks_file)
+        del keys
+        print(f"{'key set':<10} {'open ms':>10} {'hot µs':>10} "
+              f"{'cold µs':>11} {'private MiB':>12} {'shared MiB':>11}")
+        measure("parsed", open_parsed, jwks_path)
+        measure("mapped", open_mapped, index_path)
+
+
+if __name__ == "__main__":
+    main()
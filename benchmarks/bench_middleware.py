@@ -0,0 +1,113 @@
+"""
+Latency the bearer token middleware adds to a request. The WSGI middleware
+is measured with requests over local connections to a wsgiref server in a
+background thread. No ASGI server is a dependency, so the ASGI middleware
+is measured by calling the application directly with asyncio. Each is
+measured without middleware, with the per-worker claims set cache and with
+that cache disabled, every request carrying the same HS256 bearer token.
+
+Run from the repository root with the core package installed, optionally
+passing the number of requests:
+
+    python benchmarks/bench_middleware.py [requests]
+"""
+import asyncio
+import http.client
+import statistics
+import sys
+import threading
+import time
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.middleware import BearerTokenASGIMiddleware, \
+    BearerTokenVerifier, BearerTokenWSGIMiddleware
+from elfose.jose.native import CryptographyModule
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+def wsgi_app(environ, start_response):
+    start_response("200 OK", [("Content-Length", "2")])
+    return [b"OK"]
+
+
+async def asgi_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-length", b"2")]})
+    await send({"type": "http.response.body", "body": b"OK"})
+
+
+def measure_wsgi(app, token: str, requests: int) -> float:
+    server = make_server("127.0.0.1", 0, app, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    headers = {"Authorization": "Bearer " + token}
+    latencies = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            connection = http.client.HTTPConnection(*server.server_address)
+            connection.request("GET", "/", headers=headers)
+            connection.getresponse().read()
+            connection.close()
+            latencies.append(time.perf_counter() - started)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return statistics.median(latencies)
+
+
+def measure_asgi(app, token: str, requests: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/",
+             "headers": [(b"host", b"localhost"),
+                         (b"authorization", b"Bearer " + token.encode())]}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    async def run():
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await app(scope, receive, send)
+            latencies.append(time.perf_counter() - started)
+        return statistics.median(latencies)
+
+    return asyncio.run(run())
+
+
+def main() -> None:
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    jwt = JWT(JWS(CryptographyModule()))
+    key_set = KeySet([Key(KeyType.oct, kid="kid", k=b"k" * 32)])
+    token = jwt.create(key_set, DigitalSignatureAlgorithm.HS256,
+                       ClaimsSet(issuer="issuer", subject="subject",
+                                 expires=int(time.time()) + 3600),
+                       Serialization.COMPACT)
+    print(f"{'server':<6} {'middleware':<12} {'median µs':>10} "
+          f"{'added µs':>9}")
+    for name, measure, app, middleware in (
+            ("wsgi", measure_wsgi, wsgi_app, BearerTokenWSGIMiddleware),
+            ("asgi", measure_asgi, asgi_app, BearerTokenASGIMiddleware)):
+        baseline = measure(app, token, requests)
+        print(f"{name:<6} {'none':<12} {baseline * 1e6:>10.1f} {'':>9}")
+        for label, cache_size in (("cached", 1024), ("uncached", 0)):
+            verifier = BearerTokenVerifier(jwt, key_set,
+                                           cache_size=cache_size)
+            latency = measure(middleware(app, verifier), token, requests)
+            print(f"{name:<6} {label:<12} {latency * 1e6:>10.1f} "
+                  f"{(latency - baseline) * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Nested JWT (sign-then-encrypt) latency for JWT.create_nested compared with
+the two step approach of creating a compact JWT, encoding it and encrypting
+the result.
+
+Run from the repository root with both packages installed:
+
+    python benchmarks/bench_nested_jwt.py
+"""
+import timeit
+
+from elfose.jose.core.jwa import ContentEncryptionAlgorithm, \
+    ContentEncryptionKeyAlgorithm, DigitalSignatureAlgorithm
+from elfose.jose.core.jwe import JWE
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.pycryptodome import CryptographyModule
+
+PRIVATE_CLAIM_COUNTS = (0, 10, 100, 1000)
+NUMBER = 2000
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jws = JWS(module)
+    jwe = JWE(module)
+    jwt = JWT(jws, jwe)
+    signing_keys = KeySet([Key(KeyType.oct, k=module.random_bytes(32))])
+    encryption_keys = KeySet([Key(KeyType.oct, k=module.random_bytes(16))])
+    signing_algorithm = DigitalSignatureAlgorithm.HS256
+    key_algorithm = ContentEncryptionKeyAlgorithm.A128KW
+    encryption = ContentEncryptionAlgorithm.A128GCM
+
+    def two_step(claims_set: ClaimsSet) -> str:
+        signed = jwt.create(signing_keys, signing_algorithm, claims_set,
+                            Serialization.COMPACT)
+        return jwe.encrypt(encryption_keys, key_algorithm, encryption,
+                           signed.encode(), Serialization.COMPACT,
+                           protected_header={"cty": "JWT"})
+
+    def nested(claims_set: ClaimsSet) -> str:
+        return jwt.create_nested(signing_keys, signing_algorithm, claims_set,
+                                 encryption_keys, key_algorithm, encryption)
+
+    print(f"{'claims':>7} {'two step us':>12} {'nested us':>10} "
+          f"{'verify us':>10}")
+    for count in PRIVATE_CLAIM_COUNTS:
+        claims_set = ClaimsSet(issuer="issuer", subject="subject",
+                               expires=1300819380,
+                               **{f"claim{i}": i for i in range(count)})
+        token = nested(claims_set)
+        number = max(100, NUMBER // max(1, count // 10))
+        two_step_time = timeit.timeit(lambda: two_step(claims_set),
+                                      number=number) / number
+        nested_time = timeit.timeit(lambda: nested(claims_set),
+                                    number=number) / number
+        verify_time = timeit.timeit(
+            lambda: jwt.verify_nested(encryption_keys, signing_keys, token),
+            number=number) / number
+        print(f"{count:>7} {two_step_time * 1e6:>12.1f} "
+              f"{nested_time * 1e6:>10.1f} {verify_time * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
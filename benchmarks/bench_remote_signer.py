@@ -0,0 +1,112 @@
+"""
+Signing compact JWS with keys held by a signer in another process, reached
+over a Unix socket. Compares a module making one round-trip per signature,
+on a connection per thread, with the remote CryptographyModule coalescing
+the requests of concurrent threads into batches over two pooled
+connections. Reports signatures per second for increasing numbers of
+signing threads, with the signer answering at once and with it taking an
+extra millisecond for every batch, as a signer on another host or backed by
+a hardware module would.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_remote_signer.py
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from elfose.jose.core.cryptography import HashingAlgorithm
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS
+from elfose.jose.native import CryptographyModule as NativeModule
+from elfose.jose.remote import CryptographyModule, Signer, SignerServer, \
+    UnixSocketTransport
+
+SIGNATURES = 20000
+THREADS = (1, 8, 32)
+LATENCIES = (0.0, 0.001)
+
+
+class RoundTripModule(NativeModule):
+    def __init__(self, path: str) -> None:
+        self.__path = path
+        self.__local = threading.local()
+
+    def hmac_digest(self, hashing_algorithm: HashingAlgorithm, key: bytes,
+                    message: bytes) -> bytes:
+        transport = getattr(self.__local, "transport", None)
+        if transport is None:
+            transport = self.__local.transport = UnixSocketTransport(
+                self.__path)
+        return transport.call([(hashing_algorithm, key, message)])[0]
+
+
+class SlowSigner(Signer):
+    def __init__(self, latency: float) -> None:
+        super().__init__(NativeModule(), {b"signing-key": b"k" * 32})
+        self.__latency = latency
+
+    def handle(self, requests):
+        if self.__latency:
+            time.sleep(self.__latency)
+        return super().handle(requests)
+
+
+def serve(path: str, latency: float) -> None:
+    SignerServer(path, SlowSigner(latency)).serve_forever()
+
+
+def throughput(module, threads: int, latency: float) -> float:
+    jws = JWS(module)
+    key_set = KeySet([Key(KeyType.oct, kid="1", k=b"signing-key")])
+    per_thread = SIGNATURES // threads
+    if latency:
+        per_thread //= 20
+
+    def sign():
+        for _ in range(per_thread):
+            jws.sign_compact(key_set, DigitalSignatureAlgorithm.HS256,
+                             b"payload")
+
+    workers = [threading.Thread(target=sign) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main() -> None:
+    print(f"{'latency ms':>10} {'threads':>7} {'round-trip/s':>13} "
+          f"{'coalesced/s':>12}")
+    for latency in LATENCIES:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "signer.sock")
+            server = multiprocessing.Process(target=serve,
+                                             args=(path, latency),
+                                             daemon=True)
+            server.start()
+            while not os.path.exists(path):
+                time.sleep(0.01)
+            try:
+                for threads in THREADS:
+                    round_trip = throughput(RoundTripModule(path), threads,
+                                            latency)
+                    with CryptographyModule(
+                            lambda: UnixSocketTransport(path),
+                            connections=2) as module:
+                        coalesced = throughput(module, threads, latency)
+                    print(f"{latency * 1000:>10.0f} {threads:>7} "
+                          f"{round_trip:>13.0f} {coalesced:>12.0f}")
+            finally:
+                server.terminate()
+                server.join()
+
+
+if __name__ == "__main__":
+    main()
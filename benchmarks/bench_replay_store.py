@@ -0,0 +1,67 @@
+"""
+Throughput and memory of the jti replay stores for a simulated hour of
+traffic at one million JWTs per hour, each with a five minute lifetime.
+The simulated clock advances with every JWT so buckets and segments expire
+as they would in production. Each store runs in a forked process and its
+memory is the growth of that process's peak resident set size.
+
+Run from the repository root with the core package installed, optionally
+passing the number of JWTs per hour:
+
+    python benchmarks/bench_replay_store.py [tokens_per_hour]
+"""
+import multiprocessing
+import resource
+import sys
+import time
+
+from elfose.jose.core.replay import MemoryReplayStore, \
+    SharedMemoryReplayStore
+
+LIFETIME = 300
+BUCKET_SECONDS = 60
+
+
+def measure(factory, tokens: int, results) -> None:
+    clock = [1300000000.0]
+    interval = 3600 / tokens
+    jtis = [f"jti-{i}" for i in range(tokens)]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    store = factory(lambda: clock[0])
+    start = time.perf_counter()
+    for jti in jtis:
+        clock[0] += interval
+        store.add(jti, int(clock[0]) + LIFETIME)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((tokens / elapsed, (peak - baseline) / 1024))
+
+
+def run(name: str, factory, tokens: int) -> None:
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    process = context.Process(target=measure,
+                              args=(factory, tokens, results))
+    process.start()
+    rate, mebibytes = results.get()
+    process.join()
+    print(f"{name:>14} {rate:>12.0f} {mebibytes:>10.1f}")
+
+
+def main() -> None:
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    bucket_tokens = tokens * BUCKET_SECONDS // 3600 + 1
+    print(f"{'store':>14} {'adds/s':>12} {'RSS MiB':>10}")
+    run("memory", lambda clock: MemoryReplayStore(
+        bucket_seconds=BUCKET_SECONDS, clock=clock), tokens)
+    run("bloom 0.1%", lambda clock: MemoryReplayStore(
+        bucket_seconds=BUCKET_SECONDS, false_positive_rate=0.001,
+        bucket_capacity=bucket_tokens, clock=clock), tokens)
+    run("shared memory", lambda clock: SharedMemoryReplayStore(
+        segments=LIFETIME // BUCKET_SECONDS + 2,
+        segment_capacity=bucket_tokens * 2,
+        bucket_seconds=BUCKET_SECONDS, clock=clock), tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+JWS verification throughput of a pool of forked worker processes, as a
+pre-fork web server would run, each verifying the same set of compact JWS
+in its own random order. Without a cache every worker verifies every token,
+with a SharedVerificationCache created before the workers are forked a
+token verified by one worker is accepted from the cache by the others.
+Reported are the verifications per second of the whole pool and the number
+of HMAC calculations made by all of its workers.
+
+Run from the repository root with the core package installed, optionally
+passing the number of distinct tokens and of verifications per worker:
+
+    python benchmarks/bench_shared_verification_cache.py \
+        [tokens] [verifications]
+"""
+import multiprocessing
+import random
+import sys
+import time
+
+from elfose.jose.core.cache import SharedVerificationCache
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.native import CryptographyModule
+
+PROCESSES = (1, 2, 4, 8, 16, 32)
+
+
+class CountingCryptographyModule(CryptographyModule):
+    def __init__(self) -> None:
+        self.hmac_verifications = 0
+
+    def hmac_digest_verify(self, hashing_algorithm, key, message, digest):
+        self.hmac_verifications += 1
+        return super().hmac_digest_verify(hashing_algorithm, key, message,
+                                          digest)
+
+
+def work(key_set, tokens, verifications, verification_cache, start,
+         results) -> None:
+    module = CountingCryptographyModule()
+    jws = JWS(module, verification_cache=verification_cache)
+    order = [random.choice(tokens) for _ in range(verifications)]
+    start.wait()
+    for token in order:
+        jws.verify(key_set, token)
+    results.put(module.hmac_verifications)
+
+
+def run(processes: int, key_set, tokens, verifications, cached: bool):
+    context = multiprocessing.get_context("fork")
+    verification_cache = SharedVerificationCache(slots=4 * len(tokens)) \
+        if cached else None
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=work, args=(
+        key_set, tokens, verifications, verification_cache, start, results))
+        for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    started = time.perf_counter()
+    start.set()
+    hmac_verifications = sum(results.get() for _ in workers)
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    if verification_cache is not None:
+        verification_cache.close()
+    return processes * verifications / elapsed, hmac_verifications
+
+
+def main() -> None:
+    token_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    verifications = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    keys = [Key(KeyType.oct, kid=f"kid-{i}", k=bytes([i]) * 32)
+            for i in range(16)]
+    key_set = KeySet(keys)
+    signer = JWS(CryptographyModule())
+    tokens = [signer.sign(KeySet([keys[i % len(keys)]]),
+                          DigitalSignatureAlgorithm.HS256,
+                          f'{{"sub":"user-{i}"}}'.encode(),
+                          Serialization.COMPACT)
+              for i in range(token_count)]
+    print(f"{'processes':>9} {'uncached/s':>11} {'HMACs':>8} "
+          f"{'cached/s':>11} {'HMACs':>8}")
+    for processes in PROCESSES:
+        uncached, uncached_hmacs = run(processes, key_set, tokens,
+                                       verifications, False)
+        cached, cached_hmacs = run(processes, key_set, tokens,
+                                   verifications, True)
+        print(f"{processes:>9} {uncached:>11.0f} {uncached_hmacs:>8} "
+              f"{cached:>11.0f} {cached_hmacs:>8}")
+
+
+if __name__ == "__main__":
+    main()
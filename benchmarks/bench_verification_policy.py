@@ -0,0 +1,59 @@
+"""
+JWS.verify_with_policy on a General JSON Serialization with 8 HS256
+signatures of a 1 MiB payload, with the length limit raised to fit, for
+each policy, checking signatures in turn and in a thread pool of 4.
+hashlib releases the GIL while hashing large inputs, so the pool can check
+signatures in parallel on a machine with more than one core. Parsing the
+serialization is included in every time.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_verification_policy.py
+"""
+import json
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import AllSignaturesPolicy, AnySignaturePolicy, \
+    JWS, KidsPolicy, Serialization, ThresholdPolicy, VerificationLimits
+from elfose.jose.native import CryptographyModule
+
+PAYLOAD_LENGTH = 1024 * 1024
+SIGNATURES = 8
+NUMBER = 10
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jws = JWS(module, VerificationLimits(max_token_length=4 * PAYLOAD_LENGTH))
+    key_set = KeySet([Key(KeyType.oct, kid=str(i), k=module.random_bytes(32))
+                      for i in range(SIGNATURES)])
+    token = json.dumps(jws.sign(key_set, DigitalSignatureAlgorithm.HS256,
+                                module.random_bytes(PAYLOAD_LENGTH),
+                                Serialization.GENERAL_JSON))
+    policies = (("any", AnySignaturePolicy()),
+                ("all", AllSignaturesPolicy()),
+                ("threshold 5", ThresholdPolicy(5)),
+                ("kids 0 and 7", KidsPolicy(["0", "7"])))
+    print(f"{'policy':<14} {'checked':>8} {'in turn ms':>11} "
+          f"{'pool ms':>8}")
+    with ThreadPoolExecutor(4) as executor:
+        for name, policy in policies:
+            result = jws.verify_with_policy(key_set, token, policy)
+            checked = len(result.valid_signatures) \
+                + len(result.invalid_signatures)
+            in_turn = timeit.timeit(
+                lambda: jws.verify_with_policy(key_set, token, policy),
+                number=NUMBER) / NUMBER
+            pool = timeit.timeit(
+                lambda: jws.verify_with_policy(key_set, token, policy,
+                                               executor),
+                number=NUMBER) / NUMBER
+            print(f"{name:<14} {checked:>8} {in_turn * 1e3:>11.2f} "
+                  f"{pool * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
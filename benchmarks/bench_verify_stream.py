@@ -0,0 +1,80 @@
+"""
+Verifying a JWS Flattened JSON Serialization held in a file with JWS.verify,
+reading the whole file first, compared with JWS.verify_stream writing the
+payload to /dev/null, for payloads of increasing size. verify_stream is run
+with the protected header before the payload, so the payload is MACed as it
+is read, and after it, as JWS.sign orders the members, so the payload is
+spooled to a temporary file first. Reports the time and the peak memory
+allocated while verifying, as traced by tracemalloc.
+
+Run from the repository root with the core package installed:
+
+    python benchmarks/bench_verify_stream.py
+"""
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, VerificationLimits
+from elfose.jose.native import CryptographyModule
+
+SIZES = (1, 16, 64)
+
+
+def measure(verify):
+    tracemalloc.start()
+    start = time.perf_counter()
+    verify()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    module = CryptographyModule()
+    jws = JWS(module, VerificationLimits(max_token_length=1 << 31))
+    key_set = KeySet([Key(KeyType.oct, kid="1", k=module.random_bytes(32))])
+    algorithm = DigitalSignatureAlgorithm.HS256
+
+    print(f"{'MiB':>4} {'verify s':>9} {'stream s':>9} {'spooled s':>10} "
+          f"{'verify MiB':>11} {'stream KiB':>11} {'spooled KiB':>12}")
+    with tempfile.TemporaryDirectory() as directory, \
+            open(os.devnull, "wb") as output:
+        payload_first = os.path.join(directory, "payload_first.json")
+        header_first = os.path.join(directory, "header_first.json")
+        for size in SIZES:
+            signed = jws.sign(key_set, algorithm,
+                              module.random_bytes(size * 1024 * 1024))
+            with open(payload_first, "w") as file:
+                json.dump(signed, file)
+            with open(header_first, "w") as file:
+                json.dump({"protected": signed["protected"],
+                           "signature": signed["signature"],
+                           "payload": signed["payload"]}, file)
+            del signed
+
+            def verify():
+                with open(payload_first, "rb") as file:
+                    output.write(jws.verify(key_set, file.read()))
+
+            def verify_stream(path):
+                with open(path, "rb") as file:
+                    jws.verify_stream(key_set, file, output)
+
+            verify_time, verify_peak = measure(verify)
+            stream_time, stream_peak = measure(
+                lambda: verify_stream(header_first))
+            spooled_time, spooled_peak = measure(
+                lambda: verify_stream(payload_first))
+            print(f"{size:>4} {verify_time:>9.3f} {stream_time:>9.3f} "
+                  f"{spooled_time:>10.3f} {verify_peak / 1048576:>11.1f} "
+                  f"{stream_peak / 1024:>11.1f} {spooled_peak / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,4 +7,12 @@ setup(
     package_dir={"": "src"},
     zip_safe=False,
     test_suite="tests",
+    entry_points={
+        "elfose.jose.cryptography_modules": [
+            "native = elfose.jose.native:CryptographyModule",
+        ],
+        "console_scripts": [
+            "elfose-jose = elfose.jose.cli:main",
+        ],
+    },
 )
@@ -0,0 +1,260 @@
+"""
+Command line tool signing or verifying newline delimited files of payloads
+or tokens in bulk. Lines are read lazily, in batches, by a bounded number of
+pending batches fanned out to worker processes. The JWK Set is read once
+and parsed once by each worker. Results are written in input order as
+NDJSON and a summary of throughput, latency and failures is written to
+stderr.
+
+    elfose-jose verify --jwks keys.json tokens.txt > results.ndjson
+    elfose-jose sign --jwks keys.json --algorithm HS256 < payloads.txt
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..core.cryptography import load_cryptography_module
+from ..core.encoding import base64_url_encode, json_dumps
+from ..core.jwa import DigitalSignatureAlgorithm
+from ..core.jwk import KeySet
+from ..core.jws import InvalidJWSError, JWS, FailureReason, Serialization
+
+DEFAULT_BATCH_SIZE = 256
+HISTOGRAM_BUCKETS = 24
+SERIALIZATIONS = {"compact": Serialization.COMPACT,
+                  "flattened": Serialization.FLATTENED_JSON,
+                  "general": Serialization.GENERAL_JSON}
+
+# NDJSON record, latency in seconds and failure reason
+Result = Tuple[str, float, Optional[str]]
+
+_worker_state = None
+
+
+class Statistics:
+    """
+    Counts, failures by reason and a histogram of latencies in power of two
+    microsecond buckets for the results of a run
+    """
+
+    def __init__(self) -> None:
+        self.__count = 0
+        self.__failures = Counter()
+        self.__histogram = [0] * HISTOGRAM_BUCKETS
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def failures(self) -> int:
+        return sum(self.__failures.values())
+
+    def add(self, latency: float, reason: Optional[str]) -> None:
+        self.__count += 1
+        if reason is not None:
+            self.__failures[reason] += 1
+        bucket = min(int(latency * 1000000).bit_length(),
+                     HISTOGRAM_BUCKETS - 1)
+        self.__histogram[bucket] += 1
+
+    def report(self, stream, elapsed: float) -> None:
+        rate = self.__count / elapsed if elapsed > 0 else 0.0
+        print(f"tokens: {self.__count} failures: {self.failures} "
+              f"elapsed: {elapsed:.3f}s throughput: {rate:.0f}/s",
+              file=stream)
+        for reason, count in sorted(self.__failures.items()):
+            print(f"  {reason}: {count}", file=stream)
+        print(f"{'latency µs':<17} {'count':>10}", file=stream)
+        for bucket, count in enumerate(self.__histogram):
+            if count:
+                low = 0 if bucket == 0 else 2 ** (bucket - 1)
+                print(f"{low:>7} - {2 ** bucket:<7} {count:>10}",
+                      file=stream)
+        percentiles = " ".join(
+            f"p{percentile}<={self.__percentile(percentile)}"
+            for percentile in (50, 90, 99))
+        print(f"latency {percentiles} µs", file=stream)
+
+    def __percentile(self, percentile: int) -> int:
+        threshold = self.__count * percentile / 100
+        seen = 0
+        for bucket, count in enumerate(self.__histogram):
+            seen += count
+            if count and seen >= threshold:
+                return 2 ** bucket
+        return 0
+
+
+def main(argv: List[str] = None) -> int:
+    arguments = _parser().parse_args(argv)
+    if arguments.workers < 0 or arguments.batch_size < 1:
+        print("workers must not be negative and batch-size must be positive",
+              file=sys.stderr)
+        return 2
+    # Loaded here as well so that a bad argument is reported once rather
+    # than failing every worker a pool would then replace
+    try:
+        with open(arguments.jwks, "rb") as jwks_file:
+            jwks = json.load(jwks_file)
+        KeySet.from_dict(jwks)
+        load_cryptography_module(arguments.cryptography_module)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Unable to load the keys or cryptography module: {e}",
+              file=sys.stderr)
+        return 2
+    initial_state = (arguments.command, jwks,
+                     arguments.cryptography_module,
+                     getattr(arguments, "algorithm", None),
+                     getattr(arguments, "serialization", None))
+    batches = _batches(_read_lines(arguments.files), arguments.batch_size)
+    statistics = Statistics()
+    started = time.perf_counter()
+    output = sys.stdout.buffer if arguments.output == "-" \
+        else open(arguments.output, "wb")
+    try:
+        if arguments.workers == 0:
+            _initialize(*initial_state)
+            for batch in batches:
+                _write(output, statistics, _process(batch))
+        else:
+            import multiprocessing
+            with multiprocessing.Pool(arguments.workers, _initialize,
+                                      initial_state) as pool:
+                # Bounded so a large input is never read ahead of the output
+                pending = deque()
+                for batch in batches:
+                    if len(pending) >= 2 * arguments.workers:
+                        _write(output, statistics, pending.popleft().get())
+                    pending.append(pool.apply_async(_process, (batch,)))
+                while pending:
+                    _write(output, statistics, pending.popleft().get())
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        else:
+            output.flush()
+    statistics.report(sys.stderr, time.perf_counter() - started)
+    return 1 if statistics.failures else 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="elfose-jose",
+        description="Sign or verify newline delimited payloads or tokens "
+                    "and write the results as NDJSON.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    verify = commands.add_parser("verify", help="verify JWS tokens")
+    sign = commands.add_parser("sign", help="sign payloads")
+    for command in (verify, sign):
+        command.add_argument("files", nargs="*", default=["-"],
+                             help="input files, - or none for stdin")
+        command.add_argument("--jwks", required=True,
+                             help="JWK Set JSON file with the keys")
+        command.add_argument("--output", default="-",
+                             help="NDJSON output file, - for stdout")
+        command.add_argument("--workers", type=int,
+                             default=os.cpu_count() or 1,
+                             help="worker processes, 0 to work in process")
+        command.add_argument("--batch-size", type=int,
+                             default=DEFAULT_BATCH_SIZE,
+                             help="lines sent to a worker at a time")
+        command.add_argument("--cryptography-module",
+                             help="installed cryptography module to use")
+    sign.add_argument("--algorithm", required=True,
+                      choices=[algorithm.value for algorithm
+                               in DigitalSignatureAlgorithm])
+    sign.add_argument("--serialization", default="compact",
+                      choices=sorted(SERIALIZATIONS))
+    return parser
+
+
+def _read_lines(files: Iterable[str]) -> Iterator[Tuple[int, bytes]]:
+    line_number = 0
+    for file_name in files:
+        if file_name == "-":
+            stream = sys.stdin.buffer
+        else:
+            stream = open(file_name, "rb")
+        try:
+            for line in stream:
+                line_number += 1
+                line = line.strip()
+                if line:
+                    yield line_number, line
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+
+def _batches(lines: Iterator[Tuple[int, bytes]],
+             batch_size: int) -> Iterator[List[Tuple[int, bytes]]]:
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _write(output: BinaryIO, statistics: Statistics,
+           results: List[Result]) -> None:
+    for record, latency, reason in results:
+        statistics.add(latency, reason)
+        output.write(record.encode("utf-8") + b"\n")
+
+
+def _initialize(command: str, jwks: Dict, cryptography_module: Optional[str],
+                algorithm: Optional[str],
+                serialization: Optional[str]) -> None:
+    global _worker_state
+    key_set = KeySet.from_dict(jwks)
+    _worker_state = (
+        command, JWS(load_cryptography_module(cryptography_module)), key_set,
+        None if algorithm is None
+        else DigitalSignatureAlgorithm.from_value(algorithm),
+        None if serialization is None else SERIALIZATIONS[serialization])
+
+
+def _process(batch: List[Tuple[int, bytes]]) -> List[Result]:
+    command, jws, key_set, algorithm, serialization = _worker_state
+    results = []
+    for line_number, line in batch:
+        record = {"line": line_number}
+        reason = None
+        started = time.perf_counter()
+        try:
+            if command == "verify":
+                payload = jws.verify(key_set, line)
+                record["valid"] = True
+                try:
+                    record["payload"] = payload.decode("utf-8")
+                except UnicodeDecodeError:
+                    record["payload_base64url"] = base64_url_encode(payload)
+            else:
+                record["token"] = jws.sign(key_set, algorithm, line,
+                                           serialization)
+        except InvalidJWSError as e:
+            reason, error = e.reason.value, e
+        except ValueError as e:
+            reason = FailureReason.MALFORMED.value if command == "verify" \
+                else "invalid"
+            error = e
+        except NotImplementedError as e:
+            reason, error = "not_implemented", e
+        except Exception as e:
+            # One hostile line is recorded rather than aborting the run
+            reason, error = "error", e
+        latency = time.perf_counter() - started
+        if reason is not None:
+            if command == "verify":
+                record["valid"] = False
+            record["reason"] = reason
+            record["error"] = str(error)
+        results.append((json_dumps(record), latency, reason))
+    return results
@@ -1,11 +1,23 @@
-from typing import Union
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple, Union
 
-from .core.cryptography import CryptographyModule
-from .core.jwa import DigitalSignatureAlgorithm, ContentEncryptionAlgorithm, \
+from ..core.cryptography import CryptographyModule, \
+    PreparedHmacCryptographyModule, load_cryptography_module
+from ..core.encoding import json_dumps
+from ..core.header import ProtectedHeader
+from ..core.jwa import DigitalSignatureAlgorithm, ContentEncryptionAlgorithm, \
     ContentEncryptionKeyAlgorithm
-from .core.jwk import KeySet, Key
-from .core.jws import Serialization
-from .core.jwt import Claims
+from ..core.jwk import KeySet, Key, get_signing_keys
+from ..core.jws import CompactSigner, HMAC_ALGORITHMS, JWS, Serialization, \
+    VerificationLimits
+from ..core.jwt import ClaimsSet, JWT, JWT_PROTECTED_HEADER
+
+if TYPE_CHECKING:
+    from ..core.jwe import JWE
+
+# Signing keys and CompactSigners for sign and tokenize
+Signers = Tuple[KeySet, Optional[CompactSigner], Optional[CompactSigner]]
+
 
 
 class Error(Exception):
@@ -13,19 +25,61 @@ class Error(Exception):
 
 
 class JOSE:
+    """
+    Signs, verifies and encrypts with a fixed key set. Everything that does
+    not depend on the token is prepared once: the cryptography module, the
+    first installed when none is given, is selected on construction. The
+    HMAC context of a key is prepared when the key is first used. The
+    signing keys of an HMAC algorithm are found when it is first used to
+    sign. For an algorithm with a single signing key, the protected headers
+    are then encoded once in a CompactSigner for sign and one for tokenize.
+    Keys are not read on construction, so a lazily loaded key set stays
+    lazy. Passing key_set or key to sign bypasses all of this.
+    """
+
     def __init__(self, key_set: KeySet,
-                 crypto_module: CryptographyModule = None):
+                 crypto_module: CryptographyModule = None, *,
+                 algorithm: DigitalSignatureAlgorithm =
+                 DigitalSignatureAlgorithm.HS256,
+                 limits: VerificationLimits = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        if crypto_module is None:
+            crypto_module = load_cryptography_module()
+        cryptography_module = PreparedHmacCryptographyModule(crypto_module)
         self.__key_set = key_set
-        self.__cryptography_module = crypto_module
+        self.__cryptography_module = cryptography_module
+        self.__algorithm = algorithm
+        self.__jws = JWS(cryptography_module, limits)
+        self.__jwt = JWT(self.__jws, clock=clock)
+        self.__jwe = None
+        self.__protected_header = ProtectedHeader()
+        self.__signers: Dict[DigitalSignatureAlgorithm, Signers] = {}
 
-    def encrypt(self, plaintext: str,
+    def encrypt(self, plaintext: Union[str, bytes],
                 encryption_algorithm: ContentEncryptionAlgorithm,
                 *, algorithm: ContentEncryptionKeyAlgorithm = None,
-                compact_encoding=True):
-        pass
+                compact_encoding=True) -> str:
+        if algorithm is None:
+            raise ValueError("A key management algorithm is required!")
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode("utf-8")
+        serialization = Serialization.COMPACT if compact_encoding \
+            else Serialization.FLATTENED_JSON
+        jwe = self.__get_jwe().encrypt(self.__key_set, algorithm,
+                                       encryption_algorithm, plaintext,
+                                       serialization)
+        return jwe if isinstance(jwe, str) else json_dumps(jwe)
 
-    def decrypt(self, jwe, key_set: KeySet) -> bytes:
-        pass
+    def decrypt(self, jwe: str, key_set: KeySet = None) -> bytes:
+        key_set = self.__key_set if key_set is None else key_set
+        return self.__get_jwe().decrypt(key_set, jwe)
+
+    def __get_jwe(self) -> "JWE":
+        # Imported on first use so that signing never imports the JWE module
+        if self.__jwe is None:
+            from ..core.jwe import JWE
+            self.__jwe = JWE(self.__cryptography_module)
+        return self.__jwe
 
     def sign(self, payload: Union[str, bytes, bytearray],
              algorithm: DigitalSignatureAlgorithm = None, *,
@@ -34,20 +88,69 @@ class JOSE:
         if isinstance(payload, str):
             payload_bytes = payload.encode('utf-8')
         else:
-            payload_bytes = payload
+            payload_bytes = bytes(payload)
+        algorithm = self.__algorithm if algorithm is None else algorithm
 
         key_set = key_set if key is None else KeySet({key})
-        key_set = self.__key_set if key_set is None else key_set
-        signature = sign(key_set, algorithm, payload_bytes, serialization)
-        return signature
+        if key_set is not None:
+            signature = self.__jws.sign(key_set, algorithm, payload_bytes,
+                                        serialization)
+            return signature if isinstance(signature, str) \
+                else json_dumps(signature)
+        signing_key_set, compact_signer, _ = self.__get_signers(algorithm)
+        if serialization is Serialization.COMPACT \
+                and compact_signer is not None:
+            return compact_signer.sign(payload_bytes).decode("ascii")
+        output = bytearray()
+        self.__jws.sign_to(output, signing_key_set, algorithm, payload_bytes,
+                           serialization,
+                           protected_header=self.__protected_header)
+        return output.decode("utf-8")
+
+    def verify(self, jws: Union[str, bytes, bytearray]) -> bytes:
+        if isinstance(jws, bytearray):
+            jws = bytes(jws)
+        return self.__jws.verify(self.__key_set, jws)
 
-    def verify(self, jws: Union[str, bytes, bytearray]) -> Claims:
-        pass
+    def tokenize(self, claims: ClaimsSet,
+                 algorithm: DigitalSignatureAlgorithm = None) -> str:
+        algorithm = self.__algorithm if algorithm is None else algorithm
+        signing_key_set, _, jwt_signer = self.__get_signers(algorithm)
+        if jwt_signer is None:
+            return self.__jwt.create(signing_key_set, algorithm, claims,
+                                     Serialization.COMPACT)
+        payload = json_dumps(claims.to_dict()).encode("utf-8")
+        return jwt_signer.sign(payload).decode("ascii")
 
-    def tokenize(self, claims: Claims,
-                 algorithm: DigitalSignatureAlgorithm) -> str:
-        pass
+    def __get_signers(self, algorithm: DigitalSignatureAlgorithm) -> Signers:
+        """
+        Returns the signing keys of the algorithm and, when there is a single
+        signing key of an HMAC algorithm, the CompactSigner for sign and for
+        tokenize, finding them on first use of the algorithm
+        """
+        signers = self.__signers.get(algorithm)
+        if signers is None:
+            keys = get_signing_keys(self.__key_set, algorithm)
+            if len(keys) == 0:
+                raise ValueError("No valid signing keys found!")
+            signing_key_set = KeySet(keys)
+            if len(keys) == 1 and algorithm in HMAC_ALGORITHMS:
+                signers = (
+                    signing_key_set,
+                    self.__jws.compact_signer(signing_key_set, algorithm,
+                                              self.__protected_header),
+                    self.__jws.compact_signer(signing_key_set, algorithm,
+                                              JWT_PROTECTED_HEADER))
+            else:
+                signers = (signing_key_set, None, None)
+            self.__signers[algorithm] = signers
+        return signers
 
     # noinspection PyShadowingNames
-    def verify_token(self, jwt: Union[str, bytes, bytearray]) -> Claims:
-        pass
+    def verify_token(self, jwt: Union[str, bytes, bytearray],
+                     expected_claims_set: ClaimsSet = None,
+                     leeway_secs: int = 60) -> ClaimsSet:
+        if isinstance(jwt, bytearray):
+            jwt = bytes(jwt)
+        return self.__jwt.verify(self.__key_set, jwt, expected_claims_set,
+                                 leeway_secs)
@@ -0,0 +1,26 @@
+"""
+Submodules are imported when they are first accessed as attributes of this
+package, so importing elfose.jose.core only costs what is used. Python 3.6
+has no module __getattr__, so there every submodule is imported with the
+package.
+"""
+import sys
+from importlib import import_module
+
+SUBMODULES = ("cache", "cryptography", "encoding", "header", "jwa", "jwe",
+              "jwk", "jws", "jwt", "keystore", "replay")
+
+
+def __getattr__(name: str):
+    if name in SUBMODULES:
+        return import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(SUBMODULES))
+
+
+if sys.version_info < (3, 7):
+    for _submodule in SUBMODULES:
+        import_module(f"{__name__}.{_submodule}")
@@ -0,0 +1,307 @@
+import hashlib
+import os
+import struct
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+
+# Checksum, token digest, expires, key digest, payload offset and length,
+# algorithm, kid length and kid
+VERIFIED_SLOT = struct.Struct(">8s32sd32sII8sB64s")
+VERIFIED_CHECKSUM_LENGTH = 8
+VERIFIED_MAX_KID_LENGTH = 64
+VERIFIED_NO_KID = 255
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache. The cache holds at most max_size
+    entries, adding an entry to a full cache discards the entry that was
+    least recently read or written.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        if not isinstance(max_size, int) or max_size < 1:
+            raise ValueError("max_size must be a positive int")
+        self.__max_size = max_size
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            try:
+                value = self.__entries[key]
+            except KeyError:
+                return default
+            self.__entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            return self.__entries.pop(key, default)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.__lock:
+            return key in self.__entries
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
+
+
+class NegativeCache:
+    """
+    Bounded cache of digests of input that recently failed validation along
+    with the reason it failed. Entries expire ttl seconds after they are
+    added and the least recently used entry is discarded when the cache is
+    full, so a flood of distinct invalid input cannot grow it without limit.
+    Counters record hits, misses, additions and expirations.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.__entries = LRUCache(max_size)
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__additions = 0
+        self.__expirations = 0
+
+    @property
+    def ttl(self) -> float:
+        return self.__ttl
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def additions(self) -> int:
+        return self.__additions
+
+    @property
+    def expirations(self) -> int:
+        return self.__expirations
+
+    def get(self, digest: bytes) -> Optional[Any]:
+        """
+        Returns the reason recorded for the digest or None if the digest is
+        not in the cache or its entry has expired
+        """
+        entry = self.__entries.get(digest)
+        if entry is not None and entry[0] <= self.__clock():
+            self.__entries.pop(digest)
+            entry = None
+            with self.__lock:
+                self.__expirations += 1
+        with self.__lock:
+            if entry is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+        return entry[1]
+
+    def put(self, digest: bytes, reason: Any) -> None:
+        self.__entries.put(digest, (self.__clock() + self.__ttl, reason))
+        with self.__lock:
+            self.__additions += 1
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class VerifiedToken:
+    """
+    What SharedVerificationCache records about a verified JWS: the digest of
+    the key that verified it, the algorithm and kid of the signature and
+    where the encoded payload is within the serialized JWS
+    """
+
+    __slots__ = ("__key_digest", "__algorithm", "__kid", "__payload_offset",
+                 "__payload_length")
+
+    def __init__(self, key_digest: bytes, algorithm: str, kid: Optional[str],
+                 payload_offset: int, payload_length: int) -> None:
+        self.__key_digest = key_digest
+        self.__algorithm = algorithm
+        self.__kid = kid
+        self.__payload_offset = payload_offset
+        self.__payload_length = payload_length
+
+    @property
+    def key_digest(self) -> bytes:
+        return self.__key_digest
+
+    @property
+    def algorithm(self) -> str:
+        return self.__algorithm
+
+    @property
+    def kid(self) -> Optional[str]:
+        return self.__kid
+
+    @property
+    def payload_offset(self) -> int:
+        return self.__payload_offset
+
+    @property
+    def payload_length(self) -> int:
+        return self.__payload_length
+
+
+class SharedVerificationCache:
+    """
+    Cache of recently verified JWS digests in shared memory, so processes
+    forked after it is created, such as pre-fork web server workers, do not
+    each verify the same tokens. The table is a fixed number of buckets of
+    ways slots. Reads take no lock, every slot carries a checksum and a slot
+    being written while it is read fails the checksum and is a miss. Writers
+    lock one of locks stripes of buckets and replace the matching, an
+    expired or the soonest expiring slot of the bucket. Entries expire ttl
+    seconds after they are added. Requires Python 3.8 or later.
+    """
+
+    def __init__(self, *, slots: int = 65536, ways: int = 4,
+                 ttl: float = 300.0, locks: int = 16,
+                 clock: Callable[[], float] = time.time) -> None:
+        if slots < 1 or ways < 1 or slots % ways != 0 or locks < 1:
+            raise ValueError("slots and locks must be positive and slots a "
+                             "multiple of ways")
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        # shared_memory is only available from Python 3.8
+        from multiprocessing import Lock as ProcessLock
+        from multiprocessing.shared_memory import SharedMemory
+        self.__shared_memory = SharedMemory(create=True,
+                                            size=slots * VERIFIED_SLOT.size)
+        self.__memory = self.__shared_memory.buf
+        self.__buckets = slots // ways
+        self.__ways = ways
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__locks = [ProcessLock() for _ in range(locks)]
+        self.__owner = os.getpid()
+
+    @property
+    def size(self) -> int:
+        return self.__shared_memory.size
+
+    @property
+    def ttl(self) -> float:
+        return self.__ttl
+
+    def get(self, digest: bytes) -> Optional[VerifiedToken]:
+        """
+        Returns what was recorded for the digest or None if the digest is
+        not in the cache or its entry has expired
+        """
+        offset = self.__bucket_offset(digest)
+        now = self.__clock()
+        for way in range(self.__ways):
+            slot = self.__read(offset + way * VERIFIED_SLOT.size)
+            if slot is not None and slot[1] == digest and slot[2] > now:
+                _, _, _, key_digest, payload_offset, payload_length, \
+                    algorithm, kid_length, kid = slot
+                return VerifiedToken(
+                    key_digest, algorithm.rstrip(b"\0").decode("ascii"),
+                    None if kid_length == VERIFIED_NO_KID
+                    else kid[:kid_length].decode("utf-8"),
+                    payload_offset, payload_length)
+        return None
+
+    def put(self, digest: bytes, verified_token: VerifiedToken) -> None:
+        """
+        Records the verified token for the digest. Tokens with a kid longer
+        than 64 bytes once encoded are not recorded.
+        """
+        if verified_token.kid is None:
+            kid, kid_length = b"", VERIFIED_NO_KID
+        else:
+            kid = verified_token.kid.encode("utf-8")
+            kid_length = len(kid)
+            if kid_length > VERIFIED_MAX_KID_LENGTH:
+                return
+        now = self.__clock()
+        content = VERIFIED_SLOT.pack(
+            bytes(VERIFIED_CHECKSUM_LENGTH), digest, now + self.__ttl,
+            verified_token.key_digest, verified_token.payload_offset,
+            verified_token.payload_length,
+            verified_token.algorithm.encode("ascii"), kid_length,
+            kid)[VERIFIED_CHECKSUM_LENGTH:]
+        slot_bytes = _slot_checksum(content) + content
+
+        offset = self.__bucket_offset(digest)
+        bucket = offset // (VERIFIED_SLOT.size * self.__ways)
+        with self.__locks[bucket % len(self.__locks)]:
+            target, target_expires = None, None
+            for way in range(self.__ways):
+                start = offset + way * VERIFIED_SLOT.size
+                slot = self.__read(start)
+                if slot is None or slot[1] == digest or slot[2] <= now:
+                    target = start
+                    break
+                if target is None or slot[2] < target_expires:
+                    target, target_expires = start, slot[2]
+            self.__memory[target:target + VERIFIED_SLOT.size] = slot_bytes
+
+    def clear(self) -> None:
+        for lock in self.__locks:
+            lock.acquire()
+        try:
+            self.__memory[:] = bytes(len(self.__memory))
+        finally:
+            for lock in self.__locks:
+                lock.release()
+
+    def close(self) -> None:
+        """
+        Detaches the shared memory, which is also removed when called by the
+        process that created the cache
+        """
+        self.__memory.release()
+        self.__shared_memory.close()
+        if os.getpid() == self.__owner:
+            self.__shared_memory.unlink()
+
+    def __bucket_offset(self, digest: bytes) -> int:
+        bucket = int.from_bytes(digest[:8], "big") % self.__buckets
+        return bucket * self.__ways * VERIFIED_SLOT.size
+
+    def __read(self, start: int):
+        slot_bytes = bytes(self.__memory[start:start + VERIFIED_SLOT.size])
+        if slot_bytes[:VERIFIED_CHECKSUM_LENGTH] != _slot_checksum(
+                slot_bytes[VERIFIED_CHECKSUM_LENGTH:]):
+            return None
+        return VERIFIED_SLOT.unpack(slot_bytes)
+
+
+def _slot_checksum(content: bytes) -> bytes:
+    return hashlib.blake2b(content,
+                           digest_size=VERIFIED_CHECKSUM_LENGTH).digest()
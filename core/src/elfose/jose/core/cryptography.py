@@ -1,4 +1,18 @@
 from enum import auto, Enum
+from functools import lru_cache
+from hmac import compare_digest
+from importlib import import_module
+from importlib.util import find_spec
+from typing import Dict, List, Tuple
+
+from .cache import LRUCache
+
+ENTRY_POINT_GROUP = "elfose.jose.cryptography_modules"
+BUILT_IN_MODULES = {"native": "elfose.jose.native:CryptographyModule"}
+# Found by their package where entry points cannot be read
+KNOWN_MODULES = {
+    "pycryptodome": "elfose.jose.pycryptodome:CryptographyModule"}
+PREFERRED_MODULES = ("pycryptodome", "native")
 
 
 class HashingAlgorithm(Enum):
@@ -7,12 +21,286 @@ class HashingAlgorithm(Enum):
     SHA512 = auto()
 
 
+class EllipticCurve(Enum):
+    P256 = auto()
+    P384 = auto()
+    P521 = auto()
+
+
+class HmacContext:
+    """
+    Incremental HMAC calculation for messages that are too large, or arrive
+    in too many pieces, to be passed to hmac_digest in one call.
+    """
+
+    def update(self, message: bytes) -> None:
+        raise NotImplementedError
+
+    def digest(self) -> bytes:
+        raise NotImplementedError
+
+    def copy(self) -> "HmacContext":
+        """
+        Returns an independent context in the same state, a context updated
+        with nothing but the key can be prepared once and copied for each
+        message
+        """
+        raise NotImplementedError
+
+
+class CipherContext:
+    """
+    Incremental unauthenticated block cipher operation. Data passed to update
+    must be a multiple of the cipher block size, padding is the
+    responsibility of the caller.
+    """
+
+    def update(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class AuthenticatedEncryptionContext:
+    """
+    Incremental AEAD encryption. update returns the ciphertext for the
+    plaintext provided and finalize returns the authentication tag.
+    """
+
+    def update(self, plaintext: bytes) -> bytes:
+        raise NotImplementedError
+
+    def finalize(self) -> bytes:
+        raise NotImplementedError
+
+
+class AuthenticatedDecryptionContext:
+    """
+    Incremental AEAD decryption. update returns the plaintext for the
+    ciphertext provided and finalize raises ValueError if the authentication
+    tag does not match. Plaintext returned from update must not be trusted
+    until finalize has returned.
+    """
+
+    def update(self, ciphertext: bytes) -> bytes:
+        raise NotImplementedError
+
+    def finalize(self, tag: bytes) -> None:
+        raise NotImplementedError
+
+
 class CryptographyModule:
+    def digest(self, hashing_algorithm: HashingAlgorithm,
+               message: bytes) -> bytes:
+        raise NotImplementedError
+
     def hmac_digest(self, hashing_algorithm: HashingAlgorithm, key: bytes,
                     message: bytes) -> bytes:
         raise NotImplementedError
 
+    def hmac_digest_verify(self, hashing_algorithm: HashingAlgorithm,
+                           key: bytes, message: bytes, digest: bytes) -> bool:
+        raise NotImplementedError
+
+    def hmac_context(self, hashing_algorithm: HashingAlgorithm,
+                     key: bytes) -> HmacContext:
+        raise NotImplementedError
+
+    def random_bytes(self, length: int) -> bytes:
+        raise NotImplementedError
+
+    def pbkdf2_hmac(self, hashing_algorithm: HashingAlgorithm,
+                    password: bytes, salt: bytes, iterations: int,
+                    length: int) -> bytes:
+        raise NotImplementedError
+
+    def aes_cbc_encryptor(self, key: bytes, iv: bytes) -> CipherContext:
+        raise NotImplementedError
+
+    def aes_cbc_decryptor(self, key: bytes, iv: bytes) -> CipherContext:
+        raise NotImplementedError
+
+    def aes_gcm_encryptor(self, key: bytes, iv: bytes,
+                          aad: bytes) -> AuthenticatedEncryptionContext:
+        raise NotImplementedError
+
+    def aes_gcm_decryptor(self, key: bytes, iv: bytes,
+                          aad: bytes) -> AuthenticatedDecryptionContext:
+        raise NotImplementedError
+
+    def ec_generate_key_pair(
+            self, curve: EllipticCurve) -> Tuple[bytes, bytes, bytes]:
+        """
+        Returns the private key d and public key coordinates x and y as
+        big-endian octet strings the length of the curve field size
+        """
+        raise NotImplementedError
+
+    def ecdh_shared_secret(self, curve: EllipticCurve, d: bytes, x: bytes,
+                           y: bytes) -> bytes:
+        """
+        Returns the x coordinate of the shared point computed from the private
+        key d and the public key x, y. Raises ValueError if the public key is
+        not a point on the curve.
+        """
+        raise NotImplementedError
+
+    def aes_key_wrap(self, wrapping_key: bytes, key: bytes) -> bytes:
+        raise NotImplementedError
+
+    def aes_key_unwrap(self, wrapping_key: bytes,
+                       wrapped_key: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class PreparedHmacCryptographyModule(CryptographyModule):
+    """
+    Wraps a cryptography module keeping an HMAC context updated with nothing
+    but the key for each hashing algorithm and key, so that every HMAC
+    copies the prepared context rather than processing the key again. The
+    contexts of keys given to prepare are kept for the lifetime of the
+    module and those of other keys for the cache_size most recently used,
+    0 disables this cache. When the wrapped module does not implement
+    hmac_context, or its HmacContext does not support copy, hmac_digest is
+    passed to it instead. Other operations are passed to the wrapped module.
+    """
+
+    def __init__(self, cryptography_module: CryptographyModule,
+                 cache_size: int = 1024) -> None:
+        self.__cryptography_module = cryptography_module
+        self.__prepared: Dict[Tuple[HashingAlgorithm, bytes],
+                              HmacContext] = {}
+        self.__cache = LRUCache(cache_size) if cache_size else None
+        self.__hmac_contexts = True
+
+    def prepare(self, hashing_algorithm: HashingAlgorithm,
+                key: bytes) -> None:
+        self.__prepared[(hashing_algorithm, key)] = \
+            self.__cryptography_module.hmac_context(hashing_algorithm, key)
+
+    def hmac_context(self, hashing_algorithm: HashingAlgorithm,
+                     key: bytes) -> HmacContext:
+        prepared_key = (hashing_algorithm, key)
+        context = self.__prepared.get(prepared_key)
+        if context is None:
+            cache = self.__cache
+            if cache is None:
+                return self.__cryptography_module.hmac_context(
+                    hashing_algorithm, key)
+            context = cache.get(prepared_key)
+            if context is None:
+                context = self.__cryptography_module.hmac_context(
+                    hashing_algorithm, key)
+                cache.put(prepared_key, context)
+        return context.copy()
+
+    def hmac_digest(self, hashing_algorithm: HashingAlgorithm, key: bytes,
+                    message: bytes) -> bytes:
+        if self.__hmac_contexts:
+            try:
+                context = self.hmac_context(hashing_algorithm, key)
+            except NotImplementedError:
+                self.__hmac_contexts = False
+            else:
+                context.update(message)
+                return context.digest()
+        return self.__cryptography_module.hmac_digest(hashing_algorithm, key,
+                                                      message)
+
+    def hmac_digest_verify(self, hashing_algorithm: HashingAlgorithm,
+                           key: bytes, message: bytes, digest: bytes) -> bool:
+        return compare_digest(
+            self.hmac_digest(hashing_algorithm, key, message), digest)
+
+    def digest(self, hashing_algorithm: HashingAlgorithm,
+               message: bytes) -> bytes:
+        return self.__cryptography_module.digest(hashing_algorithm, message)
+
+    def random_bytes(self, length: int) -> bytes:
+        return self.__cryptography_module.random_bytes(length)
+
+    def pbkdf2_hmac(self, hashing_algorithm: HashingAlgorithm,
+                    password: bytes, salt: bytes, iterations: int,
+                    length: int) -> bytes:
+        return self.__cryptography_module.pbkdf2_hmac(
+            hashing_algorithm, password, salt, iterations, length)
+
+    def aes_cbc_encryptor(self, key: bytes, iv: bytes) -> CipherContext:
+        return self.__cryptography_module.aes_cbc_encryptor(key, iv)
+
+    def aes_cbc_decryptor(self, key: bytes, iv: bytes) -> CipherContext:
+        return self.__cryptography_module.aes_cbc_decryptor(key, iv)
+
+    def aes_gcm_encryptor(self, key: bytes, iv: bytes,
+                          aad: bytes) -> AuthenticatedEncryptionContext:
+        return self.__cryptography_module.aes_gcm_encryptor(key, iv, aad)
+
+    def aes_gcm_decryptor(self, key: bytes, iv: bytes,
+                          aad: bytes) -> AuthenticatedDecryptionContext:
+        return self.__cryptography_module.aes_gcm_decryptor(key, iv, aad)
+
+    def ec_generate_key_pair(
+            self, curve: EllipticCurve) -> Tuple[bytes, bytes, bytes]:
+        return self.__cryptography_module.ec_generate_key_pair(curve)
+
+    def ecdh_shared_secret(self, curve: EllipticCurve, d: bytes, x: bytes,
+                           y: bytes) -> bytes:
+        return self.__cryptography_module.ecdh_shared_secret(curve, d, x, y)
+
+    def aes_key_wrap(self, wrapping_key: bytes, key: bytes) -> bytes:
+        return self.__cryptography_module.aes_key_wrap(wrapping_key, key)
+
+    def aes_key_unwrap(self, wrapping_key: bytes,
+                       wrapped_key: bytes) -> bytes:
+        return self.__cryptography_module.aes_key_unwrap(wrapping_key,
+                                                         wrapped_key)
+
+
+def cryptography_module_names() -> List[str]:
+    """
+    Names of the installed CryptographyModule backends, registered as entry
+    points in the elfose.jose.cryptography_modules group. No backend is
+    imported.
+    """
+    return sorted(_cryptography_module_references())
+
+
+def load_cryptography_module(name: str = None) -> CryptographyModule:
+    """
+    Imports the named CryptographyModule backend and returns an instance of
+    it. Without a name, the first installed of pycryptodome and native is
+    used. Raises ValueError if no backend with the name is installed.
+    """
+    references = _cryptography_module_references()
+    if name is None:
+        name = next((preferred for preferred in PREFERRED_MODULES
+                     if preferred in references), None)
+    if name not in references:
+        raise ValueError(f"Cryptography module {name} is not installed!")
+    module_name, _, attribute = references[name].partition(":")
+    return getattr(import_module(module_name), attribute)()
+
 
-def hmac_digest_verify(self, hashing_algorithm: HashingAlgorithm,
-                       key: bytes, message: bytes, digest: bytes) -> bool:
-    raise NotImplementedError
+@lru_cache(maxsize=None)
+def _cryptography_module_references() -> Dict[str, str]:
+    """
+    Scanned once per process, the returned dict must not be modified
+    """
+    references = dict(BUILT_IN_MODULES)
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8 has no importlib.metadata
+        for name, reference in KNOWN_MODULES.items():
+            try:
+                installed = find_spec(reference.partition(":")[0]) is not None
+            except ImportError:
+                installed = False
+            if installed:
+                references[name] = reference
+        return references
+    entry_points_ = entry_points()
+    if hasattr(entry_points_, "select"):
+        group = entry_points_.select(group=ENTRY_POINT_GROUP)
+    else:
+        group = entry_points_.get(ENTRY_POINT_GROUP, ())
+    for entry_point in group:
+        references[entry_point.name] = entry_point.value
+    return references
@@ -1,8 +1,12 @@
+import binascii
+import codecs
 import json
-from base64 import b64encode, b64decode
-from typing import Union, Dict
+from base64 import b64encode, b64decode, urlsafe_b64encode
+from typing import Any, Union, Dict, Iterable, Iterator, Optional
 
 JSONDict = Dict[str, Union[str, bool, float, int, "JSONDict"]]
+BASE64_URL_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz" \
+                      b"0123456789-_"
 
 
 def base64_url_encode(unencoded: bytes) -> str:
@@ -14,6 +18,28 @@ def base64_url_encode(unencoded: bytes) -> str:
     return base64_encoded_str
 
 
+def base64_url_encode_bytes(unencoded: bytes) -> bytes:
+    """
+    Equivalent to base64_url_encode but returns ASCII bytes, avoiding the
+    str round trip for callers that write bytes
+    """
+    return urlsafe_b64encode(unencoded).rstrip(b"=")
+
+
+def is_base64_url(encoded: str) -> bool:
+    """
+    Returns True when encoded is non-empty and contains only base64url
+    characters. Runs at C speed, which keeps rejecting large malformed input
+    cheap compared to a regular expression.
+    """
+    try:
+        encoded_bytes = encoded.encode("ascii")
+    except UnicodeEncodeError:
+        return False
+    return len(encoded_bytes) > 0 \
+        and len(encoded_bytes.translate(None, BASE64_URL_ALPHABET)) == 0
+
+
 def base64_url_decode(encoded_bytes: str) -> bytes:
     encoded_bytes = encoded_bytes.encode("utf-8")
     padding = len(encoded_bytes) % 4
@@ -32,9 +58,260 @@ def base64_url_decode(encoded_bytes: str) -> bytes:
     return base64_decoded
 
 
+class FrozenDict(dict):
+    """
+    dict that cannot be modified. Being a dict it is serialized by json like
+    any other and compares equal to a dict with the same items.
+    """
+
+    def __immutable(self, *args, **kwargs):
+        raise TypeError("Frozen JSON values cannot be modified!")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+        update = __ior__ = __immutable
+
+    def __copy__(self) -> "FrozenDict":
+        return self
+
+    def __deepcopy__(self, memo) -> "FrozenDict":
+        return self
+
+
+class FrozenList(list):
+    """
+    list that cannot be modified
+    """
+
+    def __immutable(self, *args, **kwargs):
+        raise TypeError("Frozen JSON values cannot be modified!")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = clear = \
+        extend = insert = pop = remove = reverse = sort = __immutable
+
+    def __copy__(self) -> "FrozenList":
+        return self
+
+    def __deepcopy__(self, memo) -> "FrozenList":
+        return self
+
+
+def freeze(value: Any) -> Any:
+    """
+    Returns a JSON value in which every dict and list, however deeply
+    nested, is frozen
+    """
+    if isinstance(value, dict):
+        return FrozenDict((name, freeze(item))
+                          for name, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
 def json_dumps(data: JSONDict) -> str:
     return json.dumps(data, separators=(',', ':'))
 
 
 def json_loads(json_str: str) -> JSONDict:
     return json.loads(json_str)
+
+
+class Base64UrlEncoder:
+    """
+    Incremental base64url encoder. Input is encoded in multiples of three
+    bytes so that no padding is ever produced until finalize is called,
+    allowing arbitrarily large values to be encoded in fixed size chunks.
+    """
+
+    def __init__(self) -> None:
+        self.__remainder = b""
+
+    def update(self, unencoded: bytes) -> bytes:
+        if self.__remainder:
+            unencoded = self.__remainder + unencoded
+        usable = len(unencoded) - len(unencoded) % 3
+        self.__remainder = unencoded[usable:]
+        return urlsafe_b64encode(unencoded[:usable])
+
+    def finalize(self) -> bytes:
+        encoded = urlsafe_b64encode(self.__remainder).rstrip(b"=")
+        self.__remainder = b""
+        return encoded
+
+
+class Base64UrlDecoder:
+    """
+    Incremental base64url decoder. Input is decoded in multiples of four
+    characters, the remaining characters are decoded by finalize.
+    """
+
+    def __init__(self) -> None:
+        self.__remainder = b""
+
+    def update(self, encoded: bytes) -> bytes:
+        if self.__remainder:
+            encoded = self.__remainder + encoded
+        usable = len(encoded) - len(encoded) % 4
+        self.__remainder = encoded[usable:]
+        return self.__decode(encoded[:usable])
+
+    def finalize(self) -> bytes:
+        remainder = self.__remainder
+        self.__remainder = b""
+        padding = len(remainder) % 4
+        if padding == 1:
+            raise ValueError("Invalid base64url encoded string!")
+        elif padding:
+            remainder += b"=" * (4 - padding)
+        return self.__decode(remainder)
+
+    @staticmethod
+    def __decode(encoded: bytes) -> bytes:
+        if b"+" in encoded or b"/" in encoded:
+            raise ValueError("Invalid base64url encoded string!")
+        try:
+            return b64decode(encoded, altchars=b"-_", validate=True)
+        except binascii.Error:
+            raise ValueError("Invalid base64url encoded string!")
+
+
+class JSONObjectReader:
+    """
+    Incrementally reads the top level members of a JSON object from an
+    iterable of byte chunks, such as those read from a file object, or of
+    already decoded str chunks. Member
+    values may be parsed whole with read_value or, for long string values
+    without escape sequences such as base64url encoded data, be consumed in
+    chunks with iter_string so that they never need to be held in memory.
+    """
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]) -> None:
+        self.__chunks = iter(chunks)
+        self.__decoder = codecs.getincrementaldecoder("utf-8")()
+        self.__buffer = ""
+        self.__position = 0
+        self.__members = 0
+        self.__finished = False
+        self.__skip_whitespace()
+        if not self.__expect("{"):
+            raise ValueError("JSON object expected!")
+
+    def next_name(self, max_length: int = 1024) -> Optional[str]:
+        """
+        Returns the name of the next member, positioned to read its value,
+        or None when the end of the object has been reached.
+        """
+        if self.__finished:
+            return None
+        self.__skip_whitespace()
+        if self.__expect("}"):
+            self.__finished = True
+            return None
+        if self.__members > 0 and not self.__expect(","):
+            raise ValueError("Invalid JSON: expected , between members!")
+        self.__skip_whitespace()
+        name = self.read_value(max_length)
+        if not isinstance(name, str):
+            raise ValueError("Invalid JSON: member names must be strings!")
+        self.__skip_whitespace()
+        if not self.__expect(":"):
+            raise ValueError("Invalid JSON: expected : after member name!")
+        self.__members += 1
+        return name
+
+    def read_value(self, max_length: int = 65536) -> JSONDict:
+        """
+        Parses and returns the next value. Values longer than max_length
+        characters raise ValueError rather than being buffered.
+        """
+        self.__skip_whitespace()
+        while True:
+            # A string without its closing quote cannot be parsed yet
+            if self.__buffer.startswith("\"", self.__position) \
+                    and self.__buffer.find("\"", self.__position + 1) < 0:
+                self.__fill_value(max_length)
+                continue
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.__buffer,
+                                                      self.__position)
+            except json.JSONDecodeError:
+                self.__fill_value(max_length)
+                continue
+            # A number at the end of the buffer may continue in the next
+            # chunk
+            if end < len(self.__buffer) \
+                    or not isinstance(value, (int, float)) \
+                    or not self.__fill():
+                if end - self.__position > max_length:
+                    raise ValueError("Invalid JSON: value exceeds maximum "
+                                     "size!")
+                self.__position = end
+                return value
+
+    def iter_string(self) -> Iterator[str]:
+        """
+        Yields the content of the next string value in chunks. Escape
+        sequences are not supported and raise ValueError.
+        """
+        self.__skip_whitespace()
+        if not self.__expect("\""):
+            raise ValueError("Invalid JSON: string value expected!")
+        while True:
+            end = self.__buffer.find("\"", self.__position)
+            stop = len(self.__buffer) if end < 0 else end
+            if self.__buffer.find("\\", self.__position, stop) >= 0:
+                raise ValueError("Invalid JSON: escapes are not supported!")
+            if stop > self.__position:
+                yield self.__buffer[self.__position:stop]
+            if end >= 0:
+                self.__position = end + 1
+                return
+            self.__position = stop
+            if not self.__fill():
+                raise ValueError("Invalid JSON: unterminated string!")
+
+    def finish(self) -> None:
+        """
+        Raises ValueError unless only whitespace follows the end of the
+        object.
+        """
+        if not self.__finished:
+            raise ValueError("Invalid JSON: object not finished!")
+        self.__skip_whitespace()
+        if self.__position < len(self.__buffer):
+            raise ValueError("Invalid JSON: unexpected data after object!")
+
+    def __fill_value(self, max_length: int) -> None:
+        if len(self.__buffer) - self.__position > max_length:
+            raise ValueError("Invalid JSON: value exceeds maximum size!")
+        if not self.__fill():
+            raise ValueError("Invalid JSON: unable to parse value!")
+
+    def __fill(self) -> bool:
+        for chunk in self.__chunks:
+            text = chunk if isinstance(chunk, str) \
+                else self.__decoder.decode(chunk)
+            if text:
+                self.__buffer = self.__buffer[self.__position:] + text
+                self.__position = 0
+                return True
+        return False
+
+    def __skip_whitespace(self) -> None:
+        while True:
+            while self.__position < len(self.__buffer) \
+                    and self.__buffer[self.__position] in " \t\r\n":
+                self.__position += 1
+            if self.__position < len(self.__buffer) or not self.__fill():
+                return
+
+    def __expect(self, character: str) -> bool:
+        if self.__position >= len(self.__buffer) and not self.__fill():
+            return False
+        if self.__buffer[self.__position] == character:
+            self.__position += 1
+            return True
+        return False
+
+
+_JSON_DECODER = json.JSONDecoder()
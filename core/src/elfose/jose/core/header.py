@@ -0,0 +1,88 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator
+
+from .cache import LRUCache
+from .encoding import base64_url_encode, freeze, json_dumps
+from .jwa import Algorithm
+
+
+class Header(Mapping):
+    """
+    Immutable set of JOSE header parameters. Headers are hashable and equal
+    when their parameters serialize to the same JSON.
+    """
+
+    def __init__(self, parameters: Dict = None, **kwargs: Any) -> None:
+        merged = dict(parameters or {}, **kwargs)
+        self.__json = json_dumps(merged)
+        self.__parameters = freeze(merged)
+
+    @property
+    def parameters(self) -> Dict:
+        """
+        The parameters as an immutable dict, usable as the header member of
+        a JWS JSON Serialization without copying
+        """
+        return self.__parameters
+
+    @property
+    def json(self) -> str:
+        return self.__json
+
+    def __getitem__(self, name: str) -> Any:
+        return self.__parameters[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__parameters)
+
+    def __len__(self) -> int:
+        return len(self.__parameters)
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and other.json == self.__json
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.__json))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__json})"
+
+
+class UnprotectedHeader(Header):
+    pass
+
+
+ENCODED_CACHE_SIZE = 1024
+
+
+class ProtectedHeader(Header):
+    """
+    Protected header whose base64url encoding is memoized for each
+    combination of alg, kid and, for compact serializations, unprotected
+    header that it is combined with. Only the ENCODED_CACHE_SIZE most
+    recently used combinations are kept, as there may be a kid per tenant.
+    """
+
+    def __init__(self, parameters: Dict = None, **kwargs: Any) -> None:
+        super().__init__(parameters, **kwargs)
+        self.__encoded = LRUCache(ENCODED_CACHE_SIZE)
+
+    def encode(self, algorithm: Algorithm, kid: str = None,
+               unprotected_header: UnprotectedHeader = None) -> str:
+        """
+        Returns the base64url encoded JSON of alg, kid when not None, these
+        parameters, and the parameters of unprotected_header in that order,
+        which is the same as JWS.sign creates from dict headers
+        """
+        memo_key = (algorithm, kid, unprotected_header)
+        encoded = self.__encoded.get(memo_key)
+        if encoded is None:
+            header = {"alg": algorithm.value}
+            if kid is not None:
+                header["kid"] = kid
+            header.update(self.parameters)
+            if unprotected_header is not None:
+                header.update(unprotected_header.parameters)
+            encoded = base64_url_encode(json_dumps(header).encode())
+            self.__encoded.put(memo_key, encoded)
+        return encoded
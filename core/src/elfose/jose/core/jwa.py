@@ -85,3 +85,16 @@ class ContentEncryptionKeyAlgorithm(Algorithm):
     AES256GCMKW = "A256GCMKW"
 
     PBES2_HS256_A128KW = "PBES2-HS256+A128KW"
+    PBES2_HS384_A192KW = "PBES2-HS384+A192KW"
+    PBES2_HS512_A256KW = "PBES2-HS512+A256KW"
+
+
+class CompressionAlgorithm(Algorithm):
+    """
+    JWE uses compression algorithms to compress the plaintext before
+    encryption.
+
+    See https://tools.ietf.org/html/rfc7518#section-7.3 for more information
+    """
+
+    DEF = "DEF"
@@ -0,0 +1,1204 @@
+import os
+import struct
+import zlib
+from copy import deepcopy
+from functools import partial
+from hmac import compare_digest
+from itertools import chain, islice
+from json import JSONDecodeError
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, Iterator, List, \
+    Optional, Tuple, Union
+
+from .cache import LRUCache
+from .cryptography import CryptographyModule, EllipticCurve, \
+    HashingAlgorithm
+from .encoding import base64_url_encode, base64_url_decode, json_dumps, \
+    json_loads, Base64UrlEncoder, Base64UrlDecoder, JSONObjectReader
+from .jwa import CompressionAlgorithm, ContentEncryptionAlgorithm, \
+    ContentEncryptionKeyAlgorithm
+from .jwk import Curve, Key, KeySet, KeyType, get_encrypting_keys, \
+    get_decrypting_keys, get_deriving_keys, get_wrapping_keys, \
+    get_unwrapping_keys
+from .jws import DEFAULT_CHUNK_SIZE, Serialization
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+MAX_HEADER_LENGTH = 65536
+MAX_DECOMPRESSED_LENGTH = 64 * 1024 * 1024
+MAX_RECIPIENTS = 16
+
+Recipient = Tuple[Dict, str]
+
+AES_BLOCK_SIZE = 16
+
+PBES2_DEFAULT_ITERATIONS = 100000
+PBES2_MIN_ITERATIONS = 1000
+PBES2_MAX_ITERATIONS = 310000
+PBES2_SALT_LENGTH = 16
+
+ECDH_ES_ALGORITHMS = (ContentEncryptionKeyAlgorithm.ECDH_ES,
+                      ContentEncryptionKeyAlgorithm.ECDH_ES_A128KW,
+                      ContentEncryptionKeyAlgorithm.ECDH_ES_A192KW,
+                      ContentEncryptionKeyAlgorithm.ECDH_ES_A256KW)
+
+
+def get_content_encryption_parameters(
+        encryption: ContentEncryptionAlgorithm
+) -> Tuple[int, int, Optional[HashingAlgorithm]]:
+    """
+    Returns the content encryption key length, initialization vector length
+    and, for AES-CBC-HMAC algorithms, the HMAC hashing algorithm.
+    """
+    if encryption is ContentEncryptionAlgorithm.A128CBC_HS256:
+        return 32, 16, HashingAlgorithm.SHA256
+    elif encryption is ContentEncryptionAlgorithm.A192CBC_HS384:
+        return 48, 16, HashingAlgorithm.SHA384
+    elif encryption is ContentEncryptionAlgorithm.A256CBC_HS512:
+        return 64, 16, HashingAlgorithm.SHA512
+    elif encryption is ContentEncryptionAlgorithm.A128GCM:
+        return 16, 12, None
+    elif encryption is ContentEncryptionAlgorithm.A192GCM:
+        return 24, 12, None
+    elif encryption is ContentEncryptionAlgorithm.A256GCM:
+        return 32, 12, None
+    else:
+        raise NotImplementedError(
+            "The content encryption algorithm is not supported!")
+
+
+def get_key_wrap_key_length(algorithm: ContentEncryptionKeyAlgorithm) -> int:
+    if algorithm is ContentEncryptionKeyAlgorithm.A128KW:
+        return 16
+    elif algorithm is ContentEncryptionKeyAlgorithm.A192KW:
+        return 24
+    elif algorithm is ContentEncryptionKeyAlgorithm.A256KW:
+        return 32
+    else:
+        raise NotImplementedError(
+            "The key management algorithm is not supported!")
+
+
+def get_pbes2_parameters(
+        algorithm: ContentEncryptionKeyAlgorithm
+) -> Tuple[HashingAlgorithm, int]:
+    """
+    Returns the PBKDF2 hashing algorithm and derived key length
+    """
+    if algorithm is ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW:
+        return HashingAlgorithm.SHA256, 16
+    elif algorithm is ContentEncryptionKeyAlgorithm.PBES2_HS384_A192KW:
+        return HashingAlgorithm.SHA384, 24
+    elif algorithm is ContentEncryptionKeyAlgorithm.PBES2_HS512_A256KW:
+        return HashingAlgorithm.SHA512, 32
+    else:
+        raise NotImplementedError(
+            "The key management algorithm is not supported!")
+
+
+def get_elliptic_curve(crv: Curve) -> EllipticCurve:
+    if crv is Curve.P_256:
+        return EllipticCurve.P256
+    elif crv is Curve.P_384:
+        return EllipticCurve.P384
+    elif crv is Curve.P_521:
+        return EllipticCurve.P521
+    else:
+        raise ValueError("Invalid or missing curve!")
+
+
+def concat_kdf(cryptography_module: CryptographyModule, shared_secret: bytes,
+               algorithm_id: str, party_u_info: bytes, party_v_info: bytes,
+               key_length: int) -> bytes:
+    """
+    Concat KDF as profiled for ECDH-ES in
+    https://tools.ietf.org/html/rfc7518#section-4.6.2
+    """
+    algorithm_id_bytes = algorithm_id.encode()
+    other_info = struct.pack(">I", len(algorithm_id_bytes)) \
+        + algorithm_id_bytes \
+        + struct.pack(">I", len(party_u_info)) + party_u_info \
+        + struct.pack(">I", len(party_v_info)) + party_v_info \
+        + struct.pack(">I", key_length * 8)
+    derived = b""
+    counter = 1
+    while len(derived) < key_length:
+        derived += cryptography_module.digest(
+            HashingAlgorithm.SHA256,
+            struct.pack(">I", counter) + shared_secret + other_info)
+        counter += 1
+    return derived[:key_length]
+
+
+class EphemeralKeyPool:
+    """
+    Pre-generated ephemeral EC key pairs for ECDH-ES encryption. Background
+    threads keep up to size key pairs ready for each curve so that encryption
+    does not wait on key generation under steady load. Every key pair is
+    handed out exactly once, when none are ready one is generated in the
+    calling thread. Key pairs generated before a fork are never handed out
+    by the child process.
+    """
+
+    REFILL_POLL_SECONDS = 1.0
+
+    def __init__(self, cryptography_module: CryptographyModule,
+                 curves: Iterable[Curve] = (Curve.P_256,), size: int = 32,
+                 threads: int = 1) -> None:
+        if not isinstance(size, int) or size < 1:
+            raise ValueError("size must be a positive int")
+        if not isinstance(threads, int) or threads < 1:
+            raise ValueError("threads must be a positive int")
+        self.__cryptography_module = cryptography_module
+        self.__curves = tuple(curves)
+        for curve in self.__curves:
+            get_elliptic_curve(curve)
+        self.__size = size
+        self.__threads = threads
+        self.__closed = Event()
+        self.__lock = Lock()
+        self.__start()
+
+    def __start(self) -> None:
+        self.__pid = os.getpid()
+        self.__queues: Dict[Curve, Queue] = {
+            curve: Queue(self.__size) for curve in self.__curves}
+        self.__workers: List[Thread] = []
+        for curve in self.__curves:
+            for _ in range(self.__threads):
+                worker = Thread(target=self.__refill,
+                                args=(curve, self.__queues[curve]),
+                                name=f"EphemeralKeyPool-{curve.value}",
+                                daemon=True)
+                worker.start()
+                self.__workers.append(worker)
+
+    def __refill(self, curve: Curve, queue: Queue) -> None:
+        elliptic_curve = get_elliptic_curve(curve)
+        pid = self.__pid
+        while not self.__closed.is_set() and pid == os.getpid():
+            key_pair = self.__cryptography_module.ec_generate_key_pair(
+                elliptic_curve)
+            while not self.__closed.is_set():
+                try:
+                    queue.put(key_pair, timeout=self.REFILL_POLL_SECONDS)
+                    break
+                except Full:
+                    continue
+
+    def get(self, curve: Curve) -> Tuple[bytes, bytes, bytes]:
+        """
+        Returns an unused ephemeral key pair as d, x and y
+        """
+        if self.__pid != os.getpid():
+            with self.__lock:
+                if self.__pid != os.getpid():
+                    self.__start()
+        queue = self.__queues.get(curve)
+        if queue is not None and not self.__closed.is_set():
+            try:
+                return queue.get_nowait()
+            except Empty:
+                pass
+        return self.__cryptography_module.ec_generate_key_pair(
+            get_elliptic_curve(curve))
+
+    def available(self, curve: Curve) -> int:
+        queue = self.__queues.get(curve)
+        return 0 if queue is None else queue.qsize()
+
+    def close(self) -> None:
+        self.__closed.set()
+        for queue in self.__queues.values():
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+        for worker in self.__workers:
+            worker.join()
+
+    def __enter__(self) -> "EphemeralKeyPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class Decompressor:
+    """
+    Incrementally inflates DEF compressed plaintext. Output is produced in
+    chunks of at most chunk_size bytes and ValueError is raised as soon as
+    more than max_length bytes have been produced so that a small token
+    cannot expand without bound.
+    """
+
+    def __init__(self, max_length: Optional[int],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.__max_length = max_length
+        self.__chunk_size = chunk_size
+        self.__length = 0
+
+    def update(self, compressed: bytes) -> Iterator[bytes]:
+        while compressed:
+            try:
+                plaintext = self.__decompressor.decompress(compressed,
+                                                           self.__chunk_size)
+            except zlib.error:
+                raise ValueError("Invalid JWE: Unable to decompress "
+                                 "plaintext!")
+            self.__count(plaintext)
+            if plaintext:
+                yield plaintext
+            compressed = self.__decompressor.unconsumed_tail
+
+    def finalize(self) -> bytes:
+        plaintext = self.__decompressor.flush()
+        self.__count(plaintext)
+        if not self.__decompressor.eof:
+            raise ValueError("Invalid JWE: Compressed plaintext is "
+                             "incomplete!")
+        return plaintext
+
+    def __count(self, plaintext: bytes) -> None:
+        self.__length += len(plaintext)
+        if self.__max_length is not None \
+                and self.__length > self.__max_length:
+            raise ValueError("Invalid JWE: Decompressed plaintext exceeds "
+                             "maximum size!")
+
+
+class _PlaintextWriter:
+    """
+    Writes decrypted plaintext to a file object, decompressing it first when
+    a decompressor is provided
+    """
+
+    def __init__(self, output: BinaryIO,
+                 decompressor: Optional[Decompressor]) -> None:
+        self.__output = output
+        self.__decompressor = decompressor
+
+    def write(self, plaintext: bytes) -> None:
+        if self.__decompressor is None:
+            if plaintext:
+                self.__output.write(plaintext)
+        else:
+            for chunk in self.__decompressor.update(plaintext):
+                self.__output.write(chunk)
+
+    def close(self) -> None:
+        if self.__decompressor is not None:
+            self.__output.write(self.__decompressor.finalize())
+
+
+class ContentEncryptor:
+    """
+    Incrementally encrypts plaintext with one of the JWE content encryption
+    algorithms. update returns ciphertext as it becomes available and
+    finalize returns the remaining ciphertext and the authentication tag.
+    """
+
+    def __init__(self, cryptography_module: CryptographyModule,
+                 encryption: ContentEncryptionAlgorithm, key: bytes,
+                 iv: bytes, aad: bytes) -> None:
+        key_length, _, hashing_algorithm = \
+            get_content_encryption_parameters(encryption)
+        if len(key) != key_length:
+            raise ValueError("Invalid content encryption key length!")
+        self.__hashing_algorithm = hashing_algorithm
+        if hashing_algorithm is None:
+            self.__cipher = cryptography_module.aes_gcm_encryptor(
+                key, iv, aad)
+        else:
+            self.__tag_length = key_length // 2
+            self.__cipher = cryptography_module.aes_cbc_encryptor(
+                key[self.__tag_length:], iv)
+            self.__hmac = cryptography_module.hmac_context(
+                hashing_algorithm, key[:self.__tag_length])
+            self.__hmac.update(aad)
+            self.__hmac.update(iv)
+            self.__aad_bits = len(aad) * 8
+            self.__buffer = b""
+
+    def update(self, plaintext: bytes) -> bytes:
+        if self.__hashing_algorithm is None:
+            return self.__cipher.update(plaintext)
+        if self.__buffer:
+            plaintext = self.__buffer + plaintext
+        usable = len(plaintext) - len(plaintext) % AES_BLOCK_SIZE
+        self.__buffer = plaintext[usable:]
+        if usable == 0:
+            return b""
+        ciphertext = self.__cipher.update(plaintext[:usable])
+        self.__hmac.update(ciphertext)
+        return ciphertext
+
+    def finalize(self) -> Tuple[bytes, bytes]:
+        if self.__hashing_algorithm is None:
+            return b"", self.__cipher.finalize()
+        padding = AES_BLOCK_SIZE - len(self.__buffer)
+        ciphertext = self.__cipher.update(
+            self.__buffer + bytes([padding]) * padding)
+        self.__buffer = b""
+        self.__hmac.update(ciphertext)
+        self.__hmac.update(struct.pack(">Q", self.__aad_bits))
+        tag = self.__hmac.digest()[:self.__tag_length]
+        return ciphertext, tag
+
+
+class ContentDecryptor:
+    """
+    Incrementally decrypts ciphertext with one of the JWE content encryption
+    algorithms. Plaintext returned by update must be discarded if finalize
+    raises ValueError as the authentication tag is only verified once all of
+    the ciphertext has been processed.
+    """
+
+    def __init__(self, cryptography_module: CryptographyModule,
+                 encryption: ContentEncryptionAlgorithm, key: bytes,
+                 iv: bytes, aad: bytes) -> None:
+        key_length, iv_length, hashing_algorithm = \
+            get_content_encryption_parameters(encryption)
+        if len(key) != key_length:
+            raise ValueError("Invalid content encryption key length!")
+        if len(iv) != iv_length:
+            raise ValueError("Invalid JWE: Invalid initialization vector!")
+        self.__hashing_algorithm = hashing_algorithm
+        if hashing_algorithm is None:
+            self.__cipher = cryptography_module.aes_gcm_decryptor(
+                key, iv, aad)
+        else:
+            self.__tag_length = key_length // 2
+            self.__cipher = cryptography_module.aes_cbc_decryptor(
+                key[self.__tag_length:], iv)
+            self.__hmac = cryptography_module.hmac_context(
+                hashing_algorithm, key[:self.__tag_length])
+            self.__hmac.update(aad)
+            self.__hmac.update(iv)
+            self.__aad_bits = len(aad) * 8
+            self.__buffer = b""
+
+    def update(self, ciphertext: bytes) -> bytes:
+        if self.__hashing_algorithm is None:
+            return self.__cipher.update(ciphertext)
+        self.__hmac.update(ciphertext)
+        if self.__buffer:
+            ciphertext = self.__buffer + ciphertext
+        usable = len(ciphertext) - len(ciphertext) % AES_BLOCK_SIZE
+        # The last block is held back so its padding can be removed
+        if usable == len(ciphertext):
+            usable -= AES_BLOCK_SIZE
+        if usable <= 0:
+            self.__buffer = ciphertext
+            return b""
+        self.__buffer = ciphertext[usable:]
+        return self.__cipher.update(ciphertext[:usable])
+
+    def finalize(self, tag: bytes) -> bytes:
+        if self.__hashing_algorithm is None:
+            try:
+                self.__cipher.finalize(tag)
+            except ValueError:
+                raise ValueError("Invalid JWE: Could not authenticate "
+                                 "ciphertext!")
+            return b""
+        self.__hmac.update(struct.pack(">Q", self.__aad_bits))
+        expected = self.__hmac.digest()[:self.__tag_length]
+        if not compare_digest(expected, tag):
+            raise ValueError("Invalid JWE: Could not authenticate "
+                             "ciphertext!")
+        if len(self.__buffer) != AES_BLOCK_SIZE:
+            raise ValueError("Invalid JWE: Invalid ciphertext length!")
+        padded = self.__cipher.update(self.__buffer)
+        self.__buffer = b""
+        padding = padded[-1]
+        if padding < 1 or padding > AES_BLOCK_SIZE \
+                or padded[-padding:] != bytes([padding]) * padding:
+            raise ValueError("Invalid JWE: Invalid padding!")
+        return padded[:-padding]
+
+
+class _CompactReader:
+    """
+    Reads the period separated segments of a JWE Compact Serialization from
+    an iterable of byte chunks.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.__chunks = chunks
+        self.__buffer = b""
+
+    def read_segment(self, max_length: int) -> str:
+        while True:
+            index = self.__buffer.find(b".")
+            if index >= 0:
+                segment = self.__buffer[:index]
+                self.__buffer = self.__buffer[index + 1:]
+                break
+            if len(self.__buffer) > max_length:
+                raise ValueError("Invalid JWE: Segment exceeds maximum size!")
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                raise ValueError("Unable to properly parse JWE")
+            self.__buffer += chunk
+        if len(segment) > max_length:
+            raise ValueError("Invalid JWE: Segment exceeds maximum size!")
+        return segment.strip().decode("ascii")
+
+    def iter_segment(self) -> Iterator[bytes]:
+        while True:
+            index = self.__buffer.find(b".")
+            if index >= 0:
+                yield self.__buffer[:index]
+                self.__buffer = self.__buffer[index + 1:]
+                return
+            if self.__buffer:
+                yield self.__buffer
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                raise ValueError("Unable to properly parse JWE")
+            self.__buffer = chunk
+
+    def read_remaining(self, max_length: int) -> str:
+        for chunk in self.__chunks:
+            self.__buffer += chunk
+            if len(self.__buffer) > max_length:
+                raise ValueError("Invalid JWE: Segment exceeds maximum size!")
+        remaining = self.__buffer.strip()
+        self.__buffer = b""
+        if b"." in remaining:
+            raise ValueError("Unable to properly parse JWE")
+        return remaining.decode("ascii")
+
+
+class JWE:
+
+    def __init__(self, cryptography_module: CryptographyModule, *,
+                 pbes2_iterations: int = PBES2_DEFAULT_ITERATIONS,
+                 pbes2_min_iterations: int = PBES2_MIN_ITERATIONS,
+                 pbes2_max_iterations: int = PBES2_MAX_ITERATIONS,
+                 pbes2_key_cache: LRUCache = None,
+                 pbes2_executor: "Executor" = None,
+                 ephemeral_key_pool: EphemeralKeyPool = None,
+                 max_decompressed_length: Optional[int] =
+                 MAX_DECOMPRESSED_LENGTH,
+                 max_recipients: int = MAX_RECIPIENTS) -> None:
+        """
+        PBES2 key derivation is deliberately expensive. The iteration count
+        used when encrypting is pbes2_iterations, decryption rejects any p2c
+        header outside of pbes2_min_iterations and pbes2_max_iterations to
+        bound the cost of hostile input. Derived keys are stored in
+        pbes2_key_cache, when provided, so that tokens sharing a password,
+        p2s and p2c are only derived once. When pbes2_executor is provided,
+        such as a ProcessPoolExecutor, derivation runs in the executor rather
+        than in the calling thread. ECDH-ES ephemeral keys are taken from
+        ephemeral_key_pool, when provided, rather than generated per message.
+        Compressed plaintext that inflates beyond max_decompressed_length
+        bytes is rejected, None removes the limit. JSON serialized JWEs with
+        more than max_recipients recipients are rejected before any key is
+        derived as each recipient may require a PBES2 derivation.
+        """
+        if not pbes2_min_iterations <= pbes2_iterations \
+                <= pbes2_max_iterations:
+            raise ValueError("pbes2_iterations must be between "
+                             "pbes2_min_iterations and pbes2_max_iterations")
+        self.__cryptography_module = cryptography_module
+        self.__pbes2_iterations = pbes2_iterations
+        self.__pbes2_min_iterations = pbes2_min_iterations
+        self.__pbes2_max_iterations = pbes2_max_iterations
+        self.__pbes2_key_cache = pbes2_key_cache
+        self.__pbes2_executor = pbes2_executor
+        self.__pbes2_identity_key = None
+        self.__pbes2_pending: Dict[Tuple, "Future"] = {}
+        self.__pbes2_lock = Lock()
+        self.__ephemeral_key_pool = ephemeral_key_pool
+        self.__max_decompressed_length = max_decompressed_length
+        self.__max_recipients = max_recipients
+
+    def encrypt(self, key_set: KeySet,
+                algorithm: ContentEncryptionKeyAlgorithm,
+                encryption: ContentEncryptionAlgorithm,
+                plaintext: bytes,
+                serialization: Serialization = Serialization.FLATTENED_JSON,
+                unprotected_header: Dict = None,
+                protected_header: Dict = None,
+                compression: CompressionAlgorithm = None
+                ) -> Union[str, Dict]:
+        protected_encoded, unprotected, recipients, cek, iv = \
+            self.__prepare_encryption(key_set, algorithm, encryption,
+                                      serialization, unprotected_header,
+                                      protected_header, compression)
+        encryptor = ContentEncryptor(self.__cryptography_module, encryption,
+                                     cek, iv, protected_encoded.encode())
+        compressor = self.__get_compressor(compression)
+        if compressor is not None:
+            plaintext = compressor.compress(plaintext) + compressor.flush()
+        ciphertext = encryptor.update(plaintext)
+        final_ciphertext, tag = encryptor.finalize()
+        ciphertext_encoded = base64_url_encode(ciphertext + final_ciphertext)
+        tag_encoded = base64_url_encode(tag)
+        iv_encoded = base64_url_encode(iv)
+
+        if serialization is Serialization.COMPACT:
+            return ".".join((protected_encoded, recipients[0][1], iv_encoded,
+                             ciphertext_encoded, tag_encoded))
+        jwe = self.__get_json_head(serialization, protected_encoded,
+                                   unprotected, recipients, iv_encoded)
+        jwe["ciphertext"] = ciphertext_encoded
+        jwe["tag"] = tag_encoded
+        return jwe
+
+    def encrypt_stream(self, key_set: KeySet,
+                       algorithm: ContentEncryptionKeyAlgorithm,
+                       encryption: ContentEncryptionAlgorithm,
+                       plaintext: BinaryIO, output: BinaryIO,
+                       serialization: Serialization =
+                       Serialization.FLATTENED_JSON,
+                       unprotected_header: Dict = None,
+                       protected_header: Dict = None,
+                       compression: CompressionAlgorithm = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """
+        Encrypts the plaintext file object in chunks of chunk_size bytes and
+        writes the serialized JWE to the output file object as it is
+        produced so that memory use is independent of the plaintext size.
+        """
+        protected_encoded, unprotected, recipients, cek, iv = \
+            self.__prepare_encryption(key_set, algorithm, encryption,
+                                      serialization, unprotected_header,
+                                      protected_header, compression)
+        encryptor = ContentEncryptor(self.__cryptography_module, encryption,
+                                     cek, iv, protected_encoded.encode())
+        iv_encoded = base64_url_encode(iv)
+
+        if serialization is Serialization.COMPACT:
+            output.write(".".join((protected_encoded, recipients[0][1],
+                                   iv_encoded, "")).encode())
+        else:
+            head = self.__get_json_head(serialization, protected_encoded,
+                                        unprotected, recipients, iv_encoded)
+            output.write(json_dumps(head)[:-1].encode())
+            output.write(b",\"ciphertext\":\"")
+
+        encoder = Base64UrlEncoder()
+        compressor = self.__get_compressor(compression)
+        for chunk in iter(partial(plaintext.read, chunk_size), b""):
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            output.write(encoder.update(encryptor.update(chunk)))
+        if compressor is not None:
+            output.write(encoder.update(encryptor.update(compressor.flush())))
+        final_ciphertext, tag = encryptor.finalize()
+        output.write(encoder.update(final_ciphertext))
+        output.write(encoder.finalize())
+
+        tag_encoded = base64_url_encode(tag).encode()
+        if serialization is Serialization.COMPACT:
+            output.write(b"." + tag_encoded)
+        else:
+            output.write(b"\",\"tag\":\"" + tag_encoded + b"\"}")
+
+    def decrypt(self, key_set: KeySet, jwe: str) -> bytes:
+        _, plaintext = self.decrypt_with_header(key_set, jwe)
+        return plaintext
+
+    def decrypt_with_header(self, key_set: KeySet,
+                            jwe: str) -> Tuple[Dict, bytes]:
+        """
+        Decrypts like decrypt but also returns the decoded JWE Protected
+        Header so callers can act on integrity protected parameters such as
+        cty without parsing the JWE a second time.
+        """
+        if jwe.lstrip()[:1] == "{":
+            try:
+                jwe_obj = json_loads(jwe)
+            except JSONDecodeError:
+                raise ValueError("Unable to properly parse JWE")
+            protected_encoded, unprotected, recipients, iv_encoded, \
+                aad_encoded = self.__get_json_components(jwe_obj)
+            ciphertext_encoded = jwe_obj.get("ciphertext")
+            tag_encoded = jwe_obj.get("tag")
+            if not isinstance(ciphertext_encoded, str) \
+                    or not isinstance(tag_encoded, str):
+                raise ValueError("Unable to properly parse JWE")
+        else:
+            segments = jwe.split(".")
+            if len(segments) != 5:
+                raise ValueError("Unable to properly parse JWE")
+            protected_encoded, encrypted_key_encoded, iv_encoded, \
+                ciphertext_encoded, tag_encoded = segments
+            unprotected = {}
+            recipients = [({}, encrypted_key_encoded)]
+            aad_encoded = None
+
+        protected = self.__decode_protected_header(protected_encoded)
+        compression = self.__get_compression(protected, unprotected,
+                                             recipients)
+        iv = base64_url_decode(iv_encoded)
+        aad = self.__get_aad(protected_encoded, aad_encoded)
+        ciphertext = base64_url_decode(ciphertext_encoded)
+        tag = base64_url_decode(tag_encoded)
+        for encryption, cek in self.__get_content_encryption_keys(
+                key_set, protected, unprotected, recipients):
+            try:
+                decryptor = ContentDecryptor(self.__cryptography_module,
+                                             encryption, cek, iv, aad)
+                plaintext = decryptor.update(ciphertext)
+                plaintext += decryptor.finalize(tag)
+            except ValueError:
+                continue
+            if compression is None:
+                return protected, plaintext
+            # Only authenticated plaintext is decompressed
+            decompressor = Decompressor(self.__max_decompressed_length)
+            return protected, b"".join(decompressor.update(plaintext)) \
+                + decompressor.finalize()
+        raise ValueError("Invalid JWE: Could not decrypt content!")
+
+    def decrypt_stream(self, key_set: KeySet, jwe: BinaryIO,
+                       output: BinaryIO,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """
+        Decrypts the JWE read from the jwe file object in chunks of
+        chunk_size bytes, writing plaintext to the output file object as it
+        is produced. The authentication tag can only be verified after all of
+        the ciphertext has been read, if ValueError is raised anything
+        already written to output must be discarded.
+        """
+        chunks = iter(partial(jwe.read, chunk_size), b"")
+        first = next(chunks, b"")
+        chunks = chain([first], chunks)
+        if first.lstrip()[:1] == b"{":
+            self.__decrypt_json_stream(key_set, chunks, output)
+        else:
+            self.__decrypt_compact_stream(key_set, chunks, output)
+
+    def __decrypt_compact_stream(self, key_set: KeySet,
+                                 chunks: Iterator[bytes],
+                                 output: BinaryIO) -> None:
+        reader = _CompactReader(chunks)
+        protected_encoded = reader.read_segment(MAX_HEADER_LENGTH)
+        encrypted_key_encoded = reader.read_segment(MAX_HEADER_LENGTH)
+        iv_encoded = reader.read_segment(MAX_HEADER_LENGTH)
+        decryptor, writer = self.__get_stream_decryptor(
+            key_set, protected_encoded, {}, [({}, encrypted_key_encoded)],
+            iv_encoded, None, output)
+        decoder = Base64UrlDecoder()
+        for segment in reader.iter_segment():
+            writer.write(decryptor.update(decoder.update(segment)))
+        writer.write(decryptor.update(decoder.finalize()))
+        tag = base64_url_decode(reader.read_remaining(MAX_HEADER_LENGTH))
+        writer.write(decryptor.finalize(tag))
+        writer.close()
+
+    def __decrypt_json_stream(self, key_set: KeySet, chunks: Iterable[bytes],
+                              output: BinaryIO) -> None:
+        reader = JSONObjectReader(chunks)
+        members = {}
+        decryptor = writer = None
+        tag_encoded = None
+        name = reader.next_name()
+        while name is not None:
+            if name == "ciphertext" and decryptor is None:
+                protected_encoded, unprotected, recipients, iv_encoded, \
+                    aad_encoded = self.__get_json_components(members)
+                decryptor, writer = self.__get_stream_decryptor(
+                    key_set, protected_encoded, unprotected, recipients,
+                    iv_encoded, aad_encoded, output)
+                decoder = Base64UrlDecoder()
+                for part in reader.iter_string():
+                    writer.write(decryptor.update(
+                        decoder.update(part.encode("ascii"))))
+                writer.write(decryptor.update(decoder.finalize()))
+            elif name == "tag" and tag_encoded is None:
+                tag_encoded = reader.read_value(MAX_HEADER_LENGTH)
+            elif decryptor is not None or name in members:
+                raise ValueError("Invalid JWE: Members required for "
+                                 "decryption must precede the ciphertext!")
+            else:
+                members[name] = reader.read_value(MAX_HEADER_LENGTH)
+            name = reader.next_name()
+        if decryptor is None or not isinstance(tag_encoded, str):
+            raise ValueError("Unable to properly parse JWE")
+        writer.write(decryptor.finalize(base64_url_decode(tag_encoded)))
+        writer.close()
+
+    def __get_stream_decryptor(self, key_set: KeySet, protected_encoded: str,
+                               unprotected: Dict,
+                               recipients: List[Recipient], iv_encoded: str,
+                               aad_encoded: Optional[str], output: BinaryIO
+                               ) -> Tuple[ContentDecryptor, _PlaintextWriter]:
+        protected = self.__decode_protected_header(protected_encoded)
+        if self.__get_compression(protected, unprotected,
+                                  recipients) is None:
+            writer = _PlaintextWriter(output, None)
+        else:
+            writer = _PlaintextWriter(
+                output, Decompressor(self.__max_decompressed_length))
+        # A single pass over the ciphertext leaves no opportunity to try
+        # more than one content encryption key
+        candidates = list(islice(self.__get_content_encryption_keys(
+            key_set, protected, unprotected, recipients), 2))
+        if len(candidates) == 0:
+            raise ValueError("Invalid JWE: Could not decrypt content "
+                             "encryption key!")
+        elif len(candidates) > 1:
+            raise ValueError("Invalid JWE: Unable to select a single content "
+                             "encryption key, a kid is required!")
+        encryption, cek = candidates[0]
+        decryptor = ContentDecryptor(self.__cryptography_module, encryption,
+                                     cek, base64_url_decode(iv_encoded),
+                                     self.__get_aad(protected_encoded,
+                                                    aad_encoded))
+        return decryptor, writer
+
+    def __prepare_encryption(
+            self, key_set: KeySet, algorithm: ContentEncryptionKeyAlgorithm,
+            encryption: ContentEncryptionAlgorithm,
+            serialization: Serialization, unprotected_header: Optional[Dict],
+            protected_header: Optional[Dict],
+            compression: Optional[CompressionAlgorithm]
+    ) -> Tuple[str, Dict, List[Recipient], bytes, bytes]:
+        direct = algorithm in (ContentEncryptionKeyAlgorithm.DIR,
+                               ContentEncryptionKeyAlgorithm.ECDH_ES)
+        if algorithm is ContentEncryptionKeyAlgorithm.DIR:
+            keys: List[Key] = get_encrypting_keys(key_set, algorithm)
+        elif algorithm in ECDH_ES_ALGORITHMS:
+            keys: List[Key] = [key for key in
+                               get_deriving_keys(key_set, algorithm)
+                               if key.kty is KeyType.EC]
+        else:
+            keys: List[Key] = get_wrapping_keys(key_set, algorithm)
+        if len(keys) == 0:
+            raise ValueError("No valid encryption keys found!")
+        elif len(keys) > 1 and serialization is not \
+                Serialization.GENERAL_JSON:
+            raise ValueError("JWE Compact and Flattened JSON serializations "
+                             "cannot process more than one recipient!")
+        elif len(keys) > 1 and direct:
+            raise ValueError("JWE direct encryption and direct key agreement "
+                             "cannot process more than one recipient!")
+
+        key_length, iv_length, _ = \
+            get_content_encryption_parameters(encryption)
+        if direct:
+            cek = None
+        else:
+            cek = self.__cryptography_module.random_bytes(key_length)
+        iv = self.__cryptography_module.random_bytes(iv_length)
+
+        current_protected_header = {"alg": algorithm.value,
+                                    "enc": encryption.value}
+        if serialization is not Serialization.GENERAL_JSON \
+                and keys[0].kid is not None:
+            current_protected_header["kid"] = keys[0].kid
+        if compression is not None:
+            current_protected_header["zip"] = compression.value
+        if protected_header is not None:
+            current_protected_header.update(protected_header)
+
+        if unprotected_header is None:
+            current_unprotected_header = {}
+        else:
+            current_unprotected_header = deepcopy(unprotected_header)
+        if serialization is Serialization.COMPACT:
+            current_protected_header.update(current_unprotected_header)
+            current_unprotected_header = {}
+
+        header = dict(current_protected_header)
+        header.update(current_unprotected_header)
+        recipients = []
+        for key in keys:
+            cek, encrypted_key, key_header = self.__encrypt_key(
+                algorithm, encryption, key, cek, header)
+            if serialization is Serialization.GENERAL_JSON:
+                recipient_header = {}
+                if key.kid is not None:
+                    recipient_header["kid"] = key.kid
+                recipient_header.update(key_header)
+            else:
+                recipient_header = {}
+                current_protected_header.update(key_header)
+            recipients.append((recipient_header,
+                               base64_url_encode(encrypted_key)))
+
+        protected_header_encoded = base64_url_encode(
+            json_dumps(current_protected_header).encode())
+        return protected_header_encoded, current_unprotected_header, \
+            recipients, cek, iv
+
+    def __encrypt_key(self, algorithm: ContentEncryptionKeyAlgorithm,
+                      encryption: ContentEncryptionAlgorithm, key: Key,
+                      cek: Optional[bytes],
+                      header: Dict) -> Tuple[bytes, bytes, Dict]:
+        """
+        Returns the content encryption key, which is determined by the key
+        for direct encryption and direct key agreement, the encrypted key
+        and any header parameters the key management algorithm requires to
+        decrypt it
+        """
+        if algorithm is ContentEncryptionKeyAlgorithm.DIR:
+            return key.k, b"", {}
+        elif algorithm in (ContentEncryptionKeyAlgorithm.A128KW,
+                           ContentEncryptionKeyAlgorithm.A192KW,
+                           ContentEncryptionKeyAlgorithm.A256KW):
+            if key.k is None \
+                    or len(key.k) != get_key_wrap_key_length(algorithm):
+                raise ValueError("Invalid key wrapping key length!")
+            return cek, self.__cryptography_module.aes_key_wrap(key.k, cek), \
+                {}
+        elif algorithm in ECDH_ES_ALGORITHMS:
+            curve = get_elliptic_curve(key.crv)
+            if key.x is None or key.y is None:
+                raise ValueError("ECDH-ES requires an EC public key!")
+            if self.__ephemeral_key_pool is None:
+                d, x, y = self.__cryptography_module.ec_generate_key_pair(
+                    curve)
+            else:
+                d, x, y = self.__ephemeral_key_pool.get(key.crv)
+            shared_secret = self.__cryptography_module.ecdh_shared_secret(
+                curve, d, key.x, key.y)
+            key_header = {"epk": {"kty": KeyType.EC.value,
+                                  "crv": key.crv.value,
+                                  "x": base64_url_encode(x),
+                                  "y": base64_url_encode(y)}}
+            derived_key = self.__derive_ecdh_key(algorithm, encryption,
+                                                 shared_secret, header)
+            if algorithm is ContentEncryptionKeyAlgorithm.ECDH_ES:
+                return derived_key, b"", key_header
+            return cek, self.__cryptography_module.aes_key_wrap(
+                derived_key, cek), key_header
+        elif algorithm in (ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                           ContentEncryptionKeyAlgorithm.PBES2_HS384_A192KW,
+                           ContentEncryptionKeyAlgorithm.PBES2_HS512_A256KW):
+            if key.k is None:
+                raise ValueError("PBES2 requires a key with a password!")
+            p2s = self.__cryptography_module.random_bytes(PBES2_SALT_LENGTH)
+            p2c = self.__pbes2_iterations
+            wrapping_key = self.__derive_pbes2_key(algorithm, key.k, p2s, p2c,
+                                                   cache=False)
+            encrypted_key = self.__cryptography_module.aes_key_wrap(
+                wrapping_key, cek)
+            return cek, encrypted_key, {"p2s": base64_url_encode(p2s),
+                                        "p2c": p2c}
+        else:
+            raise NotImplementedError(
+                "The key management algorithm is not supported!")
+
+    def __decrypt_key(self, algorithm: ContentEncryptionKeyAlgorithm,
+                      encryption: ContentEncryptionAlgorithm, key: Key,
+                      encrypted_key: bytes, header: Dict) -> Optional[bytes]:
+        if algorithm is ContentEncryptionKeyAlgorithm.DIR:
+            if len(encrypted_key) > 0:
+                raise ValueError("Invalid JWE: Direct encryption must not "
+                                 "have an encrypted key!")
+            return key.k
+        elif algorithm in (ContentEncryptionKeyAlgorithm.A128KW,
+                           ContentEncryptionKeyAlgorithm.A192KW,
+                           ContentEncryptionKeyAlgorithm.A256KW):
+            if key.k is None \
+                    or len(key.k) != get_key_wrap_key_length(algorithm):
+                return None
+            wrapping_key = key.k
+        elif algorithm in (ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                           ContentEncryptionKeyAlgorithm.PBES2_HS384_A192KW,
+                           ContentEncryptionKeyAlgorithm.PBES2_HS512_A256KW):
+            if key.k is None:
+                return None
+            p2s, p2c = self.__get_pbes2_header_parameters(header)
+            wrapping_key = self.__derive_pbes2_key(algorithm, key.k, p2s, p2c)
+        elif algorithm in ECDH_ES_ALGORITHMS:
+            if key.kty is not KeyType.EC or key.d is None:
+                return None
+            curve = get_elliptic_curve(key.crv)
+            x, y = self.__get_ephemeral_public_key(header, key.crv)
+            try:
+                shared_secret = self.__cryptography_module.ecdh_shared_secret(
+                    curve, key.d, x, y)
+            except ValueError:
+                raise ValueError("Invalid JWE: Invalid ephemeral public key!")
+            wrapping_key = self.__derive_ecdh_key(algorithm, encryption,
+                                                  shared_secret, header)
+            if algorithm is ContentEncryptionKeyAlgorithm.ECDH_ES:
+                if len(encrypted_key) > 0:
+                    raise ValueError("Invalid JWE: Direct key agreement must "
+                                     "not have an encrypted key!")
+                return wrapping_key
+        else:
+            raise NotImplementedError(
+                "The key management algorithm is not supported!")
+        try:
+            return self.__cryptography_module.aes_key_unwrap(
+                wrapping_key, encrypted_key)
+        except ValueError:
+            return None
+
+    def __derive_ecdh_key(self, algorithm: ContentEncryptionKeyAlgorithm,
+                          encryption: ContentEncryptionAlgorithm,
+                          shared_secret: bytes, header: Dict) -> bytes:
+        if algorithm is ContentEncryptionKeyAlgorithm.ECDH_ES:
+            algorithm_id = encryption.value
+            key_length, _, _ = get_content_encryption_parameters(encryption)
+        elif algorithm is ContentEncryptionKeyAlgorithm.ECDH_ES_A128KW:
+            algorithm_id, key_length = algorithm.value, 16
+        elif algorithm is ContentEncryptionKeyAlgorithm.ECDH_ES_A192KW:
+            algorithm_id, key_length = algorithm.value, 24
+        elif algorithm is ContentEncryptionKeyAlgorithm.ECDH_ES_A256KW:
+            algorithm_id, key_length = algorithm.value, 32
+        else:
+            raise NotImplementedError(
+                "The key management algorithm is not supported!")
+        party_info = []
+        for name in ("apu", "apv"):
+            value = header.get(name)
+            if value is None:
+                party_info.append(b"")
+            elif isinstance(value, str):
+                party_info.append(base64_url_decode(value))
+            else:
+                raise ValueError(f"Invalid JWE: Header has an invalid {name} "
+                                 f"entry!")
+        return concat_kdf(self.__cryptography_module, shared_secret,
+                          algorithm_id, party_info[0], party_info[1],
+                          key_length)
+
+    @staticmethod
+    def __get_ephemeral_public_key(header: Dict,
+                                   crv: Curve) -> Tuple[bytes, bytes]:
+        epk = header.get("epk")
+        if not isinstance(epk, dict) or epk.get("kty") != KeyType.EC.value \
+                or not isinstance(epk.get("x"), str) \
+                or not isinstance(epk.get("y"), str):
+            raise ValueError("Invalid JWE: Header has no valid epk entry!")
+        if epk.get("crv") != crv.value:
+            raise ValueError("Invalid JWE: Ephemeral public key curve does "
+                             "not match the key curve!")
+        return base64_url_decode(epk["x"]), base64_url_decode(epk["y"])
+
+    def __get_pbes2_header_parameters(self, header: Dict) -> Tuple[bytes, int]:
+        p2s_encoded = header.get("p2s")
+        p2c = header.get("p2c")
+        if not isinstance(p2s_encoded, str):
+            raise ValueError("Invalid JWE: Header has no valid p2s entry!")
+        # bool is a subclass of int but never a valid count
+        if not isinstance(p2c, int) or isinstance(p2c, bool):
+            raise ValueError("Invalid JWE: Header has no valid p2c entry!")
+        if not self.__pbes2_min_iterations <= p2c \
+                <= self.__pbes2_max_iterations:
+            raise ValueError("Invalid JWE: PBES2 iteration count is outside "
+                             "of the permitted range!")
+        p2s = base64_url_decode(p2s_encoded)
+        if len(p2s) < 8:
+            raise ValueError("Invalid JWE: PBES2 salt is too short!")
+        return p2s, p2c
+
+    def __derive_pbes2_key(self, algorithm: ContentEncryptionKeyAlgorithm,
+                           password: bytes, p2s: bytes, p2c: int,
+                           cache: bool = True) -> bytes:
+        hashing_algorithm, length = get_pbes2_parameters(algorithm)
+        salt = algorithm.value.encode() + b"\x00" + p2s
+        if not cache or self.__pbes2_key_cache is None:
+            return self.__pbkdf2(hashing_algorithm, password, salt, p2c,
+                                 length)
+
+        cache_key = (self.__get_password_identity(password), algorithm, p2s,
+                     p2c)
+        derived_key = self.__pbes2_key_cache.get(cache_key)
+        if derived_key is not None:
+            return derived_key
+        # Concurrent decryptions of the same key share one derivation
+        with self.__pbes2_lock:
+            future = self.__pbes2_pending.get(cache_key)
+            owner = future is None
+            if owner:
+                from concurrent.futures import Future
+                future = Future()
+                self.__pbes2_pending[cache_key] = future
+        if not owner:
+            return future.result()
+        try:
+            derived_key = self.__pbkdf2(hashing_algorithm, password, salt,
+                                        p2c, length)
+            self.__pbes2_key_cache.put(cache_key, derived_key)
+            future.set_result(derived_key)
+            return derived_key
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.__pbes2_lock:
+                del self.__pbes2_pending[cache_key]
+
+    def __pbkdf2(self, hashing_algorithm: HashingAlgorithm, password: bytes,
+                 salt: bytes, iterations: int, length: int) -> bytes:
+        if self.__pbes2_executor is None:
+            return self.__cryptography_module.pbkdf2_hmac(
+                hashing_algorithm, password, salt, iterations, length)
+        return self.__pbes2_executor.submit(
+            self.__cryptography_module.pbkdf2_hmac, hashing_algorithm,
+            password, salt, iterations, length).result()
+
+    def __get_password_identity(self, password: bytes) -> bytes:
+        """
+        Cache entries are identified by a keyed digest of the password so
+        that neither the password nor an unkeyed hash of it is retained
+        """
+        if self.__pbes2_identity_key is None:
+            with self.__pbes2_lock:
+                if self.__pbes2_identity_key is None:
+                    self.__pbes2_identity_key = \
+                        self.__cryptography_module.random_bytes(32)
+        return self.__cryptography_module.hmac_digest(
+            HashingAlgorithm.SHA256, self.__pbes2_identity_key, password)
+
+    def __get_content_encryption_keys(
+            self, key_set: KeySet, protected: Dict,
+            unprotected: Dict, recipients: List[Recipient]
+    ) -> Iterator[Tuple[ContentEncryptionAlgorithm, bytes]]:
+        for recipient_header, encrypted_key_encoded in recipients:
+            header = dict(protected)
+            for other in (unprotected, recipient_header):
+                if not header.keys().isdisjoint(other.keys()):
+                    raise ValueError("Invalid JWE: Header parameter names "
+                                     "must be disjoint!")
+                header.update(other)
+            algorithm = ContentEncryptionKeyAlgorithm.from_value(
+                header.get("alg"))
+            if algorithm is None:
+                raise ValueError("Invalid JWE: Header has no valid alg "
+                                 "entry!")
+            encryption = ContentEncryptionAlgorithm.from_value(
+                header.get("enc"))
+            if encryption is None:
+                raise ValueError("Invalid JWE: Header has no valid enc "
+                                 "entry!")
+            encrypted_key = base64_url_decode(encrypted_key_encoded)
+
+            if "kid" in header:
+                key = key_set.get_key_by_id(header["kid"])
+                keys = [] if key is None else [key]
+            elif algorithm is ContentEncryptionKeyAlgorithm.DIR:
+                keys = get_decrypting_keys(key_set, algorithm)
+            elif algorithm in ECDH_ES_ALGORITHMS:
+                keys = get_deriving_keys(key_set, algorithm)
+            else:
+                keys = get_unwrapping_keys(key_set, algorithm)
+
+            for key in keys:
+                cek = self.__decrypt_key(algorithm, encryption, key,
+                                         encrypted_key, header)
+                if cek is not None:
+                    yield encryption, cek
+
+    @staticmethod
+    def __decode_protected_header(protected_encoded: str) -> Dict:
+        if not protected_encoded:
+            return {}
+        try:
+            protected = json_loads(base64_url_decode(protected_encoded))
+        except (JSONDecodeError, UnicodeDecodeError):
+            raise ValueError("Invalid JWE: Unable to parse header!")
+        if not isinstance(protected, dict):
+            raise ValueError("Invalid JWE: Unable to parse header!")
+        return protected
+
+    @staticmethod
+    def __get_compression(
+            protected: Dict, unprotected: Dict, recipients: List[Recipient]
+    ) -> Optional[CompressionAlgorithm]:
+        if "zip" in unprotected or any("zip" in recipient_header
+                                       for recipient_header, _ in recipients):
+            raise ValueError("Invalid JWE: zip must be in the protected "
+                             "header!")
+        if "zip" not in protected:
+            return None
+        compression = CompressionAlgorithm.from_value(protected["zip"])
+        if compression is None:
+            raise ValueError("Invalid JWE: Header has no valid zip entry!")
+        return compression
+
+    @staticmethod
+    def __get_compressor(compression: Optional[CompressionAlgorithm]):
+        if compression is None:
+            return None
+        elif compression is CompressionAlgorithm.DEF:
+            return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                    -zlib.MAX_WBITS)
+        else:
+            raise NotImplementedError(
+                "The compression algorithm is not supported!")
+
+    @staticmethod
+    def __get_json_head(serialization: Serialization, protected_encoded: str,
+                        unprotected: Dict, recipients: List[Recipient],
+                        iv_encoded: str) -> Dict:
+        """
+        Builds the JSON serialization members that precede the ciphertext
+        """
+        head = {"protected": protected_encoded}
+        if len(unprotected) > 0:
+            head["unprotected"] = unprotected
+        if serialization is Serialization.FLATTENED_JSON:
+            recipient_header, encrypted_key_encoded = recipients[0]
+            if len(recipient_header) > 0:
+                head["header"] = recipient_header
+            if encrypted_key_encoded:
+                head["encrypted_key"] = encrypted_key_encoded
+        elif serialization is Serialization.GENERAL_JSON:
+            head["recipients"] = []
+            for recipient_header, encrypted_key_encoded in recipients:
+                recipient = {}
+                if len(recipient_header) > 0:
+                    recipient["header"] = recipient_header
+                if encrypted_key_encoded:
+                    recipient["encrypted_key"] = encrypted_key_encoded
+                head["recipients"].append(recipient)
+        else:
+            raise NotImplementedError("Serialization not implemented!")
+        head["iv"] = iv_encoded
+        return head
+
+    def __get_json_components(
+            self, jwe_obj: Dict
+    ) -> Tuple[str, Dict, List[Recipient], str, Optional[str]]:
+        try:
+            protected_encoded = jwe_obj.get("protected", "")
+            unprotected = jwe_obj.get("unprotected", {})
+            if "recipients" in jwe_obj:
+                if not isinstance(jwe_obj["recipients"], list):
+                    raise ValueError("Unable to properly parse JWE")
+                if len(jwe_obj["recipients"]) > self.__max_recipients:
+                    raise ValueError("Invalid JWE: Number of recipients "
+                                     "exceeds maximum!")
+                recipients = [(recipient.get("header", {}),
+                               recipient.get("encrypted_key", ""))
+                              for recipient in jwe_obj["recipients"]]
+            else:
+                recipients = [(jwe_obj.get("header", {}),
+                               jwe_obj.get("encrypted_key", ""))]
+            iv_encoded = jwe_obj["iv"]
+            aad_encoded = jwe_obj.get("aad")
+        except (AttributeError, KeyError, TypeError):
+            raise ValueError("Unable to properly parse JWE")
+        if not isinstance(protected_encoded, str) \
+                or not isinstance(unprotected, dict) \
+                or not isinstance(iv_encoded, str) \
+                or not (aad_encoded is None or isinstance(aad_encoded, str)) \
+                or len(recipients) == 0 \
+                or not all(isinstance(header, dict)
+                           and isinstance(encrypted_key, str)
+                           for header, encrypted_key in recipients):
+            raise ValueError("Unable to properly parse JWE")
+        return protected_encoded, unprotected, recipients, iv_encoded, \
+            aad_encoded
+
+    @staticmethod
+    def __get_aad(protected_encoded: str, aad_encoded: Optional[str]) -> bytes:
+        aad = protected_encoded.encode("ascii")
+        if aad_encoded is not None:
+            aad += b"." + aad_encoded.encode("ascii")
+        return aad
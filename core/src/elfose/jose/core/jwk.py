@@ -1,9 +1,12 @@
+import sys
 from enum import Enum
 from functools import reduce
-from typing import List, Iterable, Collection
-from urllib.parse import urlparse
+from itertools import count
+from typing import Dict, FrozenSet, List, Iterable, Collection, Hashable
 
-from .jwa import Algorithm
+from .encoding import base64_url_decode, base64_url_encode
+from .jwa import Algorithm, ContentEncryptionAlgorithm, \
+    ContentEncryptionKeyAlgorithm, DigitalSignatureAlgorithm
 
 
 class KeyType(Enum):
@@ -28,10 +31,40 @@ class Use(Enum):
     enc = "enc"
 
 
+class Curve(Enum):
+    P_256 = "P-256"
+    P_384 = "P-384"
+    P_521 = "P-521"
+
+
+_KEY_OPS: Dict[FrozenSet[KeyOp], FrozenSet[KeyOp]] = {}
+
+
+def _intern_key_ops(key_ops: Collection[KeyOp]) -> FrozenSet[KeyOp]:
+    key_ops = frozenset(key_ops)
+    return _KEY_OPS.setdefault(key_ops, key_ops)
+
+
+def _intern(value: str) -> str:
+    return None if value is None else sys.intern(value)
+
+
 class Key:
+    """
+    Immutable JWK. Keys are compared and hashed by value. Fields repeated
+    across many keys, such as key_ops and x5u, are interned so that large
+    key sets share them.
+    """
+
+    __slots__ = ("__kty", "__k", "__use", "__key_ops", "__alg", "__kid",
+                 "__x5u", "__x5c", "__x5t", "__x5t_S256", "__crv", "__x",
+                 "__y", "__d", "__hash")
+
     def __init__(self, kty: KeyType, *, k: bytes = None, use: Use = None,
                  key_ops: Collection[KeyOp] = None, alg: Algorithm = None,
-                 kid: str = None, x5u=None, x5c=None, x5t=None, x5t_s256=None):
+                 kid: str = None, x5u=None, x5c=None, x5t=None, x5t_s256=None,
+                 crv: Curve = None, x: bytes = None, y: bytes = None,
+                 d: bytes = None):
 
         if not isinstance(kty, KeyType):
             raise TypeError("kty must be type KeyType")
@@ -51,7 +84,8 @@ class Key:
                            [isinstance(i, KeyOp) for i in key_ops], False)
         ):
             raise TypeError("key_ops must be type Collection[KeyOp]")
-        self.__key_ops: Collection[KeyOp] = key_ops
+        self.__key_ops: Collection[KeyOp] = None if key_ops is None \
+            else _intern_key_ops(key_ops)
 
         if alg is not None and not isinstance(alg, Algorithm):
             raise TypeError("alg must be type Algorithm")
@@ -59,11 +93,12 @@ class Key:
 
         if kid and not isinstance(kid, str):
             raise TypeError("use must be type str")
-        self.__kid = kid
+        self.__kid = _intern(kid)
 
         if x5u is not None:
             if not isinstance(x5u, str):
                 raise TypeError("x5u must be type str")
+            from urllib.parse import urlparse
             try:
                 parsed = urlparse(x5u)
                 if not parsed.scheme:
@@ -73,7 +108,7 @@ class Key:
             except ValueError as cause:
                 raise ValueError(f"x5u is not a valid URI: {cause}")
 
-        self.__x5u = x5u
+        self.__x5u = _intern(x5u)
 
         if x5c is not None and (
                 not isinstance(x5c, list) or
@@ -81,7 +116,7 @@ class Key:
                            [isinstance(i, str) for i in x5c], False)
         ):
             raise TypeError("x5c must be type list[str]")
-        self.__x5c = x5c
+        self.__x5c = None if x5c is None else tuple(x5c)
 
         if x5t is not None and not isinstance(x5t, str):
             raise TypeError("x5t must be type str")
@@ -91,10 +126,130 @@ class Key:
             raise TypeError("x5t_s256 must be Use")
         self.__x5t_S256 = x5t_s256
 
+        if crv is not None and not isinstance(crv, Curve):
+            raise TypeError("crv must be type Curve")
+        self.__crv = crv
+
+        if x is not None and not isinstance(x, bytes):
+            raise TypeError("x must be type bytes")
+        self.__x = x
+
+        if y is not None and not isinstance(y, bytes):
+            raise TypeError("y must be type bytes")
+        self.__y = y
+
+        if d is not None and not isinstance(d, bytes):
+            raise TypeError("d must be type bytes")
+        self.__d = d
+        self.__hash = None
+
+    def __fields(self) -> tuple:
+        return (self.__kty, self.__k, self.__use, self.__key_ops, self.__alg,
+                self.__kid, self.__x5u, self.__x5c, self.__x5t,
+                self.__x5t_S256, self.__crv, self.__x, self.__y, self.__d)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Key):
+            return NotImplemented
+        return self.__fields() == other.__fields()
+
+    def __hash__(self) -> int:
+        if self.__hash is None:
+            self.__hash = hash(self.__fields())
+        return self.__hash
+
+    def __setattr__(self, name: str, value) -> None:
+        # Attributes are only assigned by __init__ and the cached hash
+        if name != "_Key__hash" and hasattr(self, "_Key__hash"):
+            raise AttributeError("Key is immutable")
+        object.__setattr__(self, name, value)
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the key as a JWK JSON object as described in
+        https://tools.ietf.org/html/rfc7517#section-4
+        """
+        jwk = {"kty": self.__kty.value}
+        if self.__use is not None:
+            jwk["use"] = self.__use.value
+        if self.__key_ops is not None:
+            jwk["key_ops"] = sorted(key_op.value
+                                    for key_op in self.__key_ops)
+        if self.__alg is not None:
+            jwk["alg"] = self.__alg.value
+        if self.__kid is not None:
+            jwk["kid"] = self.__kid
+        if self.__x5u is not None:
+            jwk["x5u"] = self.__x5u
+        if self.__x5c is not None:
+            jwk["x5c"] = list(self.__x5c)
+        if self.__x5t is not None:
+            jwk["x5t"] = self.__x5t
+        if self.__x5t_S256 is not None:
+            jwk["x5t#S256"] = self.__x5t_S256
+        if self.__crv is not None:
+            jwk["crv"] = self.__crv.value
+        for name, value in (("k", self.__k), ("x", self.__x),
+                            ("y", self.__y), ("d", self.__d)):
+            if value is not None:
+                jwk[name] = base64_url_encode(value)
+        return jwk
+
+    @classmethod
+    def from_dict(cls, jwk: Dict) -> "Key":
+        """
+        Creates a key from a JWK JSON object. Raises ValueError for
+        unsupported values.
+        """
+        kty = KeyType.__members__.get(jwk.get("kty"))
+        if kty is None:
+            raise ValueError("JWK has no valid kty!")
+        kwargs = {}
+        if "use" in jwk:
+            kwargs["use"] = cls.__from_value(Use, jwk["use"], "use")
+        if "key_ops" in jwk:
+            kwargs["key_ops"] = [cls.__from_value(KeyOp, key_op, "key_ops")
+                                 for key_op in jwk["key_ops"]]
+        if "alg" in jwk:
+            for algorithm_type in (DigitalSignatureAlgorithm,
+                                   ContentEncryptionKeyAlgorithm,
+                                   ContentEncryptionAlgorithm):
+                alg = algorithm_type.from_value(jwk["alg"])
+                if alg is not None:
+                    kwargs["alg"] = alg
+                    break
+            else:
+                raise ValueError("JWK has no valid alg!")
+        if "crv" in jwk:
+            kwargs["crv"] = cls.__from_value(Curve, jwk["crv"], "crv")
+        for name, member in (("kid", "kid"), ("x5u", "x5u"), ("x5c", "x5c"),
+                             ("x5t", "x5t"), ("x5t_s256", "x5t#S256")):
+            if member in jwk:
+                kwargs[name] = jwk[member]
+        for name in ("k", "x", "y", "d"):
+            if name in jwk:
+                kwargs[name] = base64_url_decode(jwk[name])
+        return cls(kty, **kwargs)
+
+    @staticmethod
+    def __from_value(enum, value, name: str):
+        try:
+            return enum(value)
+        except ValueError:
+            raise ValueError(f"JWK has no valid {name}!")
+
     @property
     def alg(self) -> Algorithm:
         return self.__alg
 
+    @property
+    def crv(self) -> Curve:
+        return self.__crv
+
+    @property
+    def d(self) -> bytes:
+        return self.__d
+
     @property
     def k(self) -> bytes:
         return self.__k
@@ -117,7 +272,7 @@ class Key:
 
     @property
     def x5c(self) -> List[str]:
-        return self.__x5c
+        return None if self.__x5c is None else list(self.__x5c)
 
     @property
     def x5t(self) -> str:
@@ -131,21 +286,65 @@ class Key:
     def x5u(self) -> str:
         return self.__x5u
 
+    @property
+    def x(self) -> bytes:
+        return self.__x
+
+    @property
+    def y(self) -> bytes:
+        return self.__y
+
+
+_KEY_SET_VERSIONS = count()
+
 
 class KeySet:
 
-    def __init__(self, keys: [Iterable[Key]]) -> None:
-        self.__keys = [key for key in keys]
+    __slots__ = ("__keys", "__keys_by_id", "__version")
+
+    def __init__(self, keys: [Iterable[Key]],
+                 version: Hashable = None) -> None:
+        """
+        version identifies the keys for caches of values produced with them.
+        When not provided, every KeySet is given a version of its own.
+        """
+        self.__keys = tuple(keys)
+        self.__keys_by_id: Dict[str, Key] = {}
+        for key in self.__keys:
+            if key.kid is not None:
+                self.__keys_by_id.setdefault(key.kid, key)
+        self.__version = next(_KEY_SET_VERSIONS) if version is None \
+            else version
 
     @property
     def keys(self):
-        return self.__keys[:]
+        return list(self.__keys)
+
+    @property
+    def version(self) -> Hashable:
+        return self.__version
 
     def get_key_by_id(self, kid):
-        for key in self.__keys:
-            if key.kid == kid:
-                return key
-        return None
+        if not isinstance(kid, str):
+            return None
+        return self.__keys_by_id.get(kid)
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the key set as a JWK Set JSON object
+        """
+        return {"keys": [key.to_dict() for key in self.__keys]}
+
+    @classmethod
+    def from_dict(cls, jwks: Dict) -> "KeySet":
+        """
+        Creates a key set from a JWK Set JSON object. Raises ValueError for
+        unsupported values.
+        """
+        if not isinstance(jwks, dict) or not isinstance(jwks.get("keys"),
+                                                        list):
+            raise ValueError("JWK Set has no keys list!")
+        return cls(Key.from_dict(jwk) for jwk in jwks["keys"])
 
 
 class InvalidKeyUseError(Exception):
@@ -168,6 +367,28 @@ def get_verifying_keys(key_set: KeySet, algorithm: Algorithm):
     return __get_appropriate_keys(key_set, algorithm, Use.sig, KeyOp.verify)
 
 
+def get_encrypting_keys(key_set: KeySet, algorithm: Algorithm):
+    return __get_appropriate_keys(key_set, algorithm, Use.enc, KeyOp.encrypt)
+
+
+def get_decrypting_keys(key_set: KeySet, algorithm: Algorithm):
+    return __get_appropriate_keys(key_set, algorithm, Use.enc, KeyOp.decrypt)
+
+
+def get_wrapping_keys(key_set: KeySet, algorithm: Algorithm):
+    return __get_appropriate_keys(key_set, algorithm, Use.enc, KeyOp.wrap_key)
+
+
+def get_unwrapping_keys(key_set: KeySet, algorithm: Algorithm):
+    return __get_appropriate_keys(key_set, algorithm, Use.enc,
+                                  KeyOp.unwrap_key)
+
+
+def get_deriving_keys(key_set: KeySet, algorithm: Algorithm):
+    return __get_appropriate_keys(key_set, algorithm, Use.enc,
+                                  KeyOp.derive_key)
+
+
 def __get_appropriate_keys(key_set: KeySet, algorithm: Algorithm, use: Use,
                          key_op: KeyOp):
     keys: List[Key] = []
@@ -1,19 +1,35 @@
 import json
-import re
 from copy import deepcopy
 from enum import Enum
 from json import JSONDecodeError
-from typing import Collection, Dict, Union, List
+from functools import partial
+from hmac import compare_digest
+from tempfile import SpooledTemporaryFile
+from typing import TYPE_CHECKING, BinaryIO, Callable, Collection, Dict, \
+    FrozenSet, Iterator, List, Optional, Tuple, Union
 
-from .cryptography import CryptographyModule
+from .cache import LRUCache, NegativeCache, SharedVerificationCache, \
+    VerifiedToken
+from .cryptography import CryptographyModule, HmacContext
 from .cryptography import HashingAlgorithm
 from .encoding import base64_url_encode, base64_url_decode, json_dumps, \
-    json_loads
+    json_loads, base64_url_encode_bytes, is_base64_url, Base64UrlDecoder, \
+    JSONObjectReader
+from .header import ProtectedHeader, UnprotectedHeader
 from .jwa import DigitalSignatureAlgorithm
 from .jwk import Key, KeySet, get_signing_keys, get_verifying_keys
 
-COMPACT_SERIALIZATION_MATCHER = re.compile(
-    "^([a-zA-Z0-9\-\_]+)\.([a-zA-Z0-9\-\_]+)\.([a-zA-Z0-9\-\_]+)$")
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+MAX_TOKEN_LENGTH = 1024 * 1024
+MAX_HEADER_LENGTH = 8192
+MAX_SIGNATURES = 16
+MAX_MEMBERS = 16
+DEFAULT_CHUNK_SIZE = 65536
+HMAC_ALGORITHMS = frozenset((DigitalSignatureAlgorithm.HS256,
+                             DigitalSignatureAlgorithm.HS384,
+                             DigitalSignatureAlgorithm.HS512))
 
 
 class Serialization(Enum):
@@ -22,69 +38,280 @@ class Serialization(Enum):
     COMPACT = 2
 
 
+class FailureReason(Enum):
+    MALFORMED = "malformed"
+    LIMIT_EXCEEDED = "limit_exceeded"
+    ALGORITHM_NOT_ALLOWED = "algorithm_not_allowed"
+    INVALID_SIGNATURE = "invalid_signature"
+
+
+class InvalidJWSError(ValueError):
+    """
+    Raised by JWS.verify when a JWS is rejected for a reason worth
+    distinguishing, such as a limit or an invalid signature
+    """
+
+    def __init__(self, message: str, reason: FailureReason) -> None:
+        super().__init__(message)
+        self.__reason = reason
+
+    @property
+    def reason(self) -> FailureReason:
+        return self.__reason
+
+
+class VerificationLimits:
+    """
+    Resource limits enforced by JWS.verify before any base64 decoding, JSON
+    parsing of headers or MAC calculation takes place. Lengths are in
+    characters of the serialized JWS and of the decoded protected header.
+    An allowed_algorithms of None allows every supported algorithm.
+    """
+
+    def __init__(self, *, max_token_length: int = MAX_TOKEN_LENGTH,
+                 max_header_length: int = MAX_HEADER_LENGTH,
+                 max_signatures: int = MAX_SIGNATURES,
+                 allowed_algorithms: Collection[
+                     DigitalSignatureAlgorithm] = None) -> None:
+        if max_token_length < 1 or max_header_length < 1 \
+                or max_signatures < 1:
+            raise ValueError("Limits must be positive!")
+        self.__max_token_length = max_token_length
+        self.__max_header_length = max_header_length
+        self.__max_encoded_header_length = (max_header_length * 4 + 2) // 3
+        self.__max_signatures = max_signatures
+        self.__allowed_algorithms = None if allowed_algorithms is None \
+            else frozenset(allowed_algorithms)
+
+    @property
+    def max_token_length(self) -> int:
+        return self.__max_token_length
+
+    @property
+    def max_header_length(self) -> int:
+        return self.__max_header_length
+
+    @property
+    def max_encoded_header_length(self) -> int:
+        return self.__max_encoded_header_length
+
+    @property
+    def max_signatures(self) -> int:
+        return self.__max_signatures
+
+    @property
+    def allowed_algorithms(
+            self) -> Optional[Collection[DigitalSignatureAlgorithm]]:
+        return self.__allowed_algorithms
+
+
+class VerificationPolicy:
+    """
+    Decides whether the signatures of a JWS verify it as they are checked
+    by JWS.verify_with_policy. decide is given the kid of every signature,
+    None where there is none, whether each signature checked so far is
+    valid by index and the key that verified each valid signature by index,
+    and returns True or False once that is enough to decide and None while
+    it is not.
+    """
+
+    def decide(self, kids: List[Optional[str]], results: Dict[int, bool],
+               keys: Dict[int, Key]) -> Optional[bool]:
+        raise NotImplementedError
+
+    def requires(self, kid: Optional[str]) -> bool:
+        """
+        Whether a signature with the kid can affect the decision, those
+        that cannot are not checked
+        """
+        return True
+
+
+class AnySignaturePolicy(VerificationPolicy):
+    """
+    At least one signature must be valid
+    """
+
+    def decide(self, kids: List[Optional[str]], results: Dict[int, bool],
+               keys: Dict[int, Key]) -> Optional[bool]:
+        if any(results.values()):
+            return True
+        return False if len(results) == len(kids) else None
+
+
+class AllSignaturesPolicy(VerificationPolicy):
+    """
+    Every signature must be valid
+    """
+
+    def decide(self, kids: List[Optional[str]], results: Dict[int, bool],
+               keys: Dict[int, Key]) -> Optional[bool]:
+        if not all(results.values()):
+            return False
+        return True if len(results) == len(kids) else None
+
+
+class ThresholdPolicy(VerificationPolicy):
+    """
+    At least threshold signatures must be valid, signatures verified by
+    the same key are counted once
+    """
+
+    def __init__(self, threshold: int) -> None:
+        if threshold < 1:
+            raise ValueError("threshold must be positive")
+        self.__threshold = threshold
+
+    @property
+    def threshold(self) -> int:
+        return self.__threshold
+
+    def decide(self, kids: List[Optional[str]], results: Dict[int, bool],
+               keys: Dict[int, Key]) -> Optional[bool]:
+        valid = len(set(keys.values()))
+        if valid >= self.__threshold:
+            return True
+        if valid + len(kids) - len(results) < self.__threshold:
+            return False
+        return None
+
+
+class KidsPolicy(VerificationPolicy):
+    """
+    There must be a valid signature with each of the kids
+    """
+
+    def __init__(self, kids: Collection[str]) -> None:
+        if not kids:
+            raise ValueError("kids must not be empty")
+        self.__kids = frozenset(kids)
+
+    @property
+    def kids(self) -> FrozenSet[str]:
+        return self.__kids
+
+    def requires(self, kid: Optional[str]) -> bool:
+        return kid in self.__kids
+
+    def decide(self, kids: List[Optional[str]], results: Dict[int, bool],
+               keys: Dict[int, Key]) -> Optional[bool]:
+        missing = self.__kids.difference(
+            kids[index] for index, valid in results.items() if valid)
+        if not missing:
+            return True
+        if not missing.issubset(kid for index, kid in enumerate(kids)
+                                if index not in results):
+            return False
+        return None
+
+
+class VerificationResult:
+    """
+    Returned by JWS.verify_with_policy with the payload, the kid of every
+    signature and the indexes of the signatures found valid and invalid.
+    Signatures not checked, as the policy was decided before or did not
+    require them, are in neither.
+    """
+
+    def __init__(self, payload: bytes, kids: List[Optional[str]],
+                 valid_signatures: List[int],
+                 invalid_signatures: List[int]) -> None:
+        self.__payload = payload
+        self.__kids = kids
+        self.__valid_signatures = valid_signatures
+        self.__invalid_signatures = invalid_signatures
+
+    @property
+    def payload(self) -> bytes:
+        return self.__payload
+
+    @property
+    def kids(self) -> List[Optional[str]]:
+        return self.__kids
+
+    @property
+    def valid_signatures(self) -> List[int]:
+        return self.__valid_signatures
+
+    @property
+    def invalid_signatures(self) -> List[int]:
+        return self.__invalid_signatures
+
+
+class CompactSigner:
+    """
+    Creates JWS Compact Serializations for the key, algorithm and encoded
+    protected header given by JWS.compact_signer
+    """
+
+    def __init__(self, protected_header_encoded: bytes,
+                 signer: Callable[[bytes], bytes]) -> None:
+        self.__signing_input_prefix = protected_header_encoded + b"."
+        self.__signer = signer
+
+    def sign(self, payload: bytes) -> bytes:
+        return self.sign_encoded(base64_url_encode_bytes(payload))
+
+    def sign_encoded(self, payload_encoded: bytes) -> bytes:
+        """
+        Signs a payload that is already base64url encoded
+        """
+        signing_input = self.__signing_input_prefix + payload_encoded
+        signature = self.__signer(signing_input)
+        return b".".join((signing_input, base64_url_encode_bytes(signature)))
+
+
 class JWS:
 
-    def __init__(self, cryptography_module: CryptographyModule) -> None:
+    def __init__(self, cryptography_module: CryptographyModule,
+                 limits: VerificationLimits = None,
+                 negative_cache: NegativeCache = None,
+                 verification_cache: SharedVerificationCache = None) -> None:
+        """
+        When a negative_cache is provided, the SHA-256 digest of every JWS
+        that fails verification is recorded, with the version of the key set
+        it failed against, with the reason it failed and the same JWS is
+        rejected from the cache for that key set version, without parsing or
+        MAC calculation, until the entry expires.
+
+        When a verification_cache is provided, the SHA-256 digest of every
+        JWS that is verified is recorded with the digest of the key that
+        verified it. The same JWS is accepted from the cache, without
+        parsing or MAC calculation, while the key set still has that key for
+        the kid, or for the algorithm when there is no kid, and the algorithm
+        is allowed.
+        """
         self.__cryptography_module = cryptography_module
+        self.__limits = VerificationLimits() if limits is None else limits
+        self.__negative_cache = negative_cache
+        self.__verification_cache = verification_cache
+        self.__key_digests = LRUCache()
 
     def sign(self, key_set: KeySet, algorithm: DigitalSignatureAlgorithm,
              payload: bytes,
              serialization: Serialization = Serialization.FLATTENED_JSON,
-             unprotected_header: Dict = None,
-             protected_header: Dict = None
+             unprotected_header: Union[Dict, UnprotectedHeader] = None,
+             protected_header: Union[Dict, ProtectedHeader] = None
              ) -> Union[str, Dict]:
-        keys: Collection[Key] = get_signing_keys(key_set, algorithm)
-        if len(keys) == 0:
-            raise ValueError("No valid signing keys found!")
-        elif len(keys) > 1 and serialization is Serialization.COMPACT:
-            raise ValueError("JWS Compact serialization cannot process"
-                             "signatures for more that one key!")
-        elif len(keys) > 1 and serialization is Serialization.FLATTENED_JSON:
-            raise ValueError("JWS Flattened JSON serialization cannot process"
-                             "signatures for more that one key!")
-
+        """
+        Headers may be given as dicts, which are copied for every signature,
+        or as UnprotectedHeader and ProtectedHeader, which are used as they
+        are and whose encodings are reused from previous calls.
+        """
+        keys = self.__get_signing_keys(key_set, algorithm, serialization)
         payload_encoded = base64_url_encode(payload)
         signatures = []
-
-        for key in keys:
-            if unprotected_header is None:
-                current_unprotected_header = {}
-            else:
-                current_unprotected_header = deepcopy(unprotected_header)
-
-            current_protected_header = {"alg": algorithm.value}
-            if key.kid is not None:
-                current_protected_header["kid"] = key.kid
-            if protected_header is not None:
-                current_protected_header.update(protected_header)
+        for protected_header_encoded, current_unprotected_header, \
+                signature_encoded in self.__sign_each(
+                    keys, algorithm, payload_encoded.encode("ascii"),
+                    serialization, unprotected_header, protected_header):
+            protected_header_encoded = protected_header_encoded.decode(
+                "ascii")
+            signature_encoded = signature_encoded.decode("ascii")
 
             if serialization is Serialization.COMPACT:
-                current_protected_header.update(current_unprotected_header)
-
-            protected_header_bytes = json_dumps(
-                current_protected_header).encode()
-            protected_header_encoded = base64_url_encode(
-                protected_header_bytes)
-            signing_input = protected_header_encoded + "." + payload_encoded
-            if algorithm is DigitalSignatureAlgorithm.HS256:
-                signature_bytes = self.__cryptography_module.hmac_digest(
-                    HashingAlgorithm.SHA256, key.k,
-                    signing_input.encode("utf-8"))
-            elif algorithm is DigitalSignatureAlgorithm.HS384:
-                signature_bytes = self.__cryptography_module.hmac_digest(
-                    HashingAlgorithm.SHA384, key.k,
-                    signing_input.encode("utf-8"))
-            elif algorithm is DigitalSignatureAlgorithm.HS512:
-                signature_bytes = self.__cryptography_module.hmac_digest(
-                    HashingAlgorithm.SHA512, key.k,
-                    signing_input.encode("utf-8"))
-            else:
-                raise NotImplementedError(
-                    "The signature algorithm is not supported!")
-            signature_encoded = base64_url_encode(signature_bytes)
-
-            if serialization is Serialization.COMPACT:
-                return signing_input + "." + signature_encoded
+                return protected_header_encoded + "." + payload_encoded \
+                    + "." + signature_encoded
             elif serialization is Serialization.FLATTENED_JSON:
                 flattened = {
                     "payload": payload_encoded,
@@ -112,74 +339,777 @@ class JWS:
             "signatures": signatures
         }
 
-    def verify(self, key_set: KeySet, jws: str) -> bytes:
-        # Munge all data types into a JWS General JSON Object
-        jws_dict = {"payload": None, "signatures": []}
-        matches = COMPACT_SERIALIZATION_MATCHER.match(jws)
-        if matches:
-            jws_dict["payload"] = matches[2]
-            jws_dict["signatures"].append({
-                "protected": matches[1],
-                "signature": matches[3]
-            })
+    def sign_to(self, output: Union[bytearray, BinaryIO], key_set: KeySet,
+                algorithm: DigitalSignatureAlgorithm, payload: bytes,
+                serialization: Serialization = Serialization.FLATTENED_JSON,
+                unprotected_header: Union[Dict, UnprotectedHeader] = None,
+                protected_header: Union[Dict, ProtectedHeader] = None
+                ) -> int:
+        """
+        Writes the bytes of the serialization sign would return, as compact
+        JSON for the JSON serializations, to the end of a bytearray or to a
+        binary file object without building the str or dict values. Returns
+        the number of bytes written.
+        """
+        if not isinstance(serialization, Serialization):
+            raise NotImplementedError("Serialization not implemented!")
+        keys = self.__get_signing_keys(key_set, algorithm, serialization)
+        write = output.extend if isinstance(output, bytearray) \
+            else output.write
+        payload_encoded = base64_url_encode_bytes(payload)
+        if not unprotected_header \
+                or serialization is Serialization.COMPACT:
+            header_member = b""
+        elif isinstance(unprotected_header, UnprotectedHeader):
+            header_member = b',"header":' + unprotected_header.json.encode()
+        else:
+            header_member = b',"header":' \
+                + json_dumps(unprotected_header).encode()
+
+        parts = []
+        if serialization is Serialization.GENERAL_JSON:
+            parts.extend((b'{"payload":"', payload_encoded,
+                          b'","signatures":['))
+        for index, (protected_header_encoded, _, signature_encoded) \
+                in enumerate(self.__sign_each(
+                    keys, algorithm, payload_encoded, serialization,
+                    unprotected_header, protected_header)):
+            if serialization is Serialization.COMPACT:
+                parts.extend((protected_header_encoded, b".", payload_encoded,
+                              b".", signature_encoded))
+                continue
+            if serialization is Serialization.FLATTENED_JSON:
+                parts.extend((b'{"payload":"', payload_encoded, b'",'))
+            else:
+                parts.append(b',{' if index else b'{')
+            parts.extend((b'"protected":"', protected_header_encoded, b'"',
+                          header_member, b',"signature":"',
+                          signature_encoded, b'"}'))
+        if serialization is Serialization.GENERAL_JSON:
+            parts.append(b"]}")
+
+        written = 0
+        for part in parts:
+            write(part)
+            written += len(part)
+        return written
+
+    def add_signature(
+            self, jws: Dict, key: Key, algorithm: DigitalSignatureAlgorithm,
+            unprotected_header: Union[Dict, UnprotectedHeader] = None,
+            protected_header: Union[Dict, ProtectedHeader] = None) -> Dict:
+        """
+        Returns a JWS General JSON Serialization with the signatures of the
+        General or Flattened JSON Serialization jws and a signature by key.
+        The encoded payload is signed as it is, without decoding it, so only
+        one MAC is calculated. Headers are treated as they are by sign.
+        """
+        if not isinstance(jws, dict) or not isinstance(jws.get("payload"),
+                                                       str):
+            raise ValueError("Invalid JWS: JSON Serialization required!")
+        signatures = self.__get_json_signatures(jws)
+        keys = self.__get_signing_keys(KeySet([key]), algorithm,
+                                       Serialization.GENERAL_JSON)
+        for protected_header_encoded, current_unprotected_header, \
+                signature_encoded in self.__sign_each(
+                    keys, algorithm, jws["payload"].encode("ascii"),
+                    Serialization.GENERAL_JSON, unprotected_header,
+                    protected_header):
+            signature = {"protected": protected_header_encoded.decode("ascii"),
+                         "header": current_unprotected_header,
+                         "signature": signature_encoded.decode("ascii")}
+            if len(current_unprotected_header) == 0:
+                del signature["header"]
+            signatures.append(signature)
+        return {"payload": jws["payload"], "signatures": signatures}
+
+    @staticmethod
+    def __get_json_signatures(jws: Dict) -> List[Dict]:
+        if "signatures" in jws:
+            signatures = jws["signatures"]
+            if not isinstance(signatures, list) or len(signatures) == 0:
+                raise ValueError("Unable to properly parse JWS")
+            signatures = list(signatures)
         else:
+            signatures = [{name: value for name, value in jws.items()
+                           if name != "payload"}]
+        if not all(isinstance(signature, dict)
+                   and isinstance(signature.get("signature"), str)
+                   for signature in signatures):
+            raise ValueError("Unable to properly parse JWS")
+        return signatures
+
+    @staticmethod
+    def remove_signature(jws: Dict, kid: str) -> Dict:
+        """
+        Returns the JWS General JSON Serialization jws without the
+        signatures whose kid, in the unprotected or protected header, is kid.
+        Raises ValueError if there is no such signature.
+        """
+        if not isinstance(jws, dict) or not isinstance(jws.get("signatures"),
+                                                       list):
+            raise ValueError("Invalid JWS: General JSON Serialization "
+                             "required!")
+        signatures = [signature for signature in jws["signatures"]
+                      if JWS.__get_kid(signature) != kid]
+        if len(signatures) == len(jws["signatures"]):
+            raise ValueError("JWS has no signature with the kid!")
+        return {"payload": jws["payload"], "signatures": signatures}
+
+    @staticmethod
+    def convert(jws: Union[str, bytes, Dict], serialization: Serialization,
+                kid: str = None, discard_unprotected_header: bool = False
+                ) -> Union[str, Dict]:
+        """
+        Returns jws, in any serialization, in the serialization given. The
+        encoded protected headers, payload and signatures are rearranged as
+        they are, nothing is decoded, re-encoded or signed and the JWS is not
+        verified. When kid is given only the signature whose kid, in the
+        unprotected or protected header, is kid is kept, otherwise only the
+        General JSON Serialization can hold more than one signature. The
+        Compact Serialization cannot carry an unprotected header, converting
+        a signature with one to it raises ValueError unless
+        discard_unprotected_header is True.
+        """
+        if isinstance(jws, bytes):
+            jws = jws.decode("utf-8")
+        if isinstance(jws, str) and jws.lstrip()[:1] == "{":
             try:
-                jws_obj = json_loads(jws)
-                if "signatures" in jws_obj:
-                    jws_dict = jws_obj
-                else:  # JKS Flattened JSON
-                    jws_dict["payload"] = jws_obj["payload"]
-                    jws_dict["signatures"].append({
-                        "protected": jws_obj["protected"],
-                        "signature": jws_obj["signature"]
-                    })
-            except (KeyError, JSONDecodeError):
+                jws = json_loads(jws)
+            except (JSONDecodeError, RecursionError):
+                raise ValueError("Unable to properly parse JWS")
+        if isinstance(jws, str):
+            segments = jws.strip().split(".")
+            if len(segments) != 3:
                 raise ValueError("Unable to properly parse JWS")
+            payload = segments[1]
+            signatures = [{"protected": segments[0],
+                           "signature": segments[2]}]
+        elif isinstance(jws, dict):
+            payload = jws.get("payload")
+            signatures = JWS.__get_json_signatures(jws)
+        else:
+            raise ValueError("Unable to properly parse JWS")
+        if not isinstance(payload, str):
+            raise ValueError("Unable to properly parse JWS")
+
+        if kid is not None:
+            signatures = [signature for signature in signatures
+                          if JWS.__get_kid(signature) == kid]
+            if len(signatures) == 0:
+                raise ValueError("JWS has no signature with the kid!")
+        if serialization is Serialization.GENERAL_JSON:
+            return {"payload": payload, "signatures": signatures}
+        if len(signatures) > 1:
+            raise ValueError("JWS has more than one signature, a kid is "
+                             "required!")
+        signature = signatures[0]
+        if serialization is Serialization.FLATTENED_JSON:
+            flattened = {"payload": payload}
+            flattened.update(signature)
+            return flattened
+        elif serialization is Serialization.COMPACT:
+            if signature.get("header") and not discard_unprotected_header:
+                raise ValueError("JWS Compact serialization cannot carry an "
+                                 "unprotected header!")
+            if not isinstance(signature.get("protected"), str):
+                raise ValueError("JWS Compact serialization requires a "
+                                 "protected header!")
+            return signature["protected"] + "." + payload + "." \
+                + signature["signature"]
+        else:
+            raise NotImplementedError("Serialization not implemented!")
+
+    @staticmethod
+    def __get_kid(signature: Dict) -> Optional[str]:
+        """
+        Returns the kid of the unprotected header of a signature entry or,
+        when it has none, of its protected header
+        """
+        header = signature.get("header") or {}
+        if "kid" not in header:
+            try:
+                header = json_loads(base64_url_decode(
+                    signature["protected"]))
+            except (KeyError, ValueError):
+                raise ValueError("Invalid JWS: Unable to parse header!")
+        if not isinstance(header, dict):
+            return None
+        return header.get("kid")
+
+    @staticmethod
+    def __get_signing_keys(key_set: KeySet,
+                           algorithm: DigitalSignatureAlgorithm,
+                           serialization: Serialization) -> Collection[Key]:
+        keys: Collection[Key] = get_signing_keys(key_set, algorithm)
+        if len(keys) == 0:
+            raise ValueError("No valid signing keys found!")
+        elif len(keys) > 1 and serialization is Serialization.COMPACT:
+            raise ValueError("JWS Compact serialization cannot process"
+                             "signatures for more that one key!")
+        elif len(keys) > 1 and serialization is Serialization.FLATTENED_JSON:
+            raise ValueError("JWS Flattened JSON serialization cannot process"
+                             "signatures for more that one key!")
+        return keys
+
+    def __sign_each(self, keys: Collection[Key],
+                    algorithm: DigitalSignatureAlgorithm,
+                    payload_encoded: bytes, serialization: Serialization,
+                    unprotected_header: Union[Dict, UnprotectedHeader],
+                    protected_header: Union[Dict, ProtectedHeader]
+                    ) -> Iterator[Tuple[bytes, Dict, bytes]]:
+        """
+        Signs the payload with each key, yielding the encoded protected
+        header, the unprotected header and the encoded signature
+        """
+        memoized = isinstance(protected_header, ProtectedHeader) and (
+            unprotected_header is None
+            or isinstance(unprotected_header, UnprotectedHeader))
+        for key in keys:
+            if unprotected_header is None:
+                current_unprotected_header = {}
+            elif isinstance(unprotected_header, UnprotectedHeader):
+                current_unprotected_header = unprotected_header.parameters
+            else:
+                current_unprotected_header = deepcopy(unprotected_header)
+
+            if memoized:
+                protected_header_encoded = protected_header.encode(
+                    algorithm, key.kid,
+                    unprotected_header
+                    if serialization is Serialization.COMPACT else None
+                ).encode("ascii")
+            else:
+                current_protected_header = {"alg": algorithm.value}
+                if key.kid is not None:
+                    current_protected_header["kid"] = key.kid
+                if protected_header is not None:
+                    current_protected_header.update(protected_header)
+
+                if serialization is Serialization.COMPACT:
+                    current_protected_header.update(
+                        current_unprotected_header)
+
+                protected_header_encoded = base64_url_encode_bytes(
+                    json_dumps(current_protected_header).encode())
+            signature_bytes = self.__get_signature(
+                algorithm, key, protected_header_encoded + b"."
+                + payload_encoded)
+            yield protected_header_encoded, current_unprotected_header, \
+                base64_url_encode_bytes(signature_bytes)
+
+    def sign_compact(self, key_set: KeySet,
+                     algorithm: DigitalSignatureAlgorithm, payload: bytes,
+                     protected_header: Union[Dict, ProtectedHeader] = None
+                     ) -> bytes:
+        """
+        Produces the same JWS Compact Serialization as sign but as ASCII
+        bytes, for callers such as nested JWTs that consume bytes rather
+        than str.
+        """
+        return self.compact_signer(key_set, algorithm,
+                                   protected_header).sign(payload)
+
+    def compact_signer(self, key_set: KeySet,
+                       algorithm: DigitalSignatureAlgorithm,
+                       protected_header: Union[Dict, ProtectedHeader] = None
+                       ) -> "CompactSigner":
+        """
+        Resolves the signing key and encodes the protected header once,
+        returning a CompactSigner that signs any number of payloads with them
+        """
+        keys: Collection[Key] = get_signing_keys(key_set, algorithm)
+        if len(keys) == 0:
+            raise ValueError("No valid signing keys found!")
+        elif len(keys) > 1:
+            raise ValueError("JWS Compact serialization cannot process"
+                             "signatures for more that one key!")
+        key = keys[0]
+        if isinstance(protected_header, ProtectedHeader):
+            protected_header_encoded = protected_header.encode(
+                algorithm, key.kid).encode()
+        else:
+            current_protected_header = {"alg": algorithm.value}
+            if key.kid is not None:
+                current_protected_header["kid"] = key.kid
+            if protected_header is not None:
+                current_protected_header.update(protected_header)
+            protected_header_encoded = base64_url_encode_bytes(
+                json_dumps(current_protected_header).encode())
+        return CompactSigner(protected_header_encoded,
+                             partial(self.__get_signature, algorithm, key))
+
+    def __get_signature(self, algorithm: DigitalSignatureAlgorithm, key: Key,
+                        signing_input: bytes) -> bytes:
+        if algorithm is DigitalSignatureAlgorithm.HS256:
+            signature_bytes = self.__cryptography_module.hmac_digest(
+                HashingAlgorithm.SHA256, key.k, signing_input)
+        elif algorithm is DigitalSignatureAlgorithm.HS384:
+            signature_bytes = self.__cryptography_module.hmac_digest(
+                HashingAlgorithm.SHA384, key.k, signing_input)
+        elif algorithm is DigitalSignatureAlgorithm.HS512:
+            signature_bytes = self.__cryptography_module.hmac_digest(
+                HashingAlgorithm.SHA512, key.k, signing_input)
+        else:
+            raise NotImplementedError(
+                "The signature algorithm is not supported!")
+        return signature_bytes
+
+    def verify(self, key_set: KeySet, jws: Union[str, bytes]) -> bytes:
+        negative_cache = self.__negative_cache
+        verification_cache = self.__verification_cache
+        if negative_cache is None and verification_cache is None:
+            return self.__verify(key_set, jws)[0]
+
+        if len(jws) > self.__limits.max_token_length:
+            # Not worth hashing, the length check is cheaper than a lookup
+            return self.__verify(key_set, jws)[0]
+        jws_bytes = jws.encode("utf-8") if isinstance(jws, str) else jws
+        digest = self.__cryptography_module.digest(HashingAlgorithm.SHA256,
+                                                   jws_bytes)
+        negative_key = (key_set.version, digest)
+        if negative_cache is not None:
+            reason = negative_cache.get(negative_key)
+            if reason is not None:
+                raise InvalidJWSError(
+                    "Invalid JWS: Recently failed verification!", reason)
+        if verification_cache is not None:
+            payload = self.__get_verified_payload(key_set, jws, digest)
+            if payload is not None:
+                return payload
+        try:
+            payload, payload_encoded, key, alg, kid = self.__verify(key_set,
+                                                                    jws)
+        except InvalidJWSError as e:
+            if negative_cache is not None:
+                negative_cache.put(negative_key, e.reason)
+            raise
+        except ValueError:
+            if negative_cache is not None:
+                negative_cache.put(negative_key, FailureReason.MALFORMED)
+            raise
+        if verification_cache is not None \
+                and (kid is None or isinstance(kid, str)):
+            if not isinstance(jws, str):
+                jws = jws.decode("utf-8")
+            # A JSON payload member written with escapes is not found
+            # verbatim and is not cached
+            payload_offset = jws.find(payload_encoded)
+            if payload_offset >= 0:
+                verification_cache.put(digest, VerifiedToken(
+                    self.__get_key_digest(key), alg, kid, payload_offset,
+                    len(payload_encoded)))
+        return payload
+
+    def __get_verified_payload(self, key_set: KeySet, jws: Union[str, bytes],
+                               digest: bytes) -> Optional[bytes]:
+        verified_token = self.__verification_cache.get(digest)
+        if verified_token is None:
+            return None
+        algorithm = DigitalSignatureAlgorithm.from_value(
+            verified_token.algorithm)
+        allowed_algorithms = self.__limits.allowed_algorithms
+        if allowed_algorithms is not None \
+                and algorithm not in allowed_algorithms:
+            return None
+        if verified_token.kid is not None:
+            key = key_set.get_key_by_id(verified_token.kid)
+            keys = [] if key is None else [key]
+        else:
+            keys = get_verifying_keys(key_set, algorithm)
+        for key in keys:
+            if self.__get_key_digest(key) == verified_token.key_digest:
+                if not isinstance(jws, str):
+                    jws = jws.decode("utf-8")
+                start = verified_token.payload_offset
+                return base64_url_decode(
+                    jws[start:start + verified_token.payload_length])
+        return None
+
+    def __get_key_digest(self, key: Key) -> bytes:
+        key_digest = self.__key_digests.get(key)
+        if key_digest is None:
+            key_digest = self.__cryptography_module.digest(
+                HashingAlgorithm.SHA256,
+                json_dumps(key.to_dict()).encode("utf-8"))
+            self.__key_digests.put(key, key_digest)
+        return key_digest
+
+    def __verify(self, key_set: KeySet, jws: Union[str, bytes]
+                 ) -> Tuple[bytes, str, Key, str, Optional[str]]:
+        """
+        Returns the payload, the encoded payload, the key that verified the
+        signature and the alg and kid of the signature
+        """
+        if len(jws) > self.__limits.max_token_length:
+            raise InvalidJWSError("Invalid JWS: Exceeds the maximum length!",
+                                  FailureReason.LIMIT_EXCEEDED)
+        if not isinstance(jws, str):
+            jws = jws.decode("utf-8")
+        # Munge all data types into a JWS General JSON Object
+        jws_dict = self.__scan(jws)
 
         # Now that the data is standardized, validate the signatures
         payload = jws_dict["payload"]
-        signature_entries: List[Dict] = jws_dict["signatures"]
+        for signature_entry in jws_dict["signatures"]:
+            alg, kid, algorithm, keys, signing_input, signature_bytes = \
+                self.__prepare_signature(key_set, payload, signature_entry,
+                                         strict=True)
+            key = self.__check_signature(algorithm, keys, signing_input,
+                                         signature_bytes)
+            if key is not None:
+                return base64_url_decode(payload), payload, key, alg, kid
+        raise InvalidJWSError("Invalid JWS: Could not validate signature!",
+                              FailureReason.INVALID_SIGNATURE)
+
+    def verify_with_policy(self, key_set: KeySet, jws: Union[str, bytes],
+                           policy: "VerificationPolicy",
+                           executor: "Executor" = None
+                           ) -> "VerificationResult":
+        """
+        Verifies the signatures of the JWS until the policy is decided,
+        returning the payload and which signatures were found valid or
+        raising InvalidJWSError if the policy rejects them. A signature with
+        an algorithm that is not allowed, or without a key, is invalid. When
+        an executor is provided, signatures are verified concurrently in it
+        and those still pending when the policy is decided are cancelled.
+        Signatures the policy does not require are not checked. The caches
+        of this JWS are not used.
+        """
+        if len(jws) > self.__limits.max_token_length:
+            raise InvalidJWSError("Invalid JWS: Exceeds the maximum length!",
+                                  FailureReason.LIMIT_EXCEEDED)
+        if not isinstance(jws, str):
+            jws = jws.decode("utf-8")
+        jws_dict = self.__scan(jws)
+        payload = jws_dict["payload"]
+        prepared = [self.__prepare_signature(key_set, payload,
+                                             signature_entry, strict=False)
+                    for signature_entry in jws_dict["signatures"]]
+        kids = [kid for _, kid, _, _, _, _ in prepared]
+        required = [(index, signature)
+                    for index, (_, kid, *signature) in enumerate(prepared)
+                    if policy.requires(kid)]
+
+        results: Dict[int, bool] = {}
+        keys: Dict[int, Key] = {}
+        decision = policy.decide(kids, results, keys)
+        if executor is None:
+            for index, signature in required:
+                if decision is not None:
+                    break
+                key = self.__check_signature(*signature)
+                results[index] = key is not None
+                if key is not None:
+                    keys[index] = key
+                decision = policy.decide(kids, results, keys)
+        elif decision is None:
+            from concurrent.futures import as_completed
+            futures = {executor.submit(self.__check_signature, *signature):
+                       index for index, signature in required}
+            try:
+                for future in as_completed(futures):
+                    key = future.result()
+                    results[futures[future]] = key is not None
+                    if key is not None:
+                        keys[futures[future]] = key
+                    decision = policy.decide(kids, results, keys)
+                    if decision is not None:
+                        break
+            finally:
+                for future in futures:
+                    future.cancel()
+        if not decision:
+            raise InvalidJWSError(
+                "Invalid JWS: Signatures do not satisfy the policy!",
+                FailureReason.INVALID_SIGNATURE)
+        return VerificationResult(
+            base64_url_decode(payload), kids,
+            sorted(index for index, valid in results.items() if valid),
+            sorted(index for index, valid in results.items() if not valid))
+
+    def verify_stream(self, key_set: KeySet, jws: BinaryIO, output: BinaryIO,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """
+        Verifies the JWS Flattened or General JSON Serialization read from
+        the jws file object in chunks of chunk_size bytes, writing the
+        decoded payload to the output file object as it is read so that
+        memory use is independent of the payload size. The payload is MACed
+        as it is read when the protected headers precede it, otherwise it is
+        spooled to a temporary file and MACed once they have been read. The
+        signature can only be verified after all of the payload has been
+        read, if ValueError is raised anything already written to output
+        must be discarded. The max_token_length limit and the caches of this
+        JWS are not used.
+        """
+        limits = self.__limits
+        max_header_length = limits.max_encoded_header_length \
+            + MAX_HEADER_LENGTH
+        reader = JSONObjectReader(iter(partial(jws.read, chunk_size), b""))
+        members = {}
+        contexts = spool = None
+        name = reader.next_name()
+        while name is not None:
+            if name in members:
+                raise ValueError("Unable to properly parse JWS")
+            elif name == "payload":
+                if "protected" in members or "signatures" in members:
+                    signature_entries = self.__get_signature_entries(members)
+                    contexts = self.__get_hmac_contexts(key_set,
+                                                        signature_entries)
+                    updates = [context.update for _, context in contexts]
+                else:
+                    spool = SpooledTemporaryFile(chunk_size)
+                    updates = [spool.write]
+                self.__read_payload(reader, updates, output)
+                members[name] = None
+            elif name == "signatures":
+                members[name] = reader.read_value(
+                    limits.max_signatures * (max_header_length + 1024))
+            else:
+                members[name] = reader.read_value(max_header_length)
+            name = reader.next_name()
+        if "payload" not in members:
+            raise ValueError("Unable to properly parse JWS")
+
+        signature_entries = self.__get_signature_entries(members)
+        if contexts is None:
+            contexts = self.__get_hmac_contexts(key_set, signature_entries)
+            spool.seek(0)
+            for chunk in iter(partial(spool.read, chunk_size), b""):
+                for _, context in contexts:
+                    context.update(chunk)
+            spool.close()
+        signatures = []
         for signature_entry in signature_entries:
-            signature_bytes = base64_url_decode(signature_entry["signature"])
+            signature = signature_entry.get("signature")
+            if not isinstance(signature, str) or not is_base64_url(signature):
+                raise ValueError("Unable to properly parse JWS")
+            signatures.append(base64_url_decode(signature))
+        for index, context in contexts:
+            if compare_digest(context.digest(), signatures[index]):
+                return
+        raise InvalidJWSError("Invalid JWS: Could not validate signature!",
+                              FailureReason.INVALID_SIGNATURE)
+
+    def __get_hmac_contexts(self, key_set: KeySet, signature_entries: List
+                            ) -> List[Tuple[int, HmacContext]]:
+        """
+        Returns an HMAC context, already updated with the protected header,
+        for every candidate key of every signature entry with the index of
+        the entry
+        """
+        self.__check_protected_headers(signature_entries)
+        contexts = []
+        for index, signature_entry in enumerate(signature_entries):
             encoded_protected = signature_entry["protected"]
-            sign_string = encoded_protected + "." + payload
-            json_protected = base64_url_decode(encoded_protected)
+            _, _, algorithm, keys = self.__parse_protected(
+                key_set, encoded_protected, strict=True)
+            for key in keys:
+                context = self.__cryptography_module.hmac_context(
+                    self.__get_hashing_algorithm(algorithm), key.k)
+                context.update(encoded_protected.encode("ascii") + b".")
+                contexts.append((index, context))
+        return contexts
+
+    @staticmethod
+    def __read_payload(reader: JSONObjectReader,
+                       updates: List[Callable[[bytes], object]],
+                       output: BinaryIO) -> None:
+        decoder = Base64UrlDecoder()
+        empty = True
+        for part in reader.iter_string():
+            if not is_base64_url(part):
+                raise ValueError("Unable to properly parse JWS")
+            payload_encoded = part.encode("ascii")
+            for update in updates:
+                update(payload_encoded)
+            output.write(decoder.update(payload_encoded))
+            empty = False
+        if empty:
+            raise ValueError("Unable to properly parse JWS")
+        output.write(decoder.finalize())
+
+    def __prepare_signature(self, key_set: KeySet, payload: str,
+                            signature_entry: Dict, strict: bool) -> Tuple:
+        """
+        Parses the protected header of a signature entry, returning the alg,
+        kid, algorithm, candidate keys, signing input and signature. An
+        algorithm that is not allowed raises InvalidJWSError when strict and
+        otherwise leaves no candidate keys.
+        """
+        signature_bytes = base64_url_decode(signature_entry["signature"])
+        encoded_protected = signature_entry["protected"]
+        signing_input = (encoded_protected + "." + payload).encode("utf-8")
+        alg, kid, algorithm, keys = self.__parse_protected(
+            key_set, encoded_protected, strict)
+        return alg, kid, algorithm, keys, signing_input, signature_bytes
+
+    def __parse_protected(self, key_set: KeySet, encoded_protected: str,
+                          strict: bool) -> Tuple:
+        json_protected = base64_url_decode(encoded_protected)
+        try:
             protected = json_loads(json_protected)
-            if "alg" not in protected:
-                raise ValueError("Invalid JWS: Header has no alg entry!")
-            alg = protected["alg"]
-            algorithm = DigitalSignatureAlgorithm.from_value(alg)
-            if "kid" in protected:
-                keys = [key_set.get_key_by_id(protected["kid"])]
-            else:
-                keys = get_verifying_keys(key_set, algorithm)
+        except (JSONDecodeError, UnicodeDecodeError):
+            raise ValueError("Invalid JWS: Unable to parse header!")
+        if not isinstance(protected, dict) or "alg" not in protected:
+            raise ValueError("Invalid JWS: Header has no alg entry!")
+        alg = protected["alg"]
+        kid = protected.get("kid")
+        if "kid" in protected and not isinstance(kid, str):
+            raise InvalidJWSError("Invalid JWS: Header kid is not a string!",
+                                  FailureReason.MALFORMED)
+        algorithm = DigitalSignatureAlgorithm.from_value(alg)
+        allowed_algorithms = self.__limits.allowed_algorithms
+        if algorithm not in HMAC_ALGORITHMS:
+            if strict:
+                raise InvalidJWSError("Invalid JWS: Algorithm is not "
+                                      "supported!",
+                                      FailureReason.ALGORITHM_NOT_ALLOWED)
+            keys = []
+        elif allowed_algorithms is not None \
+                and algorithm not in allowed_algorithms:
+            if strict:
+                raise InvalidJWSError("Invalid JWS: Algorithm is not allowed!",
+                                      FailureReason.ALGORITHM_NOT_ALLOWED)
+            keys = []
+        elif "kid" in protected:
+            key = key_set.get_key_by_id(kid)
+            keys = [] if key is None else [key]
+        else:
+            keys = get_verifying_keys(key_set, algorithm)
+        return alg, kid, algorithm, keys
 
-            verified = False
-            for key in keys:
-                if algorithm is DigitalSignatureAlgorithm.HS256:
-                    if self.__cryptography_module.hmac_digest_verify(
-                            HashingAlgorithm.SHA256, key.k,
-                            sign_string.encode("utf-8"),
-                            signature_bytes):
-                        verified = True
-                        break
-                elif algorithm is DigitalSignatureAlgorithm.HS384:
-                    if self.__cryptography_module.hmac_digest_verify(
-                            HashingAlgorithm.SHA384, key.k,
-                            sign_string.encode("utf-8"),
-                            signature_bytes):
-                        verified = True
-                        break
-                elif algorithm is DigitalSignatureAlgorithm.HS512:
-                    if self.__cryptography_module.hmac_digest_verify(
-                            HashingAlgorithm.SHA512, key.k,
-                            sign_string.encode("utf-8"),
-                            signature_bytes):
-                        verified = True
-                        break
+    def __check_signature(self, algorithm: DigitalSignatureAlgorithm,
+                          keys: Collection[Key], signing_input: bytes,
+                          signature_bytes: bytes) -> Optional[Key]:
+        """
+        Returns the key the signature was verified with or None
+        """
+        for key in keys:
+            if self.__cryptography_module.hmac_digest_verify(
+                    self.__get_hashing_algorithm(algorithm), key.k,
+                    signing_input, signature_bytes):
+                return key
+        return None
+
+    @staticmethod
+    def __get_hashing_algorithm(
+            algorithm: DigitalSignatureAlgorithm) -> HashingAlgorithm:
+        if algorithm is DigitalSignatureAlgorithm.HS256:
+            return HashingAlgorithm.SHA256
+        elif algorithm is DigitalSignatureAlgorithm.HS384:
+            return HashingAlgorithm.SHA384
+        elif algorithm is DigitalSignatureAlgorithm.HS512:
+            return HashingAlgorithm.SHA512
+        else:
+            raise NotImplementedError("Algorithm is not implemented!")
+
+    def __scan(self, jws: str) -> Dict:
+        """
+        Structural validation of the serialized JWS against the limits so
+        malformed or oversized input is rejected in a single scan before any
+        base64 decoding, header parsing or MAC calculation
+        """
+        if jws[:1] == "{" or jws.lstrip()[:1] == "{":
+            jws_obj = self.__read_json_members(jws)
+            payload = jws_obj.get("payload")
+            signature_entries = self.__get_signature_entries(jws_obj)
+        else:
+            segments = jws.split(".", 3)
+            if len(segments) != 3:
+                raise ValueError("Unable to properly parse JWS")
+            payload = segments[1]
+            signature_entries = [{
+                "protected": segments[0],
+                "signature": segments[2]
+            }]
+
+        if not isinstance(payload, str) or not is_base64_url(payload):
+            raise ValueError("Unable to properly parse JWS")
+        self.__check_protected_headers(signature_entries)
+        for signature_entry in signature_entries:
+            if not isinstance(signature_entry.get("signature"), str) \
+                    or not is_base64_url(signature_entry["signature"]):
+                raise ValueError("Unable to properly parse JWS")
+        return {"payload": payload, "signatures": signature_entries}
+
+    def __read_json_members(self, jws: str) -> Dict:
+        """
+        Reads the members of a JSON serialized JWS with the same per member
+        limits as verify_stream, and at most MAX_MEMBERS members, so
+        oversized or deeply nested members are rejected without parsing the
+        rest of the input.
+        """
+        limits = self.__limits
+        max_header_length = limits.max_encoded_header_length \
+            + MAX_HEADER_LENGTH
+        chunks = self.__iter_chunks(jws)
+        members = {}
+        try:
+            reader = JSONObjectReader(chunks)
+            name = reader.next_name()
+            while name is not None:
+                if name in members:
+                    raise ValueError("Unable to properly parse JWS")
+                elif len(members) == MAX_MEMBERS:
+                    raise InvalidJWSError("Invalid JWS: Exceeds the maximum "
+                                          "number of members!",
+                                          FailureReason.LIMIT_EXCEEDED)
+                elif name == "payload":
+                    members[name] = reader.read_value(
+                        limits.max_token_length)
+                elif name == "signatures":
+                    members[name] = reader.read_value(
+                        limits.max_signatures * (max_header_length + 1024))
                 else:
-                    raise NotImplementedError("Algorithm is not implemented!")
-            if not verified:
-                raise ValueError("Invalid JWS: Could not validate signature!")
-            payload_bytes = base64_url_decode(payload)
-            return payload_bytes
\ No newline at end of file
+                    members[name] = reader.read_value(max_header_length)
+                name = reader.next_name()
+            reader.finish()
+        except RecursionError:
+            raise ValueError("Unable to properly parse JWS")
+        return members
+
+    @staticmethod
+    def __iter_chunks(jws: str) -> Iterator[str]:
+        # Doubling the chunk size bounds reparsing a value that spans chunks
+        # to a constant factor of its length
+        start = 0
+        chunk_size = DEFAULT_CHUNK_SIZE
+        while start < len(jws):
+            yield jws[start:start + chunk_size]
+            start += chunk_size
+            chunk_size *= 2
+
+    @staticmethod
+    def __get_signature_entries(jws_obj: Dict) -> List:
+        if "signatures" in jws_obj:
+            signature_entries = jws_obj["signatures"]
+            if not isinstance(signature_entries, list) \
+                    or len(signature_entries) == 0:
+                raise ValueError("Unable to properly parse JWS")
+            return signature_entries
+        # JWS Flattened JSON
+        return [{
+            "protected": jws_obj.get("protected"),
+            "signature": jws_obj.get("signature")
+        }]
+
+    def __check_protected_headers(self, signature_entries: List) -> None:
+        limits = self.__limits
+        if len(signature_entries) > limits.max_signatures:
+            raise InvalidJWSError("Invalid JWS: Exceeds the maximum number "
+                                  "of signatures!",
+                                  FailureReason.LIMIT_EXCEEDED)
+        for signature_entry in signature_entries:
+            if not isinstance(signature_entry, dict):
+                raise ValueError("Unable to properly parse JWS")
+            protected = signature_entry.get("protected")
+            if not isinstance(protected, str):
+                raise ValueError("Unable to properly parse JWS")
+            if len(protected) > limits.max_encoded_header_length:
+                raise InvalidJWSError("Invalid JWS: Header exceeds the "
+                                      "maximum length!",
+                                      FailureReason.LIMIT_EXCEEDED)
+            if not is_base64_url(protected):
+                raise ValueError("Unable to properly parse JWS")
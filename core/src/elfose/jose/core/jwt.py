@@ -1,28 +1,106 @@
 import json
-from typing import Union, Dict
+import math
+import sys
+import time
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Union, Dict, Callable, Hashable, \
+    Optional, Set
 
-from .encoding import json_dumps
-from .jwa import DigitalSignatureAlgorithm
+from json import JSONDecodeError
+
+from .cache import LRUCache
+from .encoding import json_dumps, json_loads, base64_url_encode_bytes, \
+    freeze
+from .jwa import DigitalSignatureAlgorithm, ContentEncryptionAlgorithm, \
+    ContentEncryptionKeyAlgorithm, CompressionAlgorithm
+from .header import ProtectedHeader
 from .jwk import KeySet
-from .jws import JWS, Serialization
+from .jws import CompactSigner, JWS, Serialization
+from .replay import ReplayStore
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from .jwe import JWE
+
+
+def _intern(value: str) -> str:
+    # Claims of other types in a signed token are kept, frozen, as they are
+    return sys.intern(value) if isinstance(value, str) else freeze(value)
+
 
 PrivateClaims = Union[str, bool, float, int, Dict[str, "PrivateClaims"]]
 
 
 class ClaimsSet:
+    """
+    Immutable set of claims. Claims sets are compared by value and hashed by
+    their JSON, and the issuer, subject and audience are interned as they
+    repeat across many claims sets.
+    """
+
+    __slots__ = ("__issuer", "__subject", "__audience", "__expires",
+                 "__not_before", "__issued_at", "__jwt_id",
+                 "__private_claims", "__hash")
 
     def __init__(self, *, issuer: str = None, subject: str = None,
                  audience: str = None, expires: int = None,
                  not_before: int = None, issued_at: int = None,
                  jwt_id: str = None, **private_claims: PrivateClaims) -> None:
-        self.__issuer = issuer
-        self.__subject = subject
-        self.__audience = audience
+        self.__set_claims(issuer=issuer, subject=subject, audience=audience,
+                          expires=expires, not_before=not_before,
+                          issued_at=issued_at, jwt_id=jwt_id,
+                          private_claims=private_claims)
+
+    def __set_claims(self, *, issuer=None, subject=None, audience=None,
+                     expires=None, not_before=None, issued_at=None,
+                     jwt_id=None, private_claims: Dict) -> None:
+        self.__issuer = _intern(issuer)
+        self.__subject = _intern(subject)
+        self.__audience = _intern(audience)
         self.__expires = expires
         self.__not_before = not_before
         self.__issued_at = issued_at
         self.__jwt_id = jwt_id
-        self.__private_claims = private_claims
+        self.__private_claims = freeze(private_claims)
+        self.__hash = None
+
+    @classmethod
+    def from_dict(cls, claims_set_dict: Dict) -> "ClaimsSet":
+        """
+        Creates a claims set from a JWT Claims Set JSON object. Registered
+        claims are taken only from their claim names, every other name is a
+        private claim, even one named like a keyword argument of __init__.
+        """
+        if not isinstance(claims_set_dict, dict):
+            raise ValueError("Invalid JWT: Unable to parse claims set!")
+        registered_claims = {}
+        private_claims = {}
+        for name, value in claims_set_dict.items():
+            if name in CLAIM_NAMES:
+                registered_claims[CLAIM_NAMES[name]] = value
+            else:
+                private_claims[name] = value
+        claims_set = cls.__new__(cls)
+        claims_set.__set_claims(**registered_claims,
+                                private_claims=private_claims)
+        return claims_set
+
+    def __setattr__(self, name: str, value) -> None:
+        # Attributes are only assigned by __init__ and the cached hash
+        if name != "_ClaimsSet__hash" and hasattr(self, "_ClaimsSet__hash"):
+            raise AttributeError("ClaimsSet is immutable")
+        object.__setattr__(self, name, value)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ClaimsSet):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __hash__(self) -> int:
+        if self.__hash is None:
+            self.__hash = hash(json.dumps(self.to_dict(), sort_keys=True))
+        return self.__hash
 
     @property
     def issuer(self) -> str:
@@ -56,38 +134,340 @@ class ClaimsSet:
     def private_claims(self) -> PrivateClaims:
         return self.__private_claims
 
+    def to_dict(self) -> Dict:
+        """
+        Returns the claims keyed by claim name in the order they are
+        serialized: registered claims first, then private claims
+        """
+        claims_set_dict = {}
+        if self.__issuer is not None:
+            claims_set_dict["iss"] = self.__issuer
+        if self.__subject is not None:
+            claims_set_dict["sub"] = self.__subject
+        if self.__audience is not None:
+            claims_set_dict["aud"] = self.__audience
+        if self.__expires is not None:
+            claims_set_dict["exp"] = self.__expires
+        if self.__not_before is not None:
+            claims_set_dict["nbf"] = self.__not_before
+        if self.__issued_at is not None:
+            claims_set_dict["iat"] = self.__issued_at
+        if self.__jwt_id is not None:
+            claims_set_dict["jti"] = self.__jwt_id
+        claims_set_dict.update(self.__private_claims)
+        return claims_set_dict
+
+
+JWT_PROTECTED_HEADER = ProtectedHeader(type="JWT")
+CLAIM_NAMES = {"iss": "issuer", "sub": "subject", "aud": "audience",
+               "exp": "expires", "nbf": "not_before", "iat": "issued_at",
+               "jti": "jwt_id"}
+
 
 class JWT:
-    def __init__(self, jws: JWS) -> None:
+    def __init__(self, jws: JWS, jwe: "JWE" = None,
+                 replay_store: ReplayStore = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        When a replay_store is provided, verify only accepts a JWT with a
+        jti and exp, and only the first time its jti is presented
+        """
         self.__jws = jws
+        self.__jwe = jwe
+        self.__replay_store = replay_store
+        self.__clock = clock
 
     def create(self, key_set: KeySet,
                algorithm: DigitalSignatureAlgorithm,
                claims_set: ClaimsSet,
-               serialization=Serialization.FLATTENED_JSON):
-        protected_header = {"type": "JWT"}
-        claims_set_dict = {}
-        if claims_set.issuer is not None:
-            claims_set_dict["iss"] = claims_set.issuer
-        if claims_set.subject is not None:
-            claims_set_dict["sub"] = claims_set.subject
-        if claims_set.audience is not None:
-            claims_set_dict["aud"] = claims_set.audience
-        if claims_set.expires is not None:
-            claims_set_dict["exp"] = claims_set.expires
-        if claims_set.not_before is not None:
-            claims_set_dict["nbf"] = claims_set.not_before
-        if claims_set.issued_at is not None:
-            claims_set_dict["iat"] = claims_set.issued_at
-        if claims_set.jwt_id is not None:
-            claims_set_dict["jti"] = claims_set.jwt_id
-        claims_set_dict.update(claims_set.private_claims)
-        claims_set_json = json_dumps(claims_set_dict)
-        payload = claims_set_json.encode("utf-8")
+               serialization=Serialization.FLATTENED_JSON,
+               protected_header: ProtectedHeader = JWT_PROTECTED_HEADER):
+        payload = self.__get_payload(claims_set)
         jwt = self.__jws.sign(key_set, algorithm, payload, serialization,
                               protected_header=protected_header)
         return jwt
 
-    def verify(self, expected_claims_set: ClaimsSet = None,
-               leeway_secs: int = 60):
-        pass
+    def template(self, key_set: KeySet, algorithm: DigitalSignatureAlgorithm,
+                 claims_template: ClaimsSet) -> "JWTTemplate":
+        """
+        Returns a JWTTemplate creating the same JWS Compact Serialization as
+        create for the claims template with varying exp, nbf, iat and jti
+        """
+        signer = self.__jws.compact_signer(key_set, algorithm,
+                                           JWT_PROTECTED_HEADER)
+        return JWTTemplate(signer, claims_template)
+
+    def create_nested(self, signing_key_set: KeySet,
+                      signing_algorithm: DigitalSignatureAlgorithm,
+                      claims_set: ClaimsSet,
+                      encryption_key_set: KeySet,
+                      key_algorithm: ContentEncryptionKeyAlgorithm,
+                      encryption: ContentEncryptionAlgorithm,
+                      compression: CompressionAlgorithm = None) -> str:
+        """
+        Creates a Nested JWT as described in
+        https://tools.ietf.org/html/rfc7519#section-5.2 by signing the claims
+        set in JWS Compact Serialization and encrypting the result in JWE
+        Compact Serialization with a cty of JWT. The signed JWT is built as
+        bytes and handed directly to the encryption rather than being
+        serialized to a str and encoded again.
+        """
+        if self.__jwe is None:
+            raise ValueError("A JWE is required to create a nested JWT!")
+        payload = self.__get_payload(claims_set)
+        signed = self.__jws.sign_compact(signing_key_set, signing_algorithm,
+                                         payload, JWT_PROTECTED_HEADER)
+        return self.__jwe.encrypt(encryption_key_set, key_algorithm,
+                                  encryption, signed, Serialization.COMPACT,
+                                  protected_header={"cty": "JWT"},
+                                  compression=compression)
+
+    def verify_nested(self, decryption_key_set: KeySet,
+                      verification_key_set: KeySet, jwt: str,
+                      expected_claims_set: ClaimsSet = None,
+                      leeway_secs: int = 60) -> ClaimsSet:
+        """
+        Decrypts a Nested JWT created by create_nested, verifies the signed
+        JWT it contains and its claims as verify does and returns the claims
+        set
+        """
+        if self.__jwe is None:
+            raise ValueError("A JWE is required to verify a nested JWT!")
+        protected_header, signed = self.__jwe.decrypt_with_header(
+            decryption_key_set, jwt)
+        cty = protected_header.get("cty")
+        if not isinstance(cty, str) or cty.upper() != "JWT":
+            raise ValueError("Invalid JWT: Nested JWT must have a cty of "
+                             "JWT!")
+        payload = self.__jws.verify(verification_key_set, signed)
+        return self.__verify_claims(self.__get_claims_set(payload),
+                                    expected_claims_set, leeway_secs)
+
+    @staticmethod
+    def __get_claims_set(payload: bytes) -> ClaimsSet:
+        try:
+            claims_set_dict = json_loads(payload)
+        except (JSONDecodeError, UnicodeDecodeError):
+            raise ValueError("Invalid JWT: Unable to parse claims set!")
+        return ClaimsSet.from_dict(claims_set_dict)
+
+    @staticmethod
+    def __get_payload(claims_set: ClaimsSet) -> bytes:
+        claims_set_json = json_dumps(claims_set.to_dict())
+        return claims_set_json.encode("utf-8")
+
+    def verify(self, key_set: KeySet, jwt: Union[str, bytes],
+               expected_claims_set: ClaimsSet = None,
+               leeway_secs: int = 60) -> ClaimsSet:
+        """
+        Verifies the signature of the JWT, the exp and nbf claims allowing
+        leeway_secs of clock skew, and that the iss, sub, aud, jti and
+        private claims of expected_claims_set, where provided, match. A JWT
+        may have a list of audiences, one of which must match.
+        """
+        payload = self.__jws.verify(key_set, jwt)
+        return self.__verify_claims(self.__get_claims_set(payload),
+                                    expected_claims_set, leeway_secs)
+
+    def __verify_claims(self, claims_set: ClaimsSet,
+                        expected_claims_set: Optional[ClaimsSet],
+                        leeway_secs: int) -> ClaimsSet:
+        for name in ("expires", "not_before", "issued_at"):
+            value = getattr(claims_set, name)
+            if value is not None and (
+                    isinstance(value, bool)
+                    or not isinstance(value, (int, float))
+                    or not math.isfinite(value)):
+                raise ValueError(f"Invalid JWT: {name} must be a finite "
+                                 f"number!")
+        if claims_set.jwt_id is not None \
+                and not isinstance(claims_set.jwt_id, str):
+            raise ValueError("Invalid JWT: jti must be a string!")
+        now = self.__clock()
+        if claims_set.expires is not None \
+                and now >= claims_set.expires + leeway_secs:
+            raise ValueError("Invalid JWT: Token has expired!")
+        if claims_set.not_before is not None \
+                and now < claims_set.not_before - leeway_secs:
+            raise ValueError("Invalid JWT: Token is not yet valid!")
+        if expected_claims_set is not None:
+            self.__verify_expected_claims(claims_set, expected_claims_set)
+        if self.__replay_store is not None:
+            if claims_set.jwt_id is None or claims_set.expires is None:
+                raise ValueError("Invalid JWT: jti and exp are required!")
+            if not self.__replay_store.add(claims_set.jwt_id,
+                                           claims_set.expires + leeway_secs):
+                raise ValueError("Invalid JWT: Token has already been used!")
+        return claims_set
+
+    @staticmethod
+    def __verify_expected_claims(claims_set: ClaimsSet,
+                                 expected_claims_set: ClaimsSet) -> None:
+        for name in ("issuer", "subject", "jwt_id"):
+            expected = getattr(expected_claims_set, name)
+            if expected is not None \
+                    and getattr(claims_set, name) != expected:
+                raise ValueError(f"Invalid JWT: Unexpected {name}!")
+        if expected_claims_set.audience is not None:
+            audience = claims_set.audience
+            if not isinstance(audience, list):
+                audience = [audience]
+            if expected_claims_set.audience not in audience:
+                raise ValueError("Invalid JWT: Unexpected audience!")
+        for name, expected in expected_claims_set.private_claims.items():
+            if claims_set.private_claims.get(name) != expected:
+                raise ValueError(f"Invalid JWT: Unexpected {name}!")
+
+
+class JWTTemplate:
+    """
+    Creates JWTs from a claims template where the protected header and the
+    claims other than exp, nbf, iat and jti are serialized once. As much of
+    the leading claims as is aligned to a base64 quantum is also encoded
+    once. Obtained from JWT.template.
+    """
+
+    def __init__(self, signer: CompactSigner,
+                 claims_template: ClaimsSet) -> None:
+        self.__signer = signer
+        self.__claims_template = claims_template
+        claims = claims_template.to_dict()
+        head = [self.__fragment(name, claims[name])
+                for name in ("iss", "sub", "aud") if name in claims]
+        tail = [self.__fragment(name, value) for name, value in claims.items()
+                if name not in CLAIM_NAMES]
+        head_json = b"{" + b",".join(head) + (b"," if head and tail else b"")
+        aligned = len(head_json) - len(head_json) % 3
+        self.__head_encoded = base64_url_encode_bytes(head_json[:aligned])
+        self.__head_remainder = head_json[aligned:]
+        self.__separator_before = b"," if head and not tail else b""
+        self.__separator_after = b"," if tail else b""
+        self.__tail = b",".join(tail) + b"}"
+
+    def create(self, *, expires: int = None, not_before: int = None,
+               issued_at: int = None, jwt_id: str = None) -> str:
+        """
+        Creates a JWT with the given exp, nbf, iat and jti claims, each one
+        defaulting to the value in the claims template
+        """
+        claims_template = self.__claims_template
+        variable = []
+        if expires is None:
+            expires = claims_template.expires
+        if expires is not None:
+            variable.append(self.__fragment("exp", expires))
+        if not_before is None:
+            not_before = claims_template.not_before
+        if not_before is not None:
+            variable.append(self.__fragment("nbf", not_before))
+        if issued_at is None:
+            issued_at = claims_template.issued_at
+        if issued_at is not None:
+            variable.append(self.__fragment("iat", issued_at))
+        if jwt_id is None:
+            jwt_id = claims_template.jwt_id
+        if jwt_id is not None:
+            variable.append(self.__fragment("jti", jwt_id))
+
+        if variable:
+            remainder = b"".join((
+                self.__head_remainder, self.__separator_before,
+                b",".join(variable), self.__separator_after, self.__tail))
+        else:
+            remainder = self.__head_remainder + self.__tail
+        payload_encoded = self.__head_encoded \
+            + base64_url_encode_bytes(remainder)
+        return self.__signer.sign_encoded(payload_encoded).decode("ascii")
+
+    @staticmethod
+    def __fragment(name: str, value) -> bytes:
+        return (json_dumps(name) + ":" + json_dumps(value)).encode("utf-8")
+
+
+class MintedTokenCache:
+    """
+    Reuses JWTs created by JWT.create for requests with the same key set
+    version, algorithm and claims template. The cache sets iat and exp on
+    each token it creates, exp being lifetime seconds after iat. Once
+    refresh_fraction of the lifetime has elapsed the current token is still
+    returned while a replacement is created in the background, using the
+    executor when one is provided or a daemon thread otherwise. A token is
+    only created on the calling thread when there is none or it has expired.
+    Tokens in a JSON serialization are frozen as they are shared by every
+    caller.
+    """
+
+    def __init__(self, jwt: JWT, *, lifetime: int = 300,
+                 refresh_fraction: float = 0.5, max_size: int = 1024,
+                 executor: "Executor" = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        if lifetime < 1:
+            raise ValueError("lifetime must be positive")
+        if not 0 < refresh_fraction < 1:
+            raise ValueError("refresh_fraction must be between 0 and 1")
+        self.__jwt = jwt
+        self.__lifetime = lifetime
+        self.__refresh_fraction = refresh_fraction
+        self.__executor = executor
+        self.__clock = clock
+        self.__tokens = LRUCache(max_size)
+        self.__refreshing: Set[Hashable] = set()
+        self.__lock = Lock()
+
+    def get(self, key_set: KeySet, algorithm: DigitalSignatureAlgorithm,
+            claims_template: ClaimsSet,
+            serialization: Serialization = Serialization.COMPACT):
+        if claims_template.expires is not None \
+                or claims_template.issued_at is not None:
+            raise ValueError("The claims template must not contain exp or "
+                             "iat!")
+        cache_key = (key_set.version, algorithm, serialization,
+                     claims_template)
+        entry = self.__tokens.get(cache_key)
+        now = self.__clock()
+        if entry is None or now >= entry[2]:
+            return self.__mint(cache_key, key_set, algorithm, claims_template,
+                               serialization)
+        token, refresh_at, _ = entry
+        if now >= refresh_at:
+            self.__refresh(cache_key, key_set, algorithm, claims_template,
+                           serialization)
+        return token
+
+    def clear(self) -> None:
+        self.__tokens.clear()
+
+    def __refresh(self, cache_key: Hashable, key_set: KeySet,
+                  algorithm: DigitalSignatureAlgorithm,
+                  claims_template: ClaimsSet,
+                  serialization: Serialization) -> None:
+        with self.__lock:
+            if cache_key in self.__refreshing:
+                return
+            self.__refreshing.add(cache_key)
+
+        def refresh():
+            try:
+                self.__mint(cache_key, key_set, algorithm, claims_template,
+                            serialization)
+            finally:
+                with self.__lock:
+                    self.__refreshing.discard(cache_key)
+
+        if self.__executor is None:
+            Thread(target=refresh, daemon=True).start()
+        else:
+            self.__executor.submit(refresh)
+
+    def __mint(self, cache_key: Hashable, key_set: KeySet,
+               algorithm: DigitalSignatureAlgorithm,
+               claims_template: ClaimsSet, serialization: Serialization):
+        issued_at = int(self.__clock())
+        expires = issued_at + self.__lifetime
+        claims_set = ClaimsSet.from_dict(dict(claims_template.to_dict(),
+                                              exp=expires, iat=issued_at))
+        token = freeze(self.__jwt.create(key_set, algorithm, claims_set,
+                                         serialization))
+        refresh_at = issued_at + self.__lifetime * self.__refresh_fraction
+        self.__tokens.put(cache_key, (token, refresh_at, expires))
+        return token
@@ -0,0 +1,303 @@
+"""
+Key sets for more keys than are practical to hold in a KeySet: keys stored
+in an index file which is memory-mapped, so the pages are shared by every
+process using the same file and keys are only read when they are looked up,
+and HMAC keys derived from a master secret when they are looked up.
+"""
+import mmap
+import os
+import struct
+from typing import Iterable, List, Optional
+
+from .cache import LRUCache
+from .cryptography import CryptographyModule, HashingAlgorithm, \
+    HmacContext, PreparedHmacCryptographyModule
+from .encoding import json_dumps, json_loads
+from .jwa import DigitalSignatureAlgorithm
+from .jwk import Key, KeySet, KeyType
+
+MAGIC = b"EJKI"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">4sH16sQ")
+ENTRY = struct.Struct(">QIQI")
+
+
+def write_key_index(path: str, keys: Iterable[Key]) -> None:
+    """
+    Writes the keys to an index file for MappedKeySet. Every key must have a
+    unique kid. The file is written next to path and then moved into place,
+    so processes that have the previous file open are not affected.
+    """
+    records = []
+    for key in keys:
+        if key.kid is None:
+            raise ValueError("Every key in a key index requires a kid!")
+        records.append((key.kid.encode("utf-8"),
+                        json_dumps(key.to_dict()).encode("utf-8")))
+    records.sort(key=lambda record: record[0])
+    for previous, current in zip(records, records[1:]):
+        if previous[0] == current[0]:
+            raise ValueError("Every key in a key index requires a unique "
+                             "kid!")
+
+    offset = HEADER.size + ENTRY.size * len(records)
+    entries = []
+    for kid, jwk in records:
+        entries.append(ENTRY.pack(offset, len(kid), offset + len(kid),
+                                  len(jwk)))
+        offset += len(kid) + len(jwk)
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as index_file:
+        index_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, os.urandom(16),
+                                     len(records)))
+        index_file.writelines(entries)
+        for kid, jwk in records:
+            index_file.write(kid)
+            index_file.write(jwk)
+    os.replace(temporary_path, path)
+
+
+class MappedKeySet(KeySet):
+    """
+    KeySet backed by an index file written by write_key_index. Opening the
+    file only maps it, keys are parsed when get_key_by_id finds them and the
+    cache_size most recently used keys are kept. The version is unique to
+    each file written. keys parses every key in the file, so signing or
+    verifying a JWS without a kid against a large file is expensive.
+    """
+
+    __slots__ = ("__memory", "__count", "__cache")
+
+    def __init__(self, path: str, cache_size: int = 1024) -> None:
+        with open(path, "rb") as index_file:
+            memory = mmap.mmap(index_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        if len(memory) < HEADER.size:
+            memory.close()
+            raise ValueError("Invalid key index: File is too short!")
+        magic, format_version, identity, count = HEADER.unpack_from(memory)
+        if magic != MAGIC or format_version != FORMAT_VERSION \
+                or len(memory) < HEADER.size + count * ENTRY.size:
+            memory.close()
+            raise ValueError("Invalid key index: Unsupported format!")
+        super().__init__((), version=identity)
+        self.__memory = memory
+        self.__count = count
+        self.__cache = LRUCache(cache_size)
+
+    @property
+    def keys(self) -> List[Key]:
+        return [self.__get_key(index) for index in range(self.__count)]
+
+    def get_key_by_id(self, kid) -> Optional[Key]:
+        if not isinstance(kid, str):
+            return None
+        key = self.__cache.get(kid)
+        if key is None:
+            index = self.__find(kid.encode("utf-8"))
+            if index is None:
+                return None
+            key = self.__get_key(index)
+            self.__cache.put(kid, key)
+        return key
+
+    def close(self) -> None:
+        self.__memory.close()
+
+    def __enter__(self) -> "MappedKeySet":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __find(self, kid: bytes) -> Optional[int]:
+        memory = self.__memory
+        low, high = 0, self.__count
+        while low < high:
+            middle = (low + high) // 2
+            kid_offset, kid_length, _, _ = ENTRY.unpack_from(
+                memory, HEADER.size + middle * ENTRY.size)
+            candidate = memory[kid_offset:kid_offset + kid_length]
+            if candidate < kid:
+                low = middle + 1
+            elif candidate > kid:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def __get_key(self, index: int) -> Key:
+        _, _, jwk_offset, jwk_length = ENTRY.unpack_from(
+            self.__memory, HEADER.size + index * ENTRY.size)
+        jwk = self.__memory[jwk_offset:jwk_offset + jwk_length]
+        return Key.from_dict(json_loads(jwk))
+
+
+DERIVED_KEY_HASHING_ALGORITHMS = {
+    DigitalSignatureAlgorithm.HS256: HashingAlgorithm.SHA256,
+    DigitalSignatureAlgorithm.HS384: HashingAlgorithm.SHA384,
+    DigitalSignatureAlgorithm.HS512: HashingAlgorithm.SHA512,
+}
+DERIVED_KEY_INFO = b"elfose-jose tenant key"
+
+
+def hkdf(cryptography_module: CryptographyModule,
+         hashing_algorithm: HashingAlgorithm, key_material: bytes,
+         salt: bytes, info: bytes, length: int) -> bytes:
+    """
+    HKDF as specified in https://tools.ietf.org/html/rfc5869
+    """
+    pseudorandom_key = _hkdf_extract(cryptography_module, hashing_algorithm,
+                                      key_material, salt)
+    return _hkdf_expand(
+        cryptography_module.hmac_context(hashing_algorithm, pseudorandom_key),
+        info, length)
+
+
+def _hkdf_extract(cryptography_module: CryptographyModule,
+                   hashing_algorithm: HashingAlgorithm, key_material: bytes,
+                   salt: bytes) -> bytes:
+    if not salt:
+        salt = bytes(len(cryptography_module.digest(hashing_algorithm, b"")))
+    return cryptography_module.hmac_digest(hashing_algorithm, salt,
+                                           key_material)
+
+
+def _hkdf_expand(prepared_context: HmacContext, info: bytes,
+                  length: int) -> bytes:
+    """
+    prepared_context is an HMAC context updated with nothing but the
+    pseudorandom key, it is copied and left unchanged
+    """
+    derived = b""
+    block = b""
+    counter = 1
+    while len(derived) < length:
+        if counter > 255:
+            raise ValueError("HKDF length is too large!")
+        context = prepared_context.copy()
+        context.update(block + info + bytes((counter,)))
+        block = context.digest()
+        derived += block
+        counter += 1
+    return derived[:length]
+
+
+class DerivedKeySet(KeySet):
+    """
+    KeySet of HMAC keys for any number of tenants, derived with HKDF from
+    master_secret when they are looked up rather than stored. The key of a
+    tenant for an epoch has the kid "<tenant>/<epoch>" and is as long as the
+    hash of algorithm. Changing the master secret or salt changes every key,
+    increasing epoch rotates the keys of every tenant while keys of the
+    previous_epochs before it are still found for verification.
+
+    Keys are not enumerable, so keys is empty: sign with the KeySet returned
+    by for_tenant and verify JWS with a kid. The cache_size most recently
+    used keys are kept, and a JWS created with cryptography_module keeps
+    their prepared HMAC contexts for as many keys.
+    """
+
+    __slots__ = ("__algorithm", "__hashing_algorithm", "__epoch",
+                 "__previous_epochs", "__prepared_context", "__key_length",
+                 "__cache",
+                 "__cryptography_module")
+
+    def __init__(self, cryptography_module: CryptographyModule,
+                 master_secret: bytes, *,
+                 algorithm: DigitalSignatureAlgorithm =
+                 DigitalSignatureAlgorithm.HS256,
+                 epoch: int = 0, previous_epochs: int = 1, salt: bytes = b"",
+                 cache_size: int = 1024) -> None:
+        hashing_algorithm = DERIVED_KEY_HASHING_ALGORITHMS.get(algorithm)
+        if hashing_algorithm is None:
+            raise ValueError("Derived keys require an HMAC algorithm!")
+        if not isinstance(epoch, int) or epoch < 0:
+            raise ValueError("Epoch must be a non-negative integer!")
+        if not isinstance(previous_epochs, int) or previous_epochs < 0:
+            raise ValueError("Previous epochs must be a non-negative "
+                             "integer!")
+        if len(master_secret) < 16:
+            raise ValueError("Master secret must be at least 16 bytes!")
+        super().__init__(())
+        self.__algorithm = algorithm
+        self.__hashing_algorithm = hashing_algorithm
+        self.__epoch = epoch
+        self.__previous_epochs = previous_epochs
+        self.__prepared_context = cryptography_module.hmac_context(
+            hashing_algorithm,
+            _hkdf_extract(cryptography_module, hashing_algorithm,
+                           master_secret, salt))
+        self.__key_length = len(cryptography_module.digest(hashing_algorithm,
+                                                           b""))
+        self.__cache = LRUCache(cache_size)
+        self.__cryptography_module = PreparedHmacCryptographyModule(
+            cryptography_module, cache_size=cache_size)
+
+    @property
+    def algorithm(self) -> DigitalSignatureAlgorithm:
+        return self.__algorithm
+
+    @property
+    def epoch(self) -> int:
+        return self.__epoch
+
+    @property
+    def cryptography_module(self) -> CryptographyModule:
+        return self.__cryptography_module
+
+    def get_key(self, tenant: str, epoch: int = None) -> Key:
+        """
+        Returns the key of tenant for epoch, the current epoch by default.
+        Raises ValueError for epochs which are not accepted.
+        """
+        if not isinstance(tenant, str) or not tenant:
+            raise ValueError("Tenant must be a non-empty string!")
+        epoch = self.__epoch if epoch is None else epoch
+        if not self.__accepts(epoch):
+            raise ValueError("Epoch is not accepted!")
+        kid = f"{tenant}/{epoch}"
+        key = self.__cache.get(kid)
+        if key is None:
+            key = self.__derive(kid, tenant, epoch)
+        return key
+
+    def for_tenant(self, tenant: str) -> KeySet:
+        """
+        Returns a KeySet holding the key of tenant for the current epoch, to
+        sign with
+        """
+        return KeySet((self.get_key(tenant),))
+
+    def get_key_by_id(self, kid) -> Optional[Key]:
+        if not isinstance(kid, str):
+            return None
+        key = self.__cache.get(kid)
+        if key is None:
+            tenant, _, encoded_epoch = kid.rpartition("/")
+            if not tenant or not encoded_epoch.isdecimal() \
+                    or str(int(encoded_epoch)) != encoded_epoch:
+                return None
+            epoch = int(encoded_epoch)
+            if not self.__accepts(epoch):
+                return None
+            key = self.__derive(kid, tenant, epoch)
+        return key
+
+    def __accepts(self, epoch) -> bool:
+        return isinstance(epoch, int) \
+            and self.__epoch - self.__previous_epochs <= epoch <= self.__epoch
+
+    def __derive(self, kid: str, tenant: str, epoch: int) -> Key:
+        encoded_tenant = tenant.encode("utf-8")
+        info = DERIVED_KEY_INFO + struct.pack(">I", len(encoded_tenant)) \
+            + encoded_tenant + struct.pack(">Q", epoch)
+        key = Key(KeyType.oct, kid=kid, alg=self.__algorithm,
+                  k=_hkdf_expand(self.__prepared_context, info,
+                                 self.__key_length))
+        self.__cache.put(kid, key)
+        return key
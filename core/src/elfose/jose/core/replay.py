@@ -0,0 +1,209 @@
+import hashlib
+import math
+import mmap
+import struct
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional, Union
+
+FINGERPRINT_LENGTH = 16
+SEGMENT_HEADER = struct.Struct(">q")
+
+
+def _fingerprint(jti: str) -> bytes:
+    return hashlib.blake2b(jti.encode("utf-8"),
+                           digest_size=FINGERPRINT_LENGTH).digest()
+
+
+class ReplayStore:
+    """
+    Records the jti of JWTs that have been accepted so that they can only be
+    used once. A jti is tracked until the exp of its JWT has passed, which
+    is when JWT.verify stops accepting the JWT anyway. A replayed JWT carries
+    the same exp, so stores identify a JWT by its jti within the time bucket
+    of its exp.
+    """
+
+    def add(self, jti: str, expires: int) -> bool:
+        """
+        Records the jti and returns True, or returns False if the jti has
+        already been recorded for a JWT that has not yet expired
+        """
+        raise NotImplementedError
+
+
+class BloomFilter:
+    """
+    Probabilistic set of fingerprints sized so that the rate of false
+    positives stays at or below false_positive_rate until capacity distinct
+    fingerprints have been added. Never gives false negatives.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1")
+        bits = math.ceil(-capacity * math.log(false_positive_rate)
+                         / math.log(2) ** 2)
+        self.__bits = bits
+        self.__hashes = max(1, round(bits / capacity * math.log(2)))
+        self.__array = bytearray((bits + 7) // 8)
+
+    @property
+    def size(self) -> int:
+        return len(self.__array)
+
+    def add(self, fingerprint: bytes) -> bool:
+        """
+        Adds the fingerprint and returns True if it was probably already
+        present
+        """
+        # Double hashing from the two halves of the fingerprint
+        h1 = int.from_bytes(fingerprint[:8], "big")
+        h2 = int.from_bytes(fingerprint[8:16], "big") | 1
+        array = self.__array
+        present = True
+        for i in range(self.__hashes):
+            bit = (h1 + i * h2) % self.__bits
+            index = bit >> 3
+            mask = 1 << (bit & 7)
+            if not array[index] & mask:
+                present = False
+                array[index] |= mask
+        return present
+
+
+class MemoryReplayStore(ReplayStore):
+    """
+    Replay store for a single process. jti values are kept in one set per
+    bucket_seconds of exp and a whole bucket is dropped once every exp it
+    covers has passed, so memory is proportional to the number of unexpired
+    JWTs. When false_positive_rate is given each bucket is instead a
+    BloomFilter sized for bucket_capacity JWTs, which bounds memory at the
+    cost of rejecting that fraction of fresh JWTs as replays.
+    """
+
+    def __init__(self, *, bucket_seconds: int = 60,
+                 false_positive_rate: float = None,
+                 bucket_capacity: int = 100000,
+                 clock: Callable[[], float] = time.time) -> None:
+        if bucket_seconds < 1:
+            raise ValueError("bucket_seconds must be positive")
+        self.__bucket_seconds = bucket_seconds
+        self.__false_positive_rate = false_positive_rate
+        self.__bucket_capacity = bucket_capacity
+        self.__clock = clock
+        self.__buckets: Dict[int, Union[set, BloomFilter]] = {}
+        self.__oldest_bucket: Optional[int] = None
+        self.__lock = Lock()
+
+    def add(self, jti: str, expires: int) -> bool:
+        now = self.__clock()
+        if expires <= now:
+            return True
+        fingerprint = _fingerprint(jti)
+        index = expires // self.__bucket_seconds
+        with self.__lock:
+            self.__drop_expired_buckets(now)
+            bucket = self.__buckets.get(index)
+            if bucket is None:
+                if self.__false_positive_rate is None:
+                    bucket = set()
+                else:
+                    bucket = BloomFilter(self.__bucket_capacity,
+                                         self.__false_positive_rate)
+                self.__buckets[index] = bucket
+                if self.__oldest_bucket is None \
+                        or index < self.__oldest_bucket:
+                    self.__oldest_bucket = index
+            if isinstance(bucket, BloomFilter):
+                return not bucket.add(fingerprint)
+            if fingerprint in bucket:
+                return False
+            bucket.add(fingerprint)
+            return True
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return sum(len(bucket) for bucket in self.__buckets.values()
+                       if isinstance(bucket, set))
+
+    def __drop_expired_buckets(self, now: float) -> None:
+        current = int(now // self.__bucket_seconds)
+        if self.__oldest_bucket is None or self.__oldest_bucket >= current:
+            return
+        for index in [index for index in self.__buckets if index < current]:
+            del self.__buckets[index]
+        self.__oldest_bucket = min(self.__buckets, default=None)
+
+
+class SharedMemoryReplayStore(ReplayStore):
+    """
+    Replay store shared by processes forked after it is created, such as
+    pre-fork web server workers. Memory is a fixed size anonymous shared
+    mapping of segments, each one an open addressing table of jti
+    fingerprints for a bucket_seconds range of exp. A segment is cleared for
+    reuse once every exp it covers has passed, so segments should be at
+    least the longest JWT lifetime divided by bucket_seconds, plus one. add
+    raises ValueError when the segment for an exp is full or still in use by
+    an unexpired range.
+    """
+
+    def __init__(self, *, segments: int = 16, segment_capacity: int = 65536,
+                 bucket_seconds: int = 60,
+                 clock: Callable[[], float] = time.time) -> None:
+        if segments < 2 or segment_capacity < 1 or bucket_seconds < 1:
+            raise ValueError("segments, segment_capacity and bucket_seconds "
+                             "must be positive")
+        self.__segments = segments
+        self.__slots = segment_capacity
+        self.__segment_length = SEGMENT_HEADER.size \
+            + segment_capacity * FINGERPRINT_LENGTH
+        self.__bucket_seconds = bucket_seconds
+        self.__clock = clock
+        self.__memory = mmap.mmap(-1, segments * self.__segment_length)
+        for segment in range(segments):
+            SEGMENT_HEADER.pack_into(self.__memory,
+                                     segment * self.__segment_length, -1)
+        from multiprocessing import Lock as ProcessLock
+        self.__lock = ProcessLock()
+
+    @property
+    def size(self) -> int:
+        return len(self.__memory)
+
+    def add(self, jti: str, expires: int) -> bool:
+        now = self.__clock()
+        if expires <= now:
+            return True
+        # A fingerprint is never all zero bytes, which marks an empty slot
+        fingerprint = bytearray(_fingerprint(jti))
+        fingerprint[0] |= 1
+        index = expires // self.__bucket_seconds
+        offset = (index % self.__segments) * self.__segment_length
+        memory = self.__memory
+        with self.__lock:
+            segment_index, = SEGMENT_HEADER.unpack_from(memory, offset)
+            if segment_index != index:
+                if segment_index >= 0 and (segment_index + 1) \
+                        * self.__bucket_seconds > now:
+                    raise ValueError("Replay store has no segment for exp!")
+                memory[offset:offset + self.__segment_length] = \
+                    bytes(self.__segment_length)
+                SEGMENT_HEADER.pack_into(memory, offset, index)
+            slots_offset = offset + SEGMENT_HEADER.size
+            slot = int.from_bytes(fingerprint[-8:], "big") % self.__slots
+            for _ in range(self.__slots):
+                start = slots_offset + slot * FINGERPRINT_LENGTH
+                stored = memory[start:start + FINGERPRINT_LENGTH]
+                if stored == fingerprint:
+                    return False
+                if stored[0] == 0:
+                    memory[start:start + FINGERPRINT_LENGTH] = fingerprint
+                    return True
+                slot = (slot + 1) % self.__slots
+        raise ValueError("Replay store segment is full!")
+
+    def close(self) -> None:
+        self.__memory.close()
@@ -0,0 +1,199 @@
+"""
+ASGI and WSGI middleware verifying the bearer token of requests as a JWT.
+The token is taken from the raw Authorization header without decoding it
+and the request is given a BearerToken under the elfose.jose.token key of
+the ASGI scope or WSGI environ, which verifies the token when its claims set
+is first read and keeps the result.
+"""
+import time
+from typing import Callable, Optional, Union
+
+from ..core.cache import LRUCache
+from ..core.jwk import KeySet
+from ..core.jwt import ClaimsSet, JWT
+
+SCOPE_KEY = "elfose.jose.token"
+AUTHORIZATION = b"authorization"
+CHALLENGE = b"Bearer"
+INVALID_TOKEN_CHALLENGE = b'Bearer error="invalid_token"'
+
+
+def bearer_token(
+        authorization: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+    """
+    Returns the token of a Bearer Authorization header value, in the type it
+    was given, or None if it is not a bearer token
+    """
+    scheme = authorization[:7].lower()
+    if scheme != b"bearer " and scheme != "bearer ":
+        return None
+    token = authorization[7:].strip()
+    return token if token else None
+
+
+class BearerTokenVerifier:
+    """
+    Verifies bearer tokens with JWT.verify for one worker process. Limits
+    and caches of the JWS used by jwt, such as a negative cache or a shared
+    verification cache, apply. The claims sets of the cache_size most
+    recently verified tokens are kept and returned until they expire, 0
+    disables this cache. A JWT with a replay store must not be used with the
+    cache, as a cached token is accepted again.
+    """
+
+    def __init__(self, jwt: JWT, key_set: KeySet, *,
+                 expected_claims_set: ClaimsSet = None,
+                 leeway_secs: int = 60, cache_size: int = 1024,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.__jwt = jwt
+        self.__key_set = key_set
+        self.__expected_claims_set = expected_claims_set
+        self.__leeway_secs = leeway_secs
+        self.__cache = LRUCache(cache_size) if cache_size else None
+        self.__clock = clock
+
+    def verify(self, token: Union[str, bytes]) -> ClaimsSet:
+        """
+        Returns the claims set of the token or raises ValueError if it is
+        not a valid JWT
+        """
+        cache = self.__cache
+        if cache is not None:
+            claims_set = cache.get(token)
+            if claims_set is not None:
+                if claims_set.expires is None or self.__clock() \
+                        < claims_set.expires + self.__leeway_secs:
+                    return claims_set
+                cache.pop(token)
+        claims_set = self.__jwt.verify(self.__key_set, token,
+                                       self.__expected_claims_set,
+                                       self.__leeway_secs)
+        if cache is not None:
+            cache.put(token, claims_set)
+        return claims_set
+
+
+class BearerToken:
+    """
+    Bearer token of a request, verified when claims_set is first read
+    """
+
+    __slots__ = ("__token", "__verifier", "__claims_set", "__error")
+
+    def __init__(self, token: Union[str, bytes],
+                 verifier: BearerTokenVerifier) -> None:
+        self.__token = token
+        self.__verifier = verifier
+        self.__claims_set = None
+        self.__error = None
+
+    @property
+    def token(self) -> Union[str, bytes]:
+        return self.__token
+
+    @property
+    def claims_set(self) -> ClaimsSet:
+        """
+        Claims set of the token. Raises ValueError if it is not a valid JWT,
+        whatever the token made verification fail with.
+        """
+        if self.__claims_set is None:
+            if self.__error is not None:
+                raise self.__error
+            try:
+                self.__claims_set = self.__verifier.verify(self.__token)
+            except ValueError as e:
+                self.__error = e
+                raise
+            except Exception as e:
+                # The token is supplied by the client, no failure verifying
+                # it is allowed to become a server error
+                self.__error = ValueError("Invalid JWT: Unable to verify "
+                                          "token!")
+                raise self.__error from e
+        return self.__claims_set
+
+
+class BearerTokenASGIMiddleware:
+    """
+    ASGI middleware adding the BearerToken of http and websocket requests to
+    the scope, or None when there is no bearer token. When required, a
+    request without a valid token is rejected with a 401 response, or for a
+    websocket by closing it, before the application is called.
+    """
+
+    def __init__(self, app, verifier: BearerTokenVerifier, *,
+                 required: bool = True) -> None:
+        self.__app = app
+        self.__verifier = verifier
+        self.__required = required
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" and scope["type"] != "websocket":
+            await self.__app(scope, receive, send)
+            return
+        bearer = None
+        for name, value in scope["headers"]:
+            if name == AUTHORIZATION:
+                token = bearer_token(value)
+                if token is not None:
+                    bearer = BearerToken(token, self.__verifier)
+                break
+        if self.__required:
+            challenge = _challenge(bearer)
+            if challenge is not None:
+                if scope["type"] == "websocket":
+                    await send({"type": "websocket.close", "code": 1008})
+                else:
+                    await send({"type": "http.response.start", "status": 401,
+                                "headers": [(b"www-authenticate", challenge),
+                                            (b"content-length", b"0")]})
+                    await send({"type": "http.response.body", "body": b""})
+                return
+        await self.__app(dict(scope, **{SCOPE_KEY: bearer}), receive, send)
+
+
+class BearerTokenWSGIMiddleware:
+    """
+    WSGI middleware adding the BearerToken of requests to the environ, or
+    None when there is no bearer token. When required, a request without a
+    valid token is rejected with a 401 response before the application is
+    called.
+    """
+
+    def __init__(self, app, verifier: BearerTokenVerifier, *,
+                 required: bool = True) -> None:
+        self.__app = app
+        self.__verifier = verifier
+        self.__required = required
+
+    def __call__(self, environ, start_response):
+        bearer = None
+        authorization = environ.get("HTTP_AUTHORIZATION")
+        if authorization is not None:
+            token = bearer_token(authorization)
+            if token is not None:
+                bearer = BearerToken(token, self.__verifier)
+        if self.__required:
+            challenge = _challenge(bearer)
+            if challenge is not None:
+                start_response("401 Unauthorized", [
+                    ("WWW-Authenticate", challenge.decode("ascii")),
+                    ("Content-Length", "0")])
+                return [b""]
+        environ[SCOPE_KEY] = bearer
+        return self.__app(environ, start_response)
+
+
+def _challenge(bearer: Optional[BearerToken]) -> Optional[bytes]:
+    """
+    Returns the WWW-Authenticate challenge rejecting the request or None if
+    it has a valid bearer token
+    """
+    if bearer is None:
+        return CHALLENGE
+    try:
+        bearer.claims_set
+    except ValueError:
+        return INVALID_TOKEN_CHALLENGE
+    return None
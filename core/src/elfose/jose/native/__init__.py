@@ -1,21 +1,33 @@
 import hashlib
 import hmac
+import os
 
-from ..core.cryptography import CryptographyModule as Base, HashingAlgorithm
+from ..core.cryptography import CryptographyModule as Base, HashingAlgorithm, \
+    HmacContext as BaseHmacContext
+
+
+class HmacContext(BaseHmacContext):
+    def __init__(self, hmac_) -> None:
+        self.__hmac = hmac_
+
+    def update(self, message: bytes) -> None:
+        self.__hmac.update(message)
+
+    def digest(self) -> bytes:
+        return self.__hmac.digest()
+
+    def copy(self) -> "HmacContext":
+        return HmacContext(self.__hmac.copy())
 
 
 class CryptographyModule(Base):
+    def digest(self, hashing_algorithm: HashingAlgorithm,
+               message: bytes) -> bytes:
+        return self.__get_digest_mod(hashing_algorithm)(message).digest()
+
     def hmac_digest(self, hashing_algorithm: HashingAlgorithm, key: bytes,
                     message: bytes) -> bytes:
-        if hashing_algorithm is HashingAlgorithm.SHA256:
-            digest_mod = hashlib.sha256
-        elif hashing_algorithm is HashingAlgorithm.SHA384:
-            digest_mod = hashlib.sha384
-        elif hashing_algorithm is HashingAlgorithm.SHA512:
-            digest_mod = hashlib.sha512
-        else:
-            raise NotImplementedError("Hashing algorithm not implemented!")
-
+        digest_mod = self.__get_digest_mod(hashing_algorithm)
         hmac_ = hmac.new(key, message, digestmod=digest_mod)
         digest = hmac_.digest()
         return digest
@@ -25,3 +37,30 @@ class CryptographyModule(Base):
         comparative_digest = self.hmac_digest(hashing_algorithm, key, message)
         verify = hmac.compare_digest(comparative_digest, digest)
         return verify
+
+    def hmac_context(self, hashing_algorithm: HashingAlgorithm,
+                     key: bytes) -> HmacContext:
+        digest_mod = self.__get_digest_mod(hashing_algorithm)
+        return HmacContext(hmac.new(key, digestmod=digest_mod))
+
+    def random_bytes(self, length: int) -> bytes:
+        return os.urandom(length)
+
+    def pbkdf2_hmac(self, hashing_algorithm: HashingAlgorithm,
+                    password: bytes, salt: bytes, iterations: int,
+                    length: int) -> bytes:
+        hash_name = self.__get_digest_mod(hashing_algorithm)().name
+        return hashlib.pbkdf2_hmac(hash_name, password, salt, iterations,
+                                   length)
+
+    @staticmethod
+    def __get_digest_mod(hashing_algorithm: HashingAlgorithm):
+        if hashing_algorithm is HashingAlgorithm.SHA256:
+            digest_mod = hashlib.sha256
+        elif hashing_algorithm is HashingAlgorithm.SHA384:
+            digest_mod = hashlib.sha384
+        elif hashing_algorithm is HashingAlgorithm.SHA512:
+            digest_mod = hashlib.sha512
+        else:
+            raise NotImplementedError("Hashing algorithm not implemented!")
+        return digest_mod
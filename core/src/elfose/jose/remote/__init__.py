@@ -0,0 +1,454 @@
+"""
+A CryptographyModule forwarding HMAC calculations to a signer in another
+process, such as a signing daemon holding the keys. The key bytes of the oct
+keys in a KeySet are sent to the signer with each message and may be
+references the signer resolves to the keys it holds. Concurrent requests are
+coalesced into batches, one batch in flight on each pooled connection, so
+many signatures cost one round-trip. Transports connect to the signer, a
+Unix socket transport and server and an in-process transport are included.
+"""
+import os
+import socket
+import socketserver
+import struct
+from collections import deque
+from hmac import compare_digest
+from threading import Event, Lock
+from typing import BinaryIO, Callable, Deque, Dict, List, Optional, Tuple, \
+    Union
+
+from ..core.cryptography import CryptographyModule as Base, EllipticCurve, \
+    HashingAlgorithm, HmacContext as BaseHmacContext
+
+Request = Tuple[HashingAlgorithm, bytes, bytes]
+Response = Union[bytes, str]
+
+FRAME = struct.Struct(">I")
+REQUEST = struct.Struct(">BII")
+RESPONSE = struct.Struct(">BI")
+MAX_FRAME_LENGTH = 64 * 1024 * 1024
+DIGEST = 0
+ERROR = 1
+
+
+class Transport:
+    """
+    A connection to a signer. call sends a batch of requests of hashing
+    algorithm, key and message and returns, in the same order, the HMAC
+    digest for each or the message of the error the signer raised.
+    Exceptions raised by call fail the whole batch and the transport is
+    closed and replaced.
+    """
+
+    def call(self, requests: List[Request]) -> List[Response]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class Signer:
+    """
+    Calculates the HMAC digests of batches of requests. When keys is given
+    the key of a request is the name of a key in it, otherwise the key is
+    used as it is.
+    """
+
+    def __init__(self, cryptography_module: Base,
+                 keys: Dict[bytes, bytes] = None) -> None:
+        self.__cryptography_module = cryptography_module
+        self.__keys = keys
+
+    def handle(self, requests: List[Request]) -> List[Response]:
+        responses: List[Response] = []
+        for hashing_algorithm, key, message in requests:
+            if self.__keys is not None:
+                key = self.__keys.get(key)
+                if key is None:
+                    responses.append("Unknown key!")
+                    continue
+            try:
+                responses.append(self.__cryptography_module.hmac_digest(
+                    hashing_algorithm, key, message))
+            except (ValueError, NotImplementedError) as e:
+                responses.append(str(e))
+        return responses
+
+
+class LocalTransport(Transport):
+    """
+    Calls a Signer in this process, standing in for a signer daemon
+    """
+
+    def __init__(self, signer: Signer) -> None:
+        self.__signer = signer
+
+    def call(self, requests: List[Request]) -> List[Response]:
+        return self.__signer.handle(requests)
+
+
+class UnixSocketTransport(Transport):
+    """
+    A connection to a SignerServer listening on the Unix socket at path
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(path)
+        self.__socket.settimeout(timeout)
+        self.__file = self.__socket.makefile("rwb")
+
+    def call(self, requests: List[Request]) -> List[Response]:
+        write_frame(self.__file, encode_requests(requests))
+        self.__file.flush()
+        responses = read_frame(self.__file)
+        if responses is None:
+            raise ConnectionError("Signer closed the connection!")
+        return decode_responses(responses)
+
+    def close(self) -> None:
+        self.__file.close()
+        self.__socket.close()
+
+
+class SignerServer(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    """
+    Serves a Signer on a Unix socket at path, each connection in a thread
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path: str, signer: Signer) -> None:
+        self.signer = signer
+        super().__init__(path, _SignerRequestHandler)
+
+
+class _SignerRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        while True:
+            try:
+                requests = read_frame(self.rfile)
+            except ValueError:
+                return
+            if requests is None:
+                return
+            write_frame(self.wfile, encode_responses(
+                self.server.signer.handle(decode_requests(requests))))
+            self.wfile.flush()
+
+
+def read_frame(file: BinaryIO) -> Optional[bytes]:
+    """
+    Returns the next length prefixed frame or None at the end of the file
+    """
+    prefix = file.read(FRAME.size)
+    if not prefix:
+        return None
+    if len(prefix) < FRAME.size:
+        raise ValueError("Truncated frame!")
+    length, = FRAME.unpack(prefix)
+    if length > MAX_FRAME_LENGTH:
+        raise ValueError("Frame exceeds the maximum length!")
+    frame = file.read(length)
+    if len(frame) < length:
+        raise ValueError("Truncated frame!")
+    return frame
+
+
+def write_frame(file: BinaryIO, frame: bytes) -> None:
+    file.write(FRAME.pack(len(frame)))
+    file.write(frame)
+
+
+def encode_requests(requests: List[Request]) -> bytes:
+    parts = [FRAME.pack(len(requests))]
+    for hashing_algorithm, key, message in requests:
+        parts.append(REQUEST.pack(hashing_algorithm.value, len(key),
+                                  len(message)))
+        parts.append(key)
+        parts.append(message)
+    return b"".join(parts)
+
+
+def decode_requests(data: bytes) -> List[Request]:
+    try:
+        count, = FRAME.unpack_from(data)
+        offset = FRAME.size
+        requests = []
+        for _ in range(count):
+            algorithm, key_length, message_length = REQUEST.unpack_from(
+                data, offset)
+            offset += REQUEST.size
+            key = data[offset:offset + key_length]
+            offset += key_length
+            message = data[offset:offset + message_length]
+            offset += message_length
+            requests.append((HashingAlgorithm(algorithm), key, message))
+    except (struct.error, ValueError):
+        raise ValueError("Invalid request frame!")
+    if offset != len(data):
+        raise ValueError("Invalid request frame!")
+    return requests
+
+
+def encode_responses(responses: List[Response]) -> bytes:
+    parts = [FRAME.pack(len(responses))]
+    for response in responses:
+        if isinstance(response, str):
+            response = response.encode("utf-8")
+            parts.append(RESPONSE.pack(ERROR, len(response)))
+        else:
+            parts.append(RESPONSE.pack(DIGEST, len(response)))
+        parts.append(response)
+    return b"".join(parts)
+
+
+def decode_responses(data: bytes) -> List[Response]:
+    try:
+        count, = FRAME.unpack_from(data)
+        offset = FRAME.size
+        responses: List[Response] = []
+        for _ in range(count):
+            status, length = RESPONSE.unpack_from(data, offset)
+            offset += RESPONSE.size
+            response = data[offset:offset + length]
+            offset += length
+            responses.append(response.decode("utf-8") if status == ERROR
+                             else response)
+    except (struct.error, UnicodeDecodeError):
+        raise ValueError("Invalid response frame!")
+    if offset != len(data):
+        raise ValueError("Invalid response frame!")
+    return responses
+
+
+class _PendingRequest:
+    __slots__ = ("request", "response", "error", "handoff", "done")
+
+    def __init__(self, request: Request) -> None:
+        self.request = request
+        self.response: Optional[Response] = None
+        self.error: Optional[BaseException] = None
+        self.handoff: Optional[Tuple[Optional[Transport], List]] = None
+        # Only requests that wait for a connection need an event
+        self.done: Optional[Event] = None
+
+
+class HmacContext(BaseHmacContext):
+    """
+    Collects the message so that a single request is sent by digest
+    """
+
+    def __init__(self, cryptography_module: "CryptographyModule",
+                 hashing_algorithm: HashingAlgorithm, key: bytes) -> None:
+        self.__cryptography_module = cryptography_module
+        self.__hashing_algorithm = hashing_algorithm
+        self.__key = key
+        self.__message = bytearray()
+
+    def update(self, message: bytes) -> None:
+        self.__message += message
+
+    def digest(self) -> bytes:
+        return self.__cryptography_module.hmac_digest(
+            self.__hashing_algorithm, self.__key, bytes(self.__message))
+
+    def copy(self) -> "HmacContext":
+        context = HmacContext(self.__cryptography_module,
+                              self.__hashing_algorithm, self.__key)
+        context.update(self.__message)
+        return context
+
+
+class CryptographyModule(Base):
+    """
+    Forwards HMAC calculations to a signer over transports created by
+    transport_factory. Up to connections transports are opened, lazily, and
+    each has one batch of at most max_batch_size requests in flight. A
+    request made while a connection is idle is sent by the calling thread
+    at once. Requests made while every connection is busy are queued and
+    sent together, by the thread of the first of them, as soon as a
+    connection is done with its batch, so no dispatcher thread is involved.
+    Other operations are passed to the fallback module, or raise
+    NotImplementedError without one. Errors from the signer raise
+    ValueError and transport failures raise ConnectionError.
+    """
+
+    def __init__(self, transport_factory: Callable[[], Transport], *,
+                 fallback: Base = None, connections: int = 4,
+                 max_batch_size: int = 64) -> None:
+        if not isinstance(connections, int) or connections < 1:
+            raise ValueError("connections must be a positive int")
+        if not isinstance(max_batch_size, int) or max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive int")
+        self.__transport_factory = transport_factory
+        self.__fallback = fallback
+        self.__connections = connections
+        self.__max_batch_size = max_batch_size
+        self.__lock = Lock()
+        self.__pid = os.getpid()
+        self.__queue: Deque[_PendingRequest] = deque()
+        self.__idle: List[Transport] = []
+        self.__open = 0
+
+    @property
+    def queued(self) -> int:
+        """
+        The number of requests waiting for a connection
+        """
+        return len(self.__queue)
+
+    def hmac_digest(self, hashing_algorithm: HashingAlgorithm, key: bytes,
+                    message: bytes) -> bytes:
+        pending = _PendingRequest((hashing_algorithm, key, message))
+        with self.__lock:
+            if self.__pid != os.getpid():
+                # The connections of the parent process are not used
+                self.__pid = os.getpid()
+                self.__queue = deque()
+                self.__idle = []
+                self.__open = 0
+            transport = None
+            send = True
+            if self.__idle:
+                transport = self.__idle.pop()
+            elif self.__open < self.__connections:
+                self.__open += 1
+            else:
+                pending.done = Event()
+                self.__queue.append(pending)
+                send = False
+        if send:
+            self.__send(transport, [pending])
+        while not send:
+            pending.done.wait()
+            if pending.handoff is None:
+                break
+            # A connection was handed over to send the batch this request
+            # is the first of
+            transport, batch = pending.handoff
+            pending.handoff = None
+            pending.done.clear()
+            self.__send(transport, batch)
+
+        if pending.error is not None:
+            if isinstance(pending.error, ConnectionError):
+                raise pending.error
+            raise ConnectionError("Unable to reach the signer!") \
+                from pending.error
+        if isinstance(pending.response, str):
+            raise ValueError(pending.response)
+        return pending.response
+
+    def __send(self, transport: Optional[Transport],
+               batch: List[_PendingRequest]) -> None:
+        """
+        Sends the batch, opening a transport when there is none, then hands
+        the transport over with the next batch to the thread of its first
+        request or, with nothing queued, returns it to the pool
+        """
+        try:
+            if transport is None:
+                transport = self.__transport_factory()
+            responses = transport.call([pending.request
+                                        for pending in batch])
+            if len(responses) != len(batch):
+                raise ConnectionError("Signer returned the wrong number of "
+                                      "responses!")
+            for pending, response in zip(batch, responses):
+                pending.response = response
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+            if transport is not None:
+                transport.close()
+                transport = None
+        with self.__lock:
+            queue = self.__queue
+            if queue:
+                size = min(len(queue), self.__max_batch_size)
+                successor_batch = [queue.popleft() for _ in range(size)]
+                successor_batch[0].handoff = (transport, successor_batch)
+                successor_batch[0].done.set()
+            elif transport is None:
+                self.__open -= 1
+            else:
+                self.__idle.append(transport)
+        for pending in batch:
+            if pending.done is not None:
+                pending.done.set()
+
+    def hmac_digest_verify(self, hashing_algorithm: HashingAlgorithm,
+                           key: bytes, message: bytes, digest: bytes) -> bool:
+        return compare_digest(
+            self.hmac_digest(hashing_algorithm, key, message), digest)
+
+    def hmac_context(self, hashing_algorithm: HashingAlgorithm,
+                     key: bytes) -> HmacContext:
+        return HmacContext(self, hashing_algorithm, key)
+
+    def close(self) -> None:
+        """
+        Closes the idle transports, those in use are returned to the pool
+        when their batch has been sent
+        """
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = []
+            self.__open -= len(idle)
+        for transport in idle:
+            transport.close()
+
+    def __enter__(self) -> "CryptographyModule":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __get_fallback(self) -> Base:
+        if self.__fallback is None:
+            raise NotImplementedError("Operation is not forwarded to the "
+                                      "signer!")
+        return self.__fallback
+
+    def digest(self, hashing_algorithm: HashingAlgorithm,
+               message: bytes) -> bytes:
+        return self.__get_fallback().digest(hashing_algorithm, message)
+
+    def random_bytes(self, length: int) -> bytes:
+        return self.__get_fallback().random_bytes(length)
+
+    def pbkdf2_hmac(self, hashing_algorithm: HashingAlgorithm,
+                    password: bytes, salt: bytes, iterations: int,
+                    length: int) -> bytes:
+        return self.__get_fallback().pbkdf2_hmac(
+            hashing_algorithm, password, salt, iterations, length)
+
+    def aes_cbc_encryptor(self, key: bytes, iv: bytes):
+        return self.__get_fallback().aes_cbc_encryptor(key, iv)
+
+    def aes_cbc_decryptor(self, key: bytes, iv: bytes):
+        return self.__get_fallback().aes_cbc_decryptor(key, iv)
+
+    def aes_gcm_encryptor(self, key: bytes, iv: bytes, aad: bytes):
+        return self.__get_fallback().aes_gcm_encryptor(key, iv, aad)
+
+    def aes_gcm_decryptor(self, key: bytes, iv: bytes, aad: bytes):
+        return self.__get_fallback().aes_gcm_decryptor(key, iv, aad)
+
+    def ec_generate_key_pair(
+            self, curve: EllipticCurve) -> Tuple[bytes, bytes, bytes]:
+        return self.__get_fallback().ec_generate_key_pair(curve)
+
+    def ecdh_shared_secret(self, curve: EllipticCurve, d: bytes, x: bytes,
+                           y: bytes) -> bytes:
+        return self.__get_fallback().ecdh_shared_secret(curve, d, x, y)
+
+    def aes_key_wrap(self, wrapping_key: bytes, key: bytes) -> bytes:
+        return self.__get_fallback().aes_key_wrap(wrapping_key, key)
+
+    def aes_key_unwrap(self, wrapping_key: bytes,
+                       wrapped_key: bytes) -> bytes:
+        return self.__get_fallback().aes_key_unwrap(wrapping_key, wrapped_key)
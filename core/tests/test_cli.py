@@ -0,0 +1,143 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+from elfose.jose.cli import main, Statistics
+from elfose.jose.core.encoding import base64_url_encode
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS
+
+
+class CliTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__directory = tempfile.TemporaryDirectory()
+        self.__jwks = self.__path("keys.json")
+        with open(self.__jwks, "w") as jwks_file:
+            json.dump(KeySet([Key(KeyType.oct, kid="kid",
+                                  k=b"k" * 32)]).to_dict(), jwks_file)
+        self.__payloads = self.__path("payloads.txt")
+        with open(self.__payloads, "w") as payloads_file:
+            payloads_file.write("".join(f"payload {i}\n" for i in range(20)))
+            payloads_file.write("\n")
+
+    def tearDown(self) -> None:
+        self.__directory.cleanup()
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self.__directory.name, name)
+
+    def __run(self, *argv: str):
+        errors = io.StringIO()
+        with redirect_stderr(errors):
+            exit_code = main(list(argv))
+        return exit_code, errors.getvalue()
+
+    def __records(self, name: str):
+        with open(self.__path(name)) as output:
+            return [json.loads(line) for line in output]
+
+    def test_sign_and_verify(self):
+        for workers in ("0", "2"):
+            with self.subTest(workers=workers):
+                exit_code, _ = self.__run(
+                    "sign", "--jwks", self.__jwks, "--algorithm", "HS256",
+                    "--workers", workers, "--batch-size", "3", "--output",
+                    self.__path("signed.ndjson"), self.__payloads)
+                self.assertEqual(0, exit_code)
+                signed = self.__records("signed.ndjson")
+                self.assertEqual(list(range(1, 21)),
+                                 [record["line"] for record in signed])
+                with open(self.__path("tokens.txt"), "w") as tokens_file:
+                    tokens_file.writelines(record["token"] + "\n"
+                                           for record in signed)
+
+                exit_code, report = self.__run(
+                    "verify", "--jwks", self.__jwks, "--workers", workers,
+                    "--batch-size", "3", "--output",
+                    self.__path("verified.ndjson"), self.__path("tokens.txt"))
+                self.assertEqual(0, exit_code)
+                self.assertEqual(
+                    [{"line": i + 1, "valid": True, "payload": f"payload {i}"}
+                     for i in range(20)],
+                    self.__records("verified.ndjson"))
+                self.assertIn("tokens: 20 failures: 0", report)
+
+    def test_verify_reports_failures(self):
+        with open(self.__path("tokens.txt"), "w") as tokens_file:
+            tokens_file.write("not a token\n")
+        exit_code, report = self.__run(
+            "verify", "--jwks", self.__jwks, "--workers", "0", "--output",
+            self.__path("verified.ndjson"), self.__path("tokens.txt"))
+        self.assertEqual(1, exit_code)
+        record, = self.__records("verified.ndjson")
+        self.assertEqual("malformed", record["reason"])
+        self.assertFalse(record["valid"])
+        self.assertIn("malformed: 1", report)
+
+
+    def test_verify_reports_malformed_headers(self):
+        with open(self.__path("tokens.txt"), "w") as tokens_file:
+            for header in ({"alg": "none"}, {"alg": "HS256", "kid": ["a"]}):
+                tokens_file.write(base64_url_encode(
+                    json.dumps(header).encode()) + ".cGF5bG9hZA.c2ln\n")
+        for workers in ("0", "2"):
+            with self.subTest(workers=workers):
+                exit_code, report = self.__run(
+                    "verify", "--jwks", self.__jwks, "--workers", workers,
+                    "--output", self.__path("verified.ndjson"),
+                    self.__path("tokens.txt"))
+                self.assertEqual(1, exit_code)
+                self.assertEqual(
+                    [(1, "algorithm_not_allowed"), (2, "malformed")],
+                    [(record["line"], record["reason"])
+                     for record in self.__records("verified.ndjson")])
+                self.assertIn("tokens: 2 failures: 2", report)
+
+    def test_verify_reports_unexpected_errors(self):
+        with open(self.__path("tokens.txt"), "w") as tokens_file:
+            tokens_file.write("token\n")
+        with mock.patch.object(JWS, "verify",
+                               side_effect=RuntimeError("unexpected")):
+            exit_code, report = self.__run(
+                "verify", "--jwks", self.__jwks, "--workers", "0",
+                "--output", self.__path("verified.ndjson"),
+                self.__path("tokens.txt"))
+        self.assertEqual(1, exit_code)
+        self.assertEqual([{"line": 1, "valid": False, "reason": "error",
+                           "error": "unexpected"}],
+                         self.__records("verified.ndjson"))
+
+    def test_invalid_arguments_exit(self):
+        with open(self.__path("invalid.json"), "w") as jwks_file:
+            jwks_file.write("{")
+        for arguments in (("--jwks", self.__path("missing.json")),
+                          ("--jwks", self.__path("invalid.json")),
+                          ("--jwks", self.__jwks, "--cryptography-module",
+                           "missing")):
+            with self.subTest(arguments=arguments):
+                exit_code, errors = self.__run(
+                    "verify", *arguments, "--workers", "2", "--output",
+                    self.__path("verified.ndjson"), self.__payloads)
+                self.assertEqual(2, exit_code)
+                self.assertIn("Unable to load", errors)
+
+class StatisticsTests(unittest.TestCase):
+    def test_report(self):
+        statistics = Statistics()
+        for latency in (0.000001, 0.00001, 0.00001, 0.001):
+            statistics.add(latency, None)
+        statistics.add(0.00001, "invalid_signature")
+        report = io.StringIO()
+        statistics.report(report, 1.0)
+        self.assertEqual(5, statistics.count)
+        self.assertEqual(1, statistics.failures)
+        self.assertIn("invalid_signature: 1", report.getvalue())
+        self.assertIn("p50<=16 p90<=1024", report.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
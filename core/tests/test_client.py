@@ -0,0 +1,181 @@
+import json
+import unittest
+
+from elfose.jose.client import JOSE
+from elfose.jose.core.cryptography import \
+    CryptographyModule as BaseCryptographyModule, HashingAlgorithm, \
+    PreparedHmacCryptographyModule
+from elfose.jose.core.jwa import ContentEncryptionAlgorithm, \
+    DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType, Use
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.native import CryptographyModule
+
+
+class CountingCryptographyModule(CryptographyModule):
+    def __init__(self) -> None:
+        self.hmac_contexts = 0
+
+    def hmac_context(self, hashing_algorithm, key):
+        self.hmac_contexts += 1
+        return super().hmac_context(hashing_algorithm, key)
+
+
+class DigestOnlyCryptographyModule(BaseCryptographyModule):
+    def hmac_digest(self, hashing_algorithm, key, message):
+        return CryptographyModule().hmac_digest(hashing_algorithm, key,
+                                                message)
+
+
+class CountingKeySet(KeySet):
+    def __init__(self, keys) -> None:
+        super().__init__(keys)
+        self.reads = 0
+
+    @property
+    def keys(self):
+        self.reads += 1
+        return super().keys
+
+
+class PreparedHmacCryptographyModuleTestCase(unittest.TestCase):
+    def test_matches_wrapped_module(self):
+        native = CryptographyModule()
+        module = PreparedHmacCryptographyModule(native)
+        for hashing_algorithm in HashingAlgorithm:
+            self.assertEqual(
+                native.hmac_digest(hashing_algorithm, b"k" * 32, b"message"),
+                module.hmac_digest(hashing_algorithm, b"k" * 32, b"message"))
+        self.assertTrue(module.hmac_digest_verify(
+            HashingAlgorithm.SHA256, b"k" * 32, b"message",
+            native.hmac_digest(HashingAlgorithm.SHA256, b"k" * 32,
+                               b"message")))
+        self.assertFalse(module.hmac_digest_verify(
+            HashingAlgorithm.SHA256, b"k" * 32, b"message", b"\0" * 32))
+
+    def test_key_is_processed_once(self):
+        counting = CountingCryptographyModule()
+        module = PreparedHmacCryptographyModule(counting, cache_size=1)
+        module.prepare(HashingAlgorithm.SHA256, b"prepared")
+        for _ in range(3):
+            module.hmac_digest(HashingAlgorithm.SHA256, b"prepared", b"m")
+            module.hmac_digest(HashingAlgorithm.SHA256, b"cached", b"m")
+        self.assertEqual(2, counting.hmac_contexts)
+        module.hmac_digest(HashingAlgorithm.SHA256, b"evicting", b"m")
+        module.hmac_digest(HashingAlgorithm.SHA256, b"cached", b"m")
+        module.hmac_digest(HashingAlgorithm.SHA256, b"prepared", b"m")
+        self.assertEqual(4, counting.hmac_contexts)
+
+    def test_falls_back_to_hmac_digest(self):
+        module = PreparedHmacCryptographyModule(
+            DigestOnlyCryptographyModule())
+        for _ in range(2):
+            self.assertEqual(
+                CryptographyModule().hmac_digest(HashingAlgorithm.SHA256,
+                                                 b"k" * 32, b"message"),
+                module.hmac_digest(HashingAlgorithm.SHA256, b"k" * 32,
+                                   b"message"))
+
+    def test_copy_is_independent(self):
+        context = CryptographyModule().hmac_context(HashingAlgorithm.SHA256,
+                                                    b"k" * 32)
+        copy = context.copy()
+        copy.update(b"message")
+        self.assertEqual(CryptographyModule().hmac_digest(
+            HashingAlgorithm.SHA256, b"k" * 32, b""), context.digest())
+
+
+class JOSETestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.key_set = KeySet([Key(KeyType.oct, kid="1", k=b"1" * 32)])
+        self.jose = JOSE(self.key_set, CryptographyModule(), clock=lambda: 0)
+        self.jws = JWS(CryptographyModule())
+
+    def test_sign_matches_jws(self):
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                signed = self.jws.sign(self.key_set,
+                                       DigitalSignatureAlgorithm.HS384,
+                                       b"payload", serialization)
+                self.assertEqual(
+                    signed if isinstance(signed, str) else json.dumps(
+                        signed, separators=(",", ":")),
+                    self.jose.sign("payload",
+                                   DigitalSignatureAlgorithm.HS384,
+                                   serialization=serialization))
+
+    def test_sign_and_verify(self):
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                signed = self.jose.sign(b"payload",
+                                        serialization=serialization)
+                self.assertEqual(b"payload", self.jose.verify(signed))
+                self.assertEqual(b"payload", self.jose.verify(
+                    bytearray(signed.encode())))
+
+    def test_sign_with_other_key(self):
+        key = Key(KeyType.oct, kid="2", k=b"2" * 32)
+        signed = self.jose.sign(b"payload", key=key,
+                                serialization=Serialization.COMPACT)
+        self.assertEqual(b"payload",
+                         self.jws.verify(KeySet([key]), signed))
+        with self.assertRaises(ValueError):
+            self.jose.verify(signed)
+
+    def test_sign_general_with_several_keys(self):
+        key_set = KeySet([Key(KeyType.oct, kid=kid, k=kid.encode() * 32)
+                          for kid in ("1", "2")])
+        jose = JOSE(key_set, CryptographyModule())
+        signed = json.loads(jose.sign(b"payload"))
+        self.assertEqual(2, len(signed["signatures"]))
+        with self.assertRaises(ValueError):
+            jose.sign(b"payload", serialization=Serialization.COMPACT)
+
+    def test_no_signing_key_raises(self):
+        jose = JOSE(KeySet([Key(KeyType.oct, k=b"k" * 32, use=Use.enc)]),
+                    CryptographyModule())
+        with self.assertRaises(ValueError):
+            jose.sign(b"payload")
+        with self.assertRaises(ValueError):
+            jose.tokenize(ClaimsSet(subject="user"))
+
+    def test_tokenize_matches_jwt(self):
+        claims_set = ClaimsSet(issuer="joe", expires=100, admin=True)
+        token = self.jose.tokenize(claims_set)
+        self.assertEqual(JWT(self.jws).create(
+            self.key_set, DigitalSignatureAlgorithm.HS256, claims_set,
+            Serialization.COMPACT), token)
+        self.assertEqual(claims_set, self.jose.verify_token(token))
+        with self.assertRaises(ValueError):
+            self.jose.verify_token(token, ClaimsSet(issuer="jane"))
+
+    def test_prepares_on_first_use(self):
+        key_set = CountingKeySet([Key(KeyType.oct, kid="1", k=b"1" * 32)])
+        counting = CountingCryptographyModule()
+        jose = JOSE(key_set, counting)
+        self.assertEqual(0, key_set.reads)
+        self.assertEqual(0, counting.hmac_contexts)
+        for _ in range(2):
+            signed = jose.sign(b"payload",
+                               serialization=Serialization.COMPACT)
+            self.assertEqual(b"payload", jose.verify(signed))
+            jose.tokenize(ClaimsSet(subject="user"))
+        self.assertEqual(1, key_set.reads)
+        self.assertEqual(1, counting.hmac_contexts)
+
+    def test_module_without_hmac_context(self):
+        jose = JOSE(self.key_set, DigestOnlyCryptographyModule())
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                signed = jose.sign(b"payload", serialization=serialization)
+                self.assertEqual(b"payload", self.jose.verify(signed))
+
+    def test_sign_with_algorithm_that_is_not_hmac(self):
+        with self.assertRaises(NotImplementedError):
+            self.jose.sign(b"payload", DigitalSignatureAlgorithm.ES256)
+
+    def test_encrypt_requires_key_management_algorithm(self):
+        with self.assertRaises(ValueError):
+            self.jose.encrypt("plaintext",
+                              ContentEncryptionAlgorithm.A128GCM)
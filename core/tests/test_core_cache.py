@@ -0,0 +1,134 @@
+import multiprocessing
+import unittest
+
+from elfose.jose.core.cache import LRUCache, NegativeCache, \
+    SharedVerificationCache, VerifiedToken
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_get_returns_put_value(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        self.assertEqual(1, cache.get("a"))
+
+    def test_get_returns_default_when_missing(self):
+        cache = LRUCache(2)
+        self.assertEqual(3, cache.get("a", 3))
+
+    def test_discards_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(2, len(cache))
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_denies_invalid_max_size(self):
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+
+class NegativeCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__now = 100.0
+        self.__cache = NegativeCache(max_size=2, ttl=10,
+                                     clock=lambda: self.__now)
+
+    def test_get_returns_reason(self):
+        self.__cache.put(b"digest", "reason")
+        self.assertEqual("reason", self.__cache.get(b"digest"))
+        self.assertEqual(1, self.__cache.hits)
+        self.assertEqual(1, self.__cache.additions)
+
+    def test_get_returns_none_when_missing(self):
+        self.assertIsNone(self.__cache.get(b"digest"))
+        self.assertEqual(1, self.__cache.misses)
+
+    def test_entries_expire(self):
+        self.__cache.put(b"digest", "reason")
+        self.__now += 10
+        self.assertIsNone(self.__cache.get(b"digest"))
+        self.assertEqual(1, self.__cache.expirations)
+        self.assertEqual(0, len(self.__cache))
+
+    def test_is_bounded(self):
+        for digest in (b"a", b"b", b"c"):
+            self.__cache.put(digest, "reason")
+        self.assertEqual(2, len(self.__cache))
+        self.assertIsNone(self.__cache.get(b"a"))
+
+
+class SharedVerificationCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__now = 1000.0
+        self.__cache = SharedVerificationCache(slots=4, ways=2, ttl=10,
+                                               clock=lambda: self.__now)
+
+    def tearDown(self) -> None:
+        self.__cache.close()
+
+    def test_get_returns_put_token(self):
+        self.__cache.put(b"d" * 32, VerifiedToken(b"k" * 32, "HS256", "kid",
+                                                  10, 20))
+        verified_token = self.__cache.get(b"d" * 32)
+        self.assertEqual(b"k" * 32, verified_token.key_digest)
+        self.assertEqual("HS256", verified_token.algorithm)
+        self.assertEqual("kid", verified_token.kid)
+        self.assertEqual(10, verified_token.payload_offset)
+        self.assertEqual(20, verified_token.payload_length)
+
+    def test_get_returns_none_kid(self):
+        self.__cache.put(b"d" * 32, VerifiedToken(b"k" * 32, "HS256", None,
+                                                  0, 0))
+        self.assertIsNone(self.__cache.get(b"d" * 32).kid)
+
+    def test_get_returns_none_when_missing(self):
+        self.assertIsNone(self.__cache.get(b"d" * 32))
+
+    def test_get_returns_none_when_expired(self):
+        self.__cache.put(b"d" * 32, VerifiedToken(b"k" * 32, "HS256", None,
+                                                  0, 0))
+        self.__now += 10
+        self.assertIsNone(self.__cache.get(b"d" * 32))
+
+    def test_put_replaces_soonest_expiring_in_full_bucket(self):
+        digests = [bytes([0] * 7 + [i * 2]) + b"d" * 24 for i in range(3)]
+        for digest in digests:
+            self.__cache.put(digest, VerifiedToken(b"k" * 32, "HS256", None,
+                                                   0, 0))
+            self.__now += 1
+        self.assertIsNone(self.__cache.get(digests[0]))
+        self.assertIsNotNone(self.__cache.get(digests[1]))
+        self.assertIsNotNone(self.__cache.get(digests[2]))
+
+    def test_put_ignores_long_kid(self):
+        self.__cache.put(b"d" * 32, VerifiedToken(b"k" * 32, "HS256",
+                                                  "k" * 65, 0, 0))
+        self.assertIsNone(self.__cache.get(b"d" * 32))
+
+    def test_clear(self):
+        self.__cache.put(b"d" * 32, VerifiedToken(b"k" * 32, "HS256", None,
+                                                  0, 0))
+        self.__cache.clear()
+        self.assertIsNone(self.__cache.get(b"d" * 32))
+
+    def test_shared_with_forked_process(self):
+        context = multiprocessing.get_context("fork")
+        process = context.Process(target=self.__cache.put, args=(
+            b"d" * 32, VerifiedToken(b"k" * 32, "HS256", "kid", 0, 0)))
+        process.start()
+        process.join()
+        self.assertEqual("kid", self.__cache.get(b"d" * 32).kid)
+
+
+if __name__ == '__main__':
+    unittest.main()
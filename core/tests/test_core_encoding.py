@@ -1,6 +1,7 @@
 import unittest
 
-from elfose.jose.core.encoding import base64_url_encode, base64_url_decode
+from elfose.jose.core.encoding import base64_url_encode, base64_url_decode, \
+    Base64UrlEncoder, Base64UrlDecoder, JSONObjectReader, is_base64_url
 
 
 class Base64UrlEncodingTests(unittest.TestCase):
@@ -13,3 +14,107 @@ class Base64UrlEncodingTests(unittest.TestCase):
         expected = bytes([3, 236, 255, 224, 193])
         actual = base64_url_decode("A-z_4ME")
         self.assertEqual(expected, actual)
+
+    def test_is_base64_url(self):
+        self.assertTrue(is_base64_url("A-z_4ME"))
+        for encoded in ("", "A+z/4ME", "A-z_4ME=", "A-z_4M\u00e9", "A z"):
+            with self.subTest(encoded=encoded):
+                self.assertFalse(is_base64_url(encoded))
+
+
+class Base64UrlStreamingTests(unittest.TestCase):
+    def test_encoder_matches_base64_url_encode(self):
+        data = bytes(range(256)) * 3
+        for chunk_size in (1, 2, 3, 4, 7, 64):
+            encoder = Base64UrlEncoder()
+            actual = b"".join(
+                encoder.update(data[i:i + chunk_size])
+                for i in range(0, len(data), chunk_size)
+            ) + encoder.finalize()
+            self.assertEqual(base64_url_encode(data), actual.decode())
+
+    def test_decoder_matches_base64_url_decode(self):
+        encoded = base64_url_encode(bytes(range(256)) * 3 + b"x").encode()
+        for chunk_size in (1, 2, 3, 4, 7, 64):
+            decoder = Base64UrlDecoder()
+            actual = b"".join(
+                decoder.update(encoded[i:i + chunk_size])
+                for i in range(0, len(encoded), chunk_size)
+            ) + decoder.finalize()
+            self.assertEqual(bytes(range(256)) * 3 + b"x", actual)
+
+    def test_decoder_denies_invalid_characters(self):
+        decoder = Base64UrlDecoder()
+        with self.assertRaises(ValueError):
+            decoder.update(b"A+z/4ME=")
+
+
+class JSONObjectReaderTests(unittest.TestCase):
+    @staticmethod
+    def chunks(data: bytes, chunk_size: int = 3):
+        return (data[i:i + chunk_size]
+                for i in range(0, len(data), chunk_size))
+
+    def test_reads_members(self):
+        reader = JSONObjectReader(self.chunks(
+            b' { "a" : {"b": [1, 2]}, "c": 12345, "d": "e\\"f" } '))
+        self.assertEqual("a", reader.next_name())
+        self.assertEqual({"b": [1, 2]}, reader.read_value())
+        self.assertEqual("c", reader.next_name())
+        self.assertEqual(12345, reader.read_value())
+        self.assertEqual("d", reader.next_name())
+        self.assertEqual("e\"f", reader.read_value())
+        self.assertIsNone(reader.next_name())
+
+    def test_iter_string(self):
+        reader = JSONObjectReader(self.chunks(b'{"a":"abcdefghij","b":1}'))
+        self.assertEqual("a", reader.next_name())
+        self.assertEqual("abcdefghij", "".join(reader.iter_string()))
+        self.assertEqual("b", reader.next_name())
+        self.assertEqual(1, reader.read_value())
+        self.assertIsNone(reader.next_name())
+
+    def test_read_value_denies_values_over_max_length(self):
+        reader = JSONObjectReader(self.chunks(b'{"a":"abcdefghij"}'))
+        reader.next_name()
+        with self.assertRaises(ValueError):
+            reader.read_value(max_length=5)
+
+    def test_read_value_spanning_chunks_larger_than_max_length(self):
+        data = b'{"a":"' + b"a" * 10 + b'","b":"bcd"}'
+        reader = JSONObjectReader(self.chunks(data, 8))
+        reader.next_name()
+        self.assertEqual("a" * 10, reader.read_value(max_length=12))
+        self.assertEqual("b", reader.next_name(max_length=3))
+        self.assertEqual("bcd", reader.read_value(max_length=5))
+
+    def test_read_value_denies_values_over_max_length_in_one_chunk(self):
+        reader = JSONObjectReader([b'{"a":"abcdefghij"}'])
+        reader.next_name()
+        with self.assertRaises(ValueError):
+            reader.read_value(max_length=5)
+
+    def test_reads_str_chunks(self):
+        reader = JSONObjectReader(['{"a":', '"\u00e9"}'])
+        self.assertEqual("a", reader.next_name())
+        self.assertEqual("\u00e9", reader.read_value())
+        self.assertIsNone(reader.next_name())
+
+    def test_finish_denies_data_after_object(self):
+        reader = JSONObjectReader(self.chunks(b'{"a":1} \n'))
+        with self.assertRaises(ValueError):
+            reader.finish()
+        reader.next_name()
+        reader.read_value()
+        self.assertIsNone(reader.next_name())
+        reader.finish()
+        reader = JSONObjectReader(self.chunks(b'{"a":1} x'))
+        reader.next_name()
+        reader.read_value()
+        reader.next_name()
+        with self.assertRaises(ValueError):
+            reader.finish()
+
+    def test_denies_non_object(self):
+        with self.assertRaises(ValueError):
+            JSONObjectReader(self.chunks(b'["a"]'))
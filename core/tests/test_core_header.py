@@ -0,0 +1,70 @@
+import copy
+import json
+import unittest
+
+from elfose.jose.core.encoding import base64_url_decode
+from elfose.jose.core.header import ENCODED_CACHE_SIZE, ProtectedHeader, \
+    UnprotectedHeader
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+
+
+class HeaderTests(unittest.TestCase):
+    def test_parameters_are_immutable(self):
+        header = UnprotectedHeader({"nested": {"a": [1]}}, foo="bar")
+        with self.assertRaises(TypeError):
+            header.parameters["foo"] = "baz"
+        with self.assertRaises(TypeError):
+            header.parameters["nested"]["a"] = 2
+        with self.assertRaises(TypeError):
+            header.parameters["nested"]["a"].append(2)
+        with self.assertRaises(TypeError):
+            header.parameters.update({"foo": "baz"})
+
+    def test_parameters_serialize_as_json(self):
+        header = UnprotectedHeader({"nested": {"a": [1]}}, foo="bar")
+        self.assertEqual('{"nested":{"a":[1]},"foo":"bar"}',
+                         json.dumps(header.parameters,
+                                    separators=(",", ":")))
+        self.assertEqual({"nested": {"a": [1]}, "foo": "bar"},
+                         header.parameters)
+
+    def test_copy_returns_same_parameters(self):
+        header = UnprotectedHeader(foo="bar")
+        self.assertIs(header.parameters, copy.deepcopy(header.parameters))
+
+    def test_equal_and_hashable(self):
+        self.assertEqual(ProtectedHeader(foo="bar"),
+                         ProtectedHeader({"foo": "bar"}))
+        self.assertNotEqual(ProtectedHeader(foo="bar"),
+                            UnprotectedHeader(foo="bar"))
+        self.assertEqual(1, len({ProtectedHeader(foo="bar"),
+                                 ProtectedHeader(foo="bar")}))
+
+    def test_mapping(self):
+        header = ProtectedHeader(foo="bar")
+        self.assertEqual("bar", header["foo"])
+        self.assertEqual({"foo": "bar"}, dict(header))
+
+    def test_encode(self):
+        header = ProtectedHeader(typ="JWT")
+        encoded = header.encode(DigitalSignatureAlgorithm.HS256, "kid",
+                                UnprotectedHeader(foo="bar"))
+        self.assertEqual(b'{"alg":"HS256","kid":"kid","typ":"JWT",'
+                         b'"foo":"bar"}', base64_url_decode(encoded))
+        self.assertIs(encoded, header.encode(
+            DigitalSignatureAlgorithm.HS256, "kid",
+            UnprotectedHeader(foo="bar")))
+
+
+    def test_encode_memoizes_recently_used_kids(self):
+        header = ProtectedHeader()
+        encoded = header.encode(DigitalSignatureAlgorithm.HS256, "0")
+        for kid in range(1, ENCODED_CACHE_SIZE + 1):
+            header.encode(DigitalSignatureAlgorithm.HS256, str(kid))
+        reencoded = header.encode(DigitalSignatureAlgorithm.HS256, "0")
+        self.assertIsNot(encoded, reencoded)
+        self.assertEqual(encoded, reencoded)
+
+
+if __name__ == '__main__':
+    unittest.main()
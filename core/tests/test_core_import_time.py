@@ -0,0 +1,119 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Cumulative import time of elfose.jose.core.jwt, the best of a few runs.
+# Raise deliberately when a new eager import is worth the startup cost. As a
+# wall clock measurement it is only checked when the environment variable is
+# set, on a machine that is not otherwise loaded.
+IMPORT_TIME_BUDGET_VARIABLE = "ELFOSE_JOSE_IMPORT_TIME_BUDGET"
+IMPORT_TIME_BUDGET_MICROSECONDS = 250000
+IMPORT_TIME_RUNS = 3
+
+
+def run_python(code: str, *options: str,
+               python_path: str = None) -> subprocess.CompletedProcess:
+    paths = [python_path] if python_path else []
+    paths.extend(sys.path)
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    return subprocess.run([sys.executable, *options, "-c", code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=environment, check=True,
+                          universal_newlines=True)
+
+
+def imported_modules(module: str):
+    code = f"import sys, json, {module}; print(json.dumps(list(sys.modules)))"
+    return set(json.loads(run_python(code).stdout))
+
+
+class ImportTimeTests(unittest.TestCase):
+    def test_core_package_imports_no_submodules(self):
+        modules = imported_modules("elfose.jose.core")
+        self.assertEqual(set(), {module for module in modules
+                                 if module.startswith("elfose.jose.core.")})
+
+    def test_core_package_imports_submodules_on_access(self):
+        modules = imported_modules("elfose.jose.core; elfose.jose.core.jwk")
+        self.assertIn("elfose.jose.core.jwk", modules)
+        self.assertNotIn("elfose.jose.core.jws", modules)
+
+    def test_jwt_does_not_import_unused_modules(self):
+        modules = imported_modules("elfose.jose.core.jwt")
+        for module in ("elfose.jose.core.jwe", "concurrent.futures",
+                       "multiprocessing", "urllib.parse"):
+            with self.subTest(module=module):
+                self.assertNotIn(module, modules)
+
+    @unittest.skipUnless(os.environ.get(IMPORT_TIME_BUDGET_VARIABLE),
+                         "import time budget is only checked on request")
+    def test_jwt_import_time_within_budget(self):
+        import_times = []
+        for _ in range(IMPORT_TIME_RUNS):
+            stderr = run_python("import elfose.jose.core.jwt",
+                                "-X", "importtime").stderr
+            for line in stderr.splitlines():
+                fields = line.split("|")
+                if fields[-1].strip() == "elfose.jose.core.jwt":
+                    import_times.append(int(fields[1]))
+        self.assertLessEqual(min(import_times),
+                             IMPORT_TIME_BUDGET_MICROSECONDS)
+
+
+class CryptographyModuleDiscoveryTests(unittest.TestCase):
+    def test_discovers_entry_points_without_importing(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dist_info = os.path.join(directory, "backend-0.1.dist-info")
+            os.mkdir(dist_info)
+            with open(os.path.join(dist_info, "METADATA"), "w") as metadata:
+                metadata.write("Metadata-Version: 2.1\nName: backend\n"
+                               "Version: 0.1\n")
+            with open(os.path.join(dist_info, "entry_points.txt"),
+                      "w") as entry_points:
+                entry_points.write(
+                    "[elfose.jose.cryptography_modules]\n"
+                    "backend = elfose.jose.native:CryptographyModule\n")
+            stdout = run_python(
+                "import json, sys\n"
+                "from elfose.jose.core.cryptography import "
+                "cryptography_module_names, load_cryptography_module\n"
+                "names = cryptography_module_names()\n"
+                "imported = 'elfose.jose.native' in sys.modules\n"
+                "module = type(load_cryptography_module('backend'))\n"
+                "print(json.dumps([names, imported, module.__module__]))",
+                python_path=directory).stdout
+        names, imported, module = json.loads(stdout)
+        self.assertIn("backend", names)
+        self.assertIn("native", names)
+        self.assertFalse(imported)
+        self.assertEqual("elfose.jose.native", module)
+
+    def test_discovers_known_modules_without_entry_points(self):
+        with tempfile.TemporaryDirectory() as directory:
+            package = os.path.join(directory, "elfose", "jose",
+                                   "pycryptodome")
+            os.makedirs(package)
+            open(os.path.join(package, "__init__.py"), "w").close()
+            stdout = run_python(
+                "import json, sys\n"
+                "sys.modules['importlib.metadata'] = None\n"
+                "from elfose.jose.core.cryptography import "
+                "cryptography_module_names\n"
+                "imported = 'elfose.jose.pycryptodome' in sys.modules\n"
+                "print(json.dumps([cryptography_module_names(), imported]))",
+                python_path=directory).stdout
+        names, imported = json.loads(stdout)
+        self.assertEqual(["native", "pycryptodome"], names)
+        self.assertFalse(imported)
+
+    def test_load_denies_unknown_module(self):
+        from elfose.jose.core.cryptography import load_cryptography_module
+        with self.assertRaises(ValueError):
+            load_cryptography_module("unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from elfose.jose.core.jwk import Key, KeyType, KeySet
+from elfose.jose.core.jwk import Curve, Key, KeyOp, KeyType, KeySet
 
 
 class KeyKeyTypeTests(unittest.TestCase):
@@ -37,6 +37,23 @@ class KeyX5uTests(unittest.TestCase):
             Key(KeyType.EC, x5u=False)
 
 
+class KeyEcTests(unittest.TestCase):
+    def test_accepts_ec_parameters(self):
+        key = Key(KeyType.EC, crv=Curve.P_256, x=b"x", y=b"y", d=b"d")
+        self.assertEqual((Curve.P_256, b"x", b"y", b"d"),
+                         (key.crv, key.x, key.y, key.d))
+
+    def test_denies_non_curve_enum(self):
+        with self.assertRaises(TypeError):
+            # noinspection PyTypeChecker
+            Key(KeyType.EC, crv="P-256")
+
+    def test_denies_non_bytes_coordinates(self):
+        with self.assertRaises(TypeError):
+            # noinspection PyTypeChecker
+            Key(KeyType.EC, x="x")
+
+
 class KeySetTests(unittest.TestCase):
 
     def test_keys_is_set(self):
@@ -60,5 +77,53 @@ class KeySetTests(unittest.TestCase):
                          "Length of keys changed from pop")
 
 
+    def test_version_defaults_to_unique_value(self):
+        self.assertNotEqual(KeySet([]).version, KeySet([]).version)
+
+    def test_version(self):
+        self.assertEqual("v1", KeySet([], version="v1").version)
+
+
+    def test_get_key_by_id(self):
+        key1 = Key(KeyType.oct, kid="1", k=b"1")
+        key2 = Key(KeyType.oct, kid="2", k=b"2")
+        key_set = KeySet([key1, key2])
+        self.assertIs(key2, key_set.get_key_by_id("2"))
+        self.assertIsNone(key_set.get_key_by_id("3"))
+        self.assertIsNone(key_set.get_key_by_id(["2"]))
+
+    def test_dict_round_trip(self):
+        key_set = KeySet([Key(KeyType.oct, kid="1", k=b"1")])
+        self.assertEqual({"keys": [{"kty": "oct", "kid": "1", "k": "MQ"}]},
+                         key_set.to_dict())
+        self.assertEqual(key_set.keys,
+                         KeySet.from_dict(key_set.to_dict()).keys)
+
+    def test_from_dict_denies_missing_keys(self):
+        with self.assertRaises(ValueError):
+            KeySet.from_dict({})
+
+
+class KeyImmutableTests(unittest.TestCase):
+    def test_equal_and_hashable(self):
+        key1 = Key(KeyType.oct, kid="kid", k=b"k", key_ops=[KeyOp.sign])
+        key2 = Key(KeyType.oct, kid="kid", k=b"k", key_ops={KeyOp.sign})
+        self.assertEqual(key1, key2)
+        self.assertEqual(1, len({key1, key2}))
+        self.assertNotEqual(key1, Key(KeyType.oct, kid="kid", k=b"j"))
+
+    def test_is_immutable(self):
+        key = Key(KeyType.oct, k=b"k")
+        with self.assertRaises(AttributeError):
+            key.k = b"j"
+        with self.assertRaises(AttributeError):
+            key.other = 1
+
+    def test_key_ops_are_interned(self):
+        key1 = Key(KeyType.oct, key_ops=[KeyOp.sign, KeyOp.verify])
+        key2 = Key(KeyType.oct, key_ops={KeyOp.verify, KeyOp.sign})
+        self.assertIs(key1.key_ops, key2.key_ops)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,17 @@
+import io
 import json
 import unittest
-
-from elfose.jose.core.jws import JWS, Serialization, DigitalSignatureAlgorithm
+from concurrent.futures import ThreadPoolExecutor
+
+from elfose.jose.core.cache import NegativeCache, SharedVerificationCache
+from elfose.jose.core.header import ProtectedHeader, UnprotectedHeader
+from elfose.jose.core.jws import JWS, Serialization, \
+    DigitalSignatureAlgorithm, VerificationLimits, FailureReason, \
+    InvalidJWSError, AnySignaturePolicy, AllSignaturesPolicy, \
+    ThresholdPolicy, KidsPolicy, MAX_MEMBERS
 from elfose.jose.core.jwk import KeyType, Use, KeyOp, KeySet, Key
 from elfose.jose.native import CryptographyModule
-from elfose.jose.core.encoding import base64_url_decode
+from elfose.jose.core.encoding import base64_url_decode, base64_url_encode
 
 
 class JwsSignHmacIntegrationTestCase(unittest.TestCase):
@@ -64,6 +71,126 @@ class JwsSignHmacIntegrationTestCase(unittest.TestCase):
                                  protected_header={"typ": "jwt"})
         self.assertEqual(expected, actual)
 
+    def test_sign_compact_matches_compact_serialization(self):
+        expected = self.__jws.sign(self.__keys,
+                                   DigitalSignatureAlgorithm.HS256,
+                                   self.__payload,
+                                   serialization=Serialization.COMPACT,
+                                   protected_header={"typ": "jwt"})
+        actual = self.__jws.sign_compact(self.__keys,
+                                         DigitalSignatureAlgorithm.HS256,
+                                         self.__payload, {"typ": "jwt"})
+        self.assertEqual(expected.encode(), actual)
+
+    def test_sign_with_header_types_matches_dicts(self):
+        keys = KeySet([Key(KeyType.oct, kid="1", k=b"1" * 32),
+                       Key(KeyType.oct, kid="2", k=b"2" * 32)])
+        for serialization in Serialization:
+            sign_keys = keys if serialization is Serialization.GENERAL_JSON \
+                else self.__keys
+            expected = self.__jws.sign(sign_keys,
+                                       DigitalSignatureAlgorithm.HS256,
+                                       self.__payload, serialization,
+                                       protected_header={"typ": "jwt"},
+                                       unprotected_header={"foo": "bar"})
+            actual = self.__jws.sign(
+                sign_keys, DigitalSignatureAlgorithm.HS256, self.__payload,
+                serialization,
+                protected_header=ProtectedHeader(typ="jwt"),
+                unprotected_header=UnprotectedHeader(foo="bar"))
+            with self.subTest(serialization=serialization):
+                self.assertEqual(expected, actual)
+
+    def test_sign_to_matches_sign(self):
+        keys = KeySet([Key(KeyType.oct, kid="1", k=b"1" * 32),
+                       Key(KeyType.oct, kid="2", k=b"2" * 32)])
+        headers = (({}, None), ({"typ": "jwt"}, {"foo": "bar"}),
+                   (ProtectedHeader(typ="jwt"), UnprotectedHeader(foo="bar")))
+        for serialization in Serialization:
+            sign_keys = keys if serialization is Serialization.GENERAL_JSON \
+                else self.__keys
+            for protected_header, unprotected_header in headers:
+                expected = self.__jws.sign(
+                    sign_keys, DigitalSignatureAlgorithm.HS256,
+                    self.__payload, serialization,
+                    protected_header=protected_header,
+                    unprotected_header=unprotected_header)
+                if isinstance(expected, dict):
+                    expected = json.dumps(expected, separators=(",", ":"))
+                output = bytearray(b"prefix")
+                written = self.__jws.sign_to(
+                    output, sign_keys, DigitalSignatureAlgorithm.HS256,
+                    self.__payload, serialization,
+                    protected_header=protected_header,
+                    unprotected_header=unprotected_header)
+                with self.subTest(serialization=serialization,
+                                  protected_header=protected_header):
+                    self.assertEqual(b"prefix" + expected.encode(), output)
+                    self.assertEqual(len(expected), written)
+
+    def test_sign_to_writes_to_file(self):
+        output = io.BytesIO()
+        self.__jws.sign_to(output, self.__keys,
+                           DigitalSignatureAlgorithm.HS256, self.__payload,
+                           Serialization.COMPACT)
+        expected = self.__jws.sign(self.__keys,
+                                   DigitalSignatureAlgorithm.HS256,
+                                   self.__payload, Serialization.COMPACT)
+        self.assertEqual(expected.encode(), output.getvalue())
+
+    def test_add_signature_matches_sign(self):
+        key1 = Key(KeyType.oct, kid="1", k=b"1" * 32)
+        key2 = Key(KeyType.oct, kid="2", k=b"2" * 32)
+        expected = self.__jws.sign(KeySet([key1, key2]),
+                                   DigitalSignatureAlgorithm.HS256,
+                                   self.__payload, Serialization.GENERAL_JSON,
+                                   unprotected_header={"foo": "bar"})
+        flattened = self.__jws.sign(KeySet([key1]),
+                                    DigitalSignatureAlgorithm.HS256,
+                                    self.__payload,
+                                    Serialization.FLATTENED_JSON,
+                                    unprotected_header={"foo": "bar"})
+        actual = self.__jws.add_signature(flattened, key2,
+                                          DigitalSignatureAlgorithm.HS256,
+                                          unprotected_header={"foo": "bar"})
+        self.assertEqual(expected, actual)
+        self.assertIs(flattened["payload"], actual["payload"])
+
+    def test_add_signature_denies_key_not_for_signing(self):
+        jws = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                              self.__payload, Serialization.GENERAL_JSON)
+        with self.assertRaises(ValueError):
+            self.__jws.add_signature(jws, Key(KeyType.oct, k=b"k" * 32,
+                                              use=Use.enc),
+                                     DigitalSignatureAlgorithm.HS256)
+
+    def test_add_signature_denies_invalid_signatures(self):
+        key = Key(KeyType.oct, kid="2", k=b"2" * 32)
+        jws = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                              self.__payload, Serialization.GENERAL_JSON)
+        for signatures in ("signature", [], ({"signature": "a"},),
+                           ["signature"], [{"protected": "a"}]):
+            with self.subTest(signatures=signatures):
+                with self.assertRaises(ValueError):
+                    self.__jws.add_signature(
+                        {"payload": jws["payload"], "signatures": signatures},
+                        key, DigitalSignatureAlgorithm.HS256)
+        with self.assertRaises(ValueError):
+            self.__jws.add_signature({"payload": jws["payload"]}, key,
+                                     DigitalSignatureAlgorithm.HS256)
+
+    def test_remove_signature(self):
+        keys = [Key(KeyType.oct, kid=kid, k=kid.encode() * 32)
+                for kid in ("1", "2", "3")]
+        jws = self.__jws.sign(KeySet(keys), DigitalSignatureAlgorithm.HS256,
+                              self.__payload, Serialization.GENERAL_JSON)
+        removed = JWS.remove_signature(jws, "2")
+        self.assertEqual([jws["signatures"][0], jws["signatures"][2]],
+                         removed["signatures"])
+        self.assertEqual(3, len(jws["signatures"]))
+        with self.assertRaises(ValueError):
+            JWS.remove_signature(removed, "2")
+
     def test_sign_hmac_sha256_flattened_json_no_unprotected(self):
         expected = {
             "protected": "eyJhbGciOiJIUzI1NiIsInR5cCI6Imp3dCJ9",
@@ -394,3 +521,494 @@ class JwsVerifyIntegrationTestCase(unittest.TestCase):
         })
         actual = self.__jws.verify(self.__keys, jws)
         self.assertEqual(self.__payload, actual)
+
+
+class JwsVerifyLimitsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__key = b"k" * 32
+        self.__keys = KeySet({Key(KeyType.oct, k=self.__key)})
+        self.__jws = JWS(CryptographyModule())
+        self.__token = self.__jws.sign(self.__keys,
+                                       DigitalSignatureAlgorithm.HS256,
+                                       b"payload", Serialization.COMPACT)
+
+    def __verify(self, jws, **limits):
+        return JWS(CryptographyModule(), VerificationLimits(**limits)) \
+            .verify(self.__keys, jws)
+
+    def test_verify_within_limits(self):
+        self.assertEqual(b"payload", self.__verify(
+            self.__token.encode(), max_token_length=len(self.__token),
+            allowed_algorithms={DigitalSignatureAlgorithm.HS256}))
+
+    def test_verify_denies_token_exceeding_max_length(self):
+        with self.assertRaises(ValueError):
+            self.__verify(self.__token, max_token_length=len(self.__token) - 1)
+
+    def test_verify_denies_header_exceeding_max_length(self):
+        with self.assertRaises(ValueError):
+            self.__verify(self.__token, max_header_length=8)
+
+    def test_verify_denies_too_many_signatures(self):
+        jws = self.__jws.sign(KeySet({Key(KeyType.oct, k=self.__key),
+                                      Key(KeyType.oct, k=b"j" * 32)}),
+                              DigitalSignatureAlgorithm.HS256, b"payload",
+                              Serialization.GENERAL_JSON)
+        with self.assertRaisesRegex(ValueError, "signatures"):
+            self.__verify(json.dumps(jws), max_signatures=1)
+
+    def test_verify_denies_algorithm_not_allowed(self):
+        with self.assertRaisesRegex(ValueError, "not allowed"):
+            self.__verify(self.__token, allowed_algorithms={
+                DigitalSignatureAlgorithm.HS512})
+
+    def test_verify_denies_malformed_compact(self):
+        for jws in ("a.b", "a.b.c.d", "a..c", "a.b+.c", self.__token + " ",
+                    "\u00e9.b.c"):
+            with self.subTest(jws=jws), self.assertRaises(ValueError):
+                self.__verify(jws)
+
+    def test_verify_denies_malformed_json(self):
+        for jws in ("{", "[]", '{"payload":"a","signatures":{}}',
+                    '{"payload":"a","signatures":[1]}',
+                    '{"payload":"a","protected":"b"}',
+                    '{"payload":1,"protected":"b","signature":"c"}'):
+            with self.subTest(jws=jws), self.assertRaises(ValueError):
+                self.__verify(jws)
+
+    def test_verify_denies_json_exceeding_member_limits(self):
+        header, payload, signature = self.__token.split(".")
+        valid = {"payload": payload, "protected": header,
+                 "signature": signature}
+        for jws in (json.dumps(valid) + " x",
+                    json.dumps(valid)[:-1] + ',"payload":"' + payload + '"}',
+                    json.dumps(dict(valid, header={"x": "x" * 100000})),
+                    json.dumps(valid)[:-1] + ',"header":' + "[" * 100000,
+                    json.dumps({"payload": payload,
+                                "signatures": [valid] * 1000})):
+            with self.subTest(jws=jws[:80]), self.assertRaises(ValueError):
+                self.__verify(jws)
+        self.assertEqual(b"payload", self.__verify(json.dumps(valid)))
+
+    def test_verify_denies_json_exceeding_max_members(self):
+        header, payload, signature = self.__token.split(".")
+        valid = {"payload": payload, "protected": header,
+                 "signature": signature}
+        valid.update((f"x{i}", 0) for i in range(MAX_MEMBERS - 3))
+        self.assertEqual(b"payload", self.__verify(json.dumps(valid)))
+        valid["x"] = 0
+        with self.assertRaises(InvalidJWSError) as context:
+            self.__verify(json.dumps(valid))
+        self.assertIs(FailureReason.LIMIT_EXCEEDED, context.exception.reason)
+
+    def test_verify_denies_malformed_headers(self):
+        signature = self.__token.split(".")[2]
+        for header, reason in (
+                ({"alg": "none"}, FailureReason.ALGORITHM_NOT_ALLOWED),
+                ({"alg": "RS256"}, FailureReason.ALGORITHM_NOT_ALLOWED),
+                ({"alg": ["HS256"]}, FailureReason.ALGORITHM_NOT_ALLOWED),
+                ({"alg": "HS256", "kid": ["a"]}, FailureReason.MALFORMED),
+                ({"alg": "HS256", "kid": None}, FailureReason.MALFORMED)):
+            jws = ".".join((base64_url_encode(json.dumps(header).encode()),
+                            "cGF5bG9hZA", signature))
+            with self.subTest(header=header), \
+                    self.assertRaises(InvalidJWSError) as context:
+                self.__verify(jws)
+            self.assertIs(reason, context.exception.reason)
+
+class JwsVerifyNegativeCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CountingCryptographyModule()
+        self.__cache = NegativeCache()
+        self.__jws = JWS(self.__module, negative_cache=self.__cache)
+        self.__keys = KeySet({Key(KeyType.oct, k=b"k" * 32)})
+        self.__token = self.__jws.sign(self.__keys,
+                                       DigitalSignatureAlgorithm.HS256,
+                                       b"payload", Serialization.COMPACT)
+
+    def test_verify_valid_token_is_not_cached(self):
+        self.assertEqual(b"payload",
+                         self.__jws.verify(self.__keys, self.__token))
+        self.assertEqual(b"payload",
+                         self.__jws.verify(self.__keys, self.__token))
+        self.assertEqual(0, len(self.__cache))
+
+    def test_verify_rejects_repeated_invalid_signature_from_cache(self):
+        token = self.__token[:-2] + "AA"
+        with self.assertRaises(InvalidJWSError) as first:
+            self.__jws.verify(self.__keys, token)
+        verifications = self.__module.hmac_verifications
+        with self.assertRaises(InvalidJWSError) as second:
+            self.__jws.verify(self.__keys, token)
+        self.assertEqual(FailureReason.INVALID_SIGNATURE,
+                         first.exception.reason)
+        self.assertEqual(FailureReason.INVALID_SIGNATURE,
+                         second.exception.reason)
+        self.assertEqual(verifications, self.__module.hmac_verifications)
+        self.assertEqual(1, self.__cache.hits)
+
+    def test_verify_accepts_token_with_rotated_key_set_after_failure(self):
+        token = JWS(CryptographyModule()).sign(
+            KeySet({Key(KeyType.oct, k=b"r" * 32)}),
+            DigitalSignatureAlgorithm.HS256, b"payload",
+            Serialization.COMPACT)
+        with self.assertRaises(InvalidJWSError):
+            self.__jws.verify(self.__keys, token)
+        rotated = KeySet(self.__keys.keys + [Key(KeyType.oct, k=b"r" * 32)])
+        self.assertEqual(b"payload", self.__jws.verify(rotated, token))
+        with self.assertRaises(InvalidJWSError):
+            self.__jws.verify(self.__keys, token)
+        self.assertEqual(1, self.__cache.hits)
+
+    def test_verify_records_malformed_reason(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError) as context:
+                self.__jws.verify(self.__keys, "not a token")
+        self.assertEqual(FailureReason.MALFORMED, context.exception.reason)
+
+    def test_verify_unknown_kid_is_invalid_signature(self):
+        token = JWS(CryptographyModule()).sign(
+            KeySet({Key(KeyType.oct, kid="unknown", k=b"k" * 32)}),
+            DigitalSignatureAlgorithm.HS256, b"payload",
+            Serialization.COMPACT)
+        with self.assertRaises(InvalidJWSError) as context:
+            self.__jws.verify(self.__keys, token)
+        self.assertEqual(FailureReason.INVALID_SIGNATURE,
+                         context.exception.reason)
+
+
+class JwsVerifyVerificationCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CountingCryptographyModule()
+        self.__cache = SharedVerificationCache(slots=64)
+        self.__jws = JWS(self.__module, verification_cache=self.__cache)
+        self.__key = Key(KeyType.oct, kid="kid", k=b"k" * 32)
+        self.__keys = KeySet({self.__key})
+
+    def tearDown(self) -> None:
+        self.__cache.close()
+
+    def test_verify_accepts_repeated_token_from_cache(self):
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                token = self.__jws.sign(self.__keys,
+                                        DigitalSignatureAlgorithm.HS256,
+                                        b"payload", serialization)
+                if not isinstance(token, str):
+                    token = json.dumps(token)
+                self.assertEqual(b"payload",
+                                 self.__jws.verify(self.__keys, token))
+                verifications = self.__module.hmac_verifications
+                self.assertEqual(b"payload", self.__jws.verify(
+                    self.__keys, token.encode("utf-8")))
+                self.assertEqual(verifications,
+                                 self.__module.hmac_verifications)
+
+    def test_verify_checks_key_of_cached_token(self):
+        token = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                                b"payload", Serialization.COMPACT)
+        self.__jws.verify(self.__keys, token)
+        other_keys = KeySet({Key(KeyType.oct, kid="kid", k=b"o" * 32)})
+        with self.assertRaises(InvalidJWSError):
+            self.__jws.verify(other_keys, token)
+
+    def test_verify_checks_allowed_algorithms_of_cached_token(self):
+        token = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                                b"payload", Serialization.COMPACT)
+        self.__jws.verify(self.__keys, token)
+        jws = JWS(self.__module, VerificationLimits(allowed_algorithms={
+            DigitalSignatureAlgorithm.HS512}),
+                  verification_cache=self.__cache)
+        with self.assertRaises(InvalidJWSError):
+            jws.verify(self.__keys, token)
+
+    def test_verify_payload_with_json_escapes(self):
+        token = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                                b"payload", Serialization.FLATTENED_JSON)
+        payload = token["payload"]
+        escaped = json.dumps(token).replace(
+            f'"{payload}"', f'"\\u{ord(payload[0]):04x}{payload[1:]}"')
+        self.assertNotIn(payload, escaped)
+        for _ in range(2):
+            self.assertEqual(b"payload",
+                             self.__jws.verify(self.__keys, escaped))
+
+    def test_verify_without_kid(self):
+        keys = KeySet({Key(KeyType.oct, k=b"k" * 32)})
+        token = self.__jws.sign(keys, DigitalSignatureAlgorithm.HS256,
+                                b"payload", Serialization.COMPACT)
+        self.__jws.verify(keys, token)
+        verifications = self.__module.hmac_verifications
+        self.assertEqual(b"payload", self.__jws.verify(keys, token))
+        self.assertEqual(verifications, self.__module.hmac_verifications)
+
+
+class JwsVerifyPolicyTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CountingCryptographyModule()
+        self.__jws = JWS(self.__module)
+        keys = [Key(KeyType.oct, kid=kid, k=kid.encode() * 32)
+                for kid in ("1", "2", "3")]
+        # The key for the first signature is not in the key set
+        self.__token = json.dumps(self.__jws.sign(
+            KeySet(keys), DigitalSignatureAlgorithm.HS256, b"payload",
+            Serialization.GENERAL_JSON))
+        self.__keys = KeySet(keys[1:])
+
+    def test_any_stops_at_first_valid_signature(self):
+        result = self.__jws.verify_with_policy(self.__keys, self.__token,
+                                               AnySignaturePolicy())
+        self.assertEqual(b"payload", result.payload)
+        self.assertEqual(["1", "2", "3"], result.kids)
+        self.assertEqual([1], result.valid_signatures)
+        self.assertEqual([0], result.invalid_signatures)
+        self.assertEqual(1, self.__module.hmac_verifications)
+
+    def test_all_stops_at_first_invalid_signature(self):
+        with self.assertRaises(InvalidJWSError) as context:
+            self.__jws.verify_with_policy(self.__keys, self.__token,
+                                          AllSignaturesPolicy())
+        self.assertEqual(FailureReason.INVALID_SIGNATURE,
+                         context.exception.reason)
+        self.assertEqual(0, self.__module.hmac_verifications)
+
+    def test_threshold(self):
+        result = self.__jws.verify_with_policy(self.__keys, self.__token,
+                                               ThresholdPolicy(2))
+        self.assertEqual([1, 2], result.valid_signatures)
+        with self.assertRaises(InvalidJWSError):
+            self.__jws.verify_with_policy(self.__keys, self.__token,
+                                          ThresholdPolicy(3))
+
+    def test_kids(self):
+        result = self.__jws.verify_with_policy(self.__keys, self.__token,
+                                               KidsPolicy(["3"]))
+        self.assertEqual([2], result.valid_signatures)
+        with self.assertRaises(InvalidJWSError):
+            self.__jws.verify_with_policy(self.__keys, self.__token,
+                                          KidsPolicy(["1", "2"]))
+
+    def test_disallowed_algorithm_is_invalid_signature(self):
+        jws = JWS(CryptographyModule(), VerificationLimits(
+            allowed_algorithms={DigitalSignatureAlgorithm.HS512}))
+        with self.assertRaises(InvalidJWSError):
+            jws.verify_with_policy(self.__keys, self.__token,
+                                   AnySignaturePolicy())
+
+    def test_executor(self):
+        with ThreadPoolExecutor(2) as executor:
+            result = self.__jws.verify_with_policy(
+                self.__keys, self.__token, ThresholdPolicy(2), executor)
+        self.assertEqual([1, 2], result.valid_signatures)
+
+    def test_verify_accepts_valid_signature_after_invalid(self):
+        self.assertEqual(b"payload",
+                         self.__jws.verify(self.__keys, self.__token))
+
+    def test_threshold_decides_early(self):
+        policy = ThresholdPolicy(2)
+        keys = self.__keys.keys
+        self.assertIsNone(policy.decide(["1", "2", "3"], {0: False}, {}))
+        self.assertFalse(policy.decide(["1", "2", "3"],
+                                       {0: False, 1: False}, {}))
+        self.assertTrue(policy.decide(["1", "2", "3"], {0: True, 2: True},
+                                      {0: keys[0], 2: keys[1]}))
+
+    def test_threshold_counts_duplicated_signatures_once(self):
+        token = json.loads(self.__token)
+        token["signatures"] = [token["signatures"][1]] * 3
+        duplicated = json.dumps(token)
+        for executor in (None, ThreadPoolExecutor(2)):
+            with self.subTest(executor=executor), \
+                    self.assertRaises(InvalidJWSError):
+                self.__jws.verify_with_policy(self.__keys, duplicated,
+                                              ThresholdPolicy(2), executor)
+            if executor is not None:
+                executor.shutdown()
+        result = self.__jws.verify_with_policy(self.__keys, duplicated,
+                                               ThresholdPolicy(1))
+        self.assertEqual([0], result.valid_signatures)
+
+
+class CountingCryptographyModule(CryptographyModule):
+    def __init__(self) -> None:
+        self.hmac_verifications = 0
+
+    def hmac_digest_verify(self, hashing_algorithm, key, message, digest):
+        self.hmac_verifications += 1
+        return super().hmac_digest_verify(hashing_algorithm, key, message,
+                                          digest)
+
+
+
+class JwsVerifyStreamTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__jws = JWS(CryptographyModule())
+        self.__keys = KeySet([Key(KeyType.oct, kid=kid, k=kid.encode() * 32)
+                              for kid in ("1", "2")])
+        self.__payload = bytes(range(256)) * 1000
+
+    def __verify_stream(self, jws, key_set=None, chunk_size=1000) -> bytes:
+        output = io.BytesIO()
+        self.__jws.verify_stream(
+            self.__keys if key_set is None else key_set,
+            io.BytesIO(json.dumps(jws).encode()), output, chunk_size)
+        return output.getvalue()
+
+    def test_flattened_with_payload_first_is_spooled(self):
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS256, self.__payload)
+        self.assertEqual("payload", next(iter(jws)))
+        self.assertEqual(self.__payload, self.__verify_stream(jws))
+
+    def test_flattened_with_headers_first(self):
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS384, self.__payload,
+                              unprotected_header={"typ": "JOSE"})
+        jws = {"protected": jws["protected"], "header": jws["header"],
+               "payload": jws["payload"], "signature": jws["signature"]}
+        self.assertEqual(self.__payload, self.__verify_stream(jws))
+
+    def test_general_with_signatures_first(self):
+        jws = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS512,
+                              self.__payload, Serialization.GENERAL_JSON)
+        jws = {"signatures": jws["signatures"], "payload": jws["payload"]}
+        key_set = KeySet([self.__keys.get_key_by_id("2")])
+        self.assertEqual(self.__payload, self.__verify_stream(jws, key_set))
+
+    def test_general_with_payload_first(self):
+        jws = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                              self.__payload, Serialization.GENERAL_JSON)
+        self.assertEqual(self.__payload, self.__verify_stream(jws))
+
+    def test_invalid_signature_raises(self):
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS256, self.__payload)
+        jws["payload"] = jws["payload"][:-4] + "AAAA"
+        with self.assertRaises(InvalidJWSError) as context:
+            self.__verify_stream(jws)
+        self.assertEqual(FailureReason.INVALID_SIGNATURE,
+                         context.exception.reason)
+
+    def test_unknown_key_raises(self):
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS256, self.__payload)
+        with self.assertRaises(InvalidJWSError):
+            self.__verify_stream(
+                jws, KeySet([self.__keys.get_key_by_id("2")]))
+
+    def test_algorithm_not_allowed_raises(self):
+        self.__jws = JWS(CryptographyModule(), VerificationLimits(
+            allowed_algorithms={DigitalSignatureAlgorithm.HS512}))
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS256, self.__payload)
+        with self.assertRaises(InvalidJWSError) as context:
+            self.__verify_stream(jws)
+        self.assertEqual(FailureReason.ALGORITHM_NOT_ALLOWED,
+                         context.exception.reason)
+
+    def test_too_many_signatures_raises(self):
+        self.__jws = JWS(CryptographyModule(),
+                         VerificationLimits(max_signatures=1))
+        jws = self.__jws.sign(self.__keys, DigitalSignatureAlgorithm.HS256,
+                              self.__payload, Serialization.GENERAL_JSON)
+        with self.assertRaises(InvalidJWSError) as context:
+            self.__verify_stream(jws)
+        self.assertEqual(FailureReason.LIMIT_EXCEEDED,
+                         context.exception.reason)
+
+    def test_malformed_raises(self):
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS256, b"payload")
+        for malformed in ({"signature": jws["signature"],
+                           "protected": jws["protected"]},
+                          dict(jws, payload="cGF5+G9hZA"),
+                          dict(jws, payload=""),
+                          {"payload": jws["payload"],
+                           "protected": jws["protected"]},
+                          {"payload": jws["payload"], "signatures": []}):
+            with self.subTest(malformed=malformed):
+                with self.assertRaises(ValueError):
+                    self.__verify_stream(malformed)
+
+    def test_duplicate_member_raises(self):
+        jws = self.__jws.sign(KeySet([self.__keys.get_key_by_id("1")]),
+                              DigitalSignatureAlgorithm.HS256, b"payload")
+        document = json.dumps(jws)[:-1] + ",\"payload\":\"AAAA\"}"
+        with self.assertRaises(ValueError):
+            self.__jws.verify_stream(self.__keys,
+                                     io.BytesIO(document.encode()),
+                                     io.BytesIO())
+
+
+class JwsConvertTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__jws = JWS(CryptographyModule())
+        self.__keys = KeySet([Key(KeyType.oct, kid=kid, k=kid.encode() * 32)
+                              for kid in ("1", "2")])
+        self.__key_set = KeySet([self.__keys.get_key_by_id("1")])
+        self.__algorithm = DigitalSignatureAlgorithm.HS256
+
+    def test_between_single_signature_serializations(self):
+        compact = self.__jws.sign(self.__key_set, self.__algorithm,
+                                  b"payload", Serialization.COMPACT)
+        flattened = self.__jws.sign(self.__key_set, self.__algorithm,
+                                    b"payload", Serialization.FLATTENED_JSON)
+        general = self.__jws.sign(self.__key_set, self.__algorithm,
+                                  b"payload", Serialization.GENERAL_JSON)
+        serialized = {Serialization.COMPACT: compact,
+                      Serialization.FLATTENED_JSON: flattened,
+                      Serialization.GENERAL_JSON: general}
+        for source in serialized.values():
+            for serialization, expected in serialized.items():
+                with self.subTest(source=source, serialization=serialization):
+                    converted = JWS.convert(source, serialization)
+                    self.assertEqual(expected, converted)
+                    if isinstance(converted, dict):
+                        converted = json.dumps(converted)
+                    self.assertEqual(b"payload", self.__jws.verify(
+                        self.__key_set, converted))
+
+    def test_serialized_json_and_bytes(self):
+        flattened = self.__jws.sign(self.__key_set, self.__algorithm,
+                                    b"payload")
+        compact = JWS.convert(json.dumps(flattened), Serialization.COMPACT)
+        self.assertEqual(flattened, JWS.convert(compact.encode(),
+                                                Serialization.FLATTENED_JSON))
+
+    def test_multiple_signatures_require_kid(self):
+        general = self.__jws.sign(self.__keys, self.__algorithm, b"payload",
+                                  Serialization.GENERAL_JSON)
+        with self.assertRaises(ValueError):
+            JWS.convert(general, Serialization.COMPACT)
+        compact = JWS.convert(general, Serialization.COMPACT, kid="2")
+        self.assertEqual(b"payload", self.__jws.verify(
+            KeySet([self.__keys.get_key_by_id("2")]), compact))
+        self.assertEqual(general["signatures"][1:], JWS.convert(
+            general, Serialization.GENERAL_JSON, kid="2")["signatures"])
+        with self.assertRaises(ValueError):
+            JWS.convert(general, Serialization.COMPACT, kid="3")
+
+    def test_unprotected_header(self):
+        flattened = self.__jws.sign(self.__key_set, self.__algorithm,
+                                    b"payload",
+                                    unprotected_header={"kid": "1"})
+        self.assertEqual({"kid": "1"}, JWS.convert(
+            flattened, Serialization.GENERAL_JSON)["signatures"][0]["header"])
+        with self.assertRaises(ValueError):
+            JWS.convert(flattened, Serialization.COMPACT)
+        compact = JWS.convert(flattened, Serialization.COMPACT,
+                              discard_unprotected_header=True)
+        self.assertEqual(b"payload", self.__jws.verify(self.__key_set,
+                                                       compact))
+
+    def test_malformed_raises(self):
+        for malformed in ("a.b", "a.b.c.d", "{", {"payload": "cGF5bG9hZA"},
+                          {"payload": "cGF5bG9hZA", "signatures": []},
+                          {"signatures": [{"signature": "c2ln"}]}, 1):
+            with self.subTest(malformed=malformed):
+                with self.assertRaises(ValueError):
+                    JWS.convert(malformed, Serialization.GENERAL_JSON)
+        with self.assertRaises(ValueError):
+            JWS.convert({"payload": "cGF5bG9hZA", "signature": "c2ln"},
+                        Serialization.COMPACT)
@@ -1,10 +1,14 @@
+import itertools
+import json
 import unittest
+from concurrent.futures import Executor
 
 from elfose.jose.core.encoding import base64_url_decode
 from elfose.jose.core.jwa import DigitalSignatureAlgorithm
 from elfose.jose.core.jwk import KeySet, Key, KeyType, Use, KeyOp
 from elfose.jose.core.jws import JWS, Serialization
-from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.core.jwt import ClaimsSet, JWT, MintedTokenCache
+from elfose.jose.core.replay import MemoryReplayStore
 from elfose.jose.native import CryptographyModule
 
 
@@ -81,3 +85,243 @@ class CoreJwtHmacIntegrationTesCase(unittest.TestCase):
                                    self.__claims_set,
                                    serialization=Serialization.COMPACT)
         self.assertEqual(expected, actual)
+
+
+class ImmediateExecutor(Executor):
+    def __init__(self) -> None:
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        fn(*args, **kwargs)
+
+
+class MintedTokenCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__now = 1000.0
+        self.__executor = ImmediateExecutor()
+        self.__jws = JWS(CryptographyModule())
+        self.__cache = MintedTokenCache(JWT(self.__jws), lifetime=100,
+                                        refresh_fraction=0.5,
+                                        executor=self.__executor,
+                                        clock=lambda: self.__now)
+        self.__keys = KeySet([Key(KeyType.oct, k=b"k" * 32)])
+        self.__template = ClaimsSet(issuer="Issuer", subject="Subject")
+
+    def __get(self, template: ClaimsSet = None, keys: KeySet = None) -> str:
+        return self.__cache.get(keys or self.__keys,
+                                DigitalSignatureAlgorithm.HS256,
+                                template or self.__template)
+
+    def __claims(self, token: str) -> dict:
+        return json.loads(self.__jws.verify(self.__keys, token))
+
+    def test_get_sets_iat_and_exp(self):
+        claims = self.__claims(self.__get())
+        self.assertEqual({"iss": "Issuer", "sub": "Subject", "exp": 1100,
+                          "iat": 1000}, claims)
+
+    def test_get_reuses_token_before_refresh(self):
+        token = self.__get()
+        self.__now += 49
+        self.assertEqual(token, self.__get())
+        self.assertEqual(0, self.__executor.submitted)
+
+    def test_get_refreshes_in_background_after_fraction(self):
+        token = self.__get()
+        self.__now += 50
+        self.assertEqual(token, self.__get())
+        self.assertEqual(1, self.__executor.submitted)
+        refreshed = self.__get()
+        self.assertNotEqual(token, refreshed)
+        self.assertEqual(1050, self.__claims(refreshed)["iat"])
+
+    def test_get_mints_when_expired(self):
+        token = self.__get()
+        self.__now += 100
+        self.assertNotEqual(token, self.__get())
+        self.assertEqual(0, self.__executor.submitted)
+
+    def test_get_keys_by_template_and_key_set_version(self):
+        token = self.__get()
+        self.__now += 1
+        self.assertEqual(token, self.__get())
+        self.assertNotEqual(token, self.__get(ClaimsSet(issuer="Issuer")))
+        keys = KeySet(self.__keys.keys, version="rotated")
+        self.assertNotEqual(token, self.__get(keys=keys))
+
+    def test_get_returns_immutable_json_token(self):
+        token = self.__cache.get(self.__keys,
+                                 DigitalSignatureAlgorithm.HS256,
+                                 self.__template,
+                                 Serialization.FLATTENED_JSON)
+        with self.assertRaises(TypeError):
+            token["payload"] = "changed"
+        self.assertEqual(token, self.__cache.get(
+            self.__keys, DigitalSignatureAlgorithm.HS256, self.__template,
+            Serialization.FLATTENED_JSON))
+        self.assertEqual("Issuer", self.__claims(json.dumps(token))["iss"])
+
+    def test_get_keeps_private_claims_named_like_arguments(self):
+        template = ClaimsSet.from_dict({"iss": "Issuer", "issuer": "Other"})
+        self.assertEqual({"iss": "Issuer", "issuer": "Other", "exp": 1100,
+                          "iat": 1000}, self.__claims(self.__get(template)))
+
+    def test_get_denies_template_with_exp(self):
+        with self.assertRaises(ValueError):
+            self.__get(ClaimsSet(expires=1))
+
+
+class JwtTemplateTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__jwt = JWT(JWS(CryptographyModule()))
+        self.__keys = KeySet([Key(KeyType.oct, kid="kid", k=b"k" * 32)])
+
+    def __assert_matches_create(self, template_claims: dict) -> None:
+        template = self.__jwt.template(self.__keys,
+                                       DigitalSignatureAlgorithm.HS256,
+                                       ClaimsSet(**template_claims))
+        for values in itertools.product((None, 1300819380), (None, 5),
+                                        (None, 1300819370), (None, "jti")):
+            variable = dict(zip(("expires", "not_before", "issued_at",
+                                 "jwt_id"), values))
+            claims_set = ClaimsSet(**{**template_claims, **{
+                name: value for name, value in variable.items()
+                if value is not None}})
+            expected = self.__jwt.create(self.__keys,
+                                         DigitalSignatureAlgorithm.HS256,
+                                         claims_set, Serialization.COMPACT)
+            with self.subTest(**variable):
+                self.assertEqual(expected, template.create(**variable))
+
+    def test_create_matches_create_with_registered_and_private_claims(self):
+        self.__assert_matches_create({"issuer": "Issuer",
+                                      "subject": "Subject \u00e9",
+                                      "audience": "Audience",
+                                      "private": {"nested": [1, 2.5]}})
+
+    def test_create_matches_create_without_private_claims(self):
+        self.__assert_matches_create({"issuer": "Iss"})
+
+    def test_create_matches_create_without_registered_claims(self):
+        self.__assert_matches_create({"private": True})
+
+    def test_create_matches_create_with_empty_template(self):
+        self.__assert_matches_create({})
+
+    def test_create_defaults_to_template_values(self):
+        claims_set = ClaimsSet(issuer="Issuer", expires=2, jwt_id="jti")
+        template = self.__jwt.template(self.__keys,
+                                       DigitalSignatureAlgorithm.HS256,
+                                       claims_set)
+        expected = self.__jwt.create(self.__keys,
+                                     DigitalSignatureAlgorithm.HS256,
+                                     claims_set, Serialization.COMPACT)
+        self.assertEqual(expected, template.create())
+
+
+class JwtVerifyTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__now = 1000
+        self.__jwt = JWT(JWS(CryptographyModule()), clock=lambda: self.__now)
+        self.__keys = KeySet([Key(KeyType.oct, k=b"k" * 32)])
+
+    def __create(self, jwt: JWT = None, **claims) -> str:
+        return (jwt or self.__jwt).create(self.__keys,
+                                          DigitalSignatureAlgorithm.HS256,
+                                          ClaimsSet(**claims),
+                                          Serialization.COMPACT)
+
+    def test_verify_returns_claims_set(self):
+        token = self.__create(issuer="Issuer", audience=["a", "b"],
+                              expires=1100, not_before=900, private=1)
+        actual = self.__jwt.verify(
+            self.__keys, token,
+            ClaimsSet(issuer="Issuer", audience="b", private=1))
+        self.assertEqual("Issuer", actual.issuer)
+        self.assertEqual(["a", "b"], actual.audience)
+        self.assertEqual(1100, actual.expires)
+        self.assertEqual({"private": 1}, actual.private_claims)
+
+    def test_verify_denies_expired_beyond_leeway(self):
+        token = self.__create(expires=950)
+        self.assertEqual(950, self.__jwt.verify(self.__keys, token).expires)
+        with self.assertRaises(ValueError):
+            self.__jwt.verify(self.__keys, token, leeway_secs=0)
+
+    def test_verify_denies_time_claims_that_are_not_numbers(self):
+        for claims in ({"expires": "soon"}, {"not_before": [900]},
+                       {"issued_at": True}, {"expires": float("nan")},
+                       {"not_before": float("-inf")},
+                       {"issued_at": float("inf")}):
+            with self.subTest(claims=claims), self.assertRaises(ValueError):
+                self.__jwt.verify(self.__keys, self.__create(**claims))
+
+    def test_verify_denies_not_yet_valid(self):
+        token = self.__create(not_before=1100)
+        with self.assertRaises(ValueError):
+            self.__jwt.verify(self.__keys, token)
+
+    def test_verify_denies_unexpected_claims(self):
+        token = self.__create(issuer="Issuer", audience="a", private=1)
+        for expected in (ClaimsSet(issuer="Other"), ClaimsSet(audience="b"),
+                         ClaimsSet(private=2)):
+            with self.subTest(expected=expected.to_dict()), \
+                    self.assertRaises(ValueError):
+                self.__jwt.verify(self.__keys, token, expected)
+
+    def test_verify_accepts_claims_of_other_types(self):
+        token = self.__create(issuer=["Issuer"], subject=12345)
+        actual = self.__jwt.verify(self.__keys, token)
+        self.assertEqual(["Issuer"], actual.issuer)
+        self.assertEqual(12345, actual.subject)
+
+    def test_verify_keeps_private_claims_named_like_arguments(self):
+        token = JWS(CryptographyModule()).sign(
+            self.__keys, DigitalSignatureAlgorithm.HS256,
+            b'{"iss":"Issuer","issuer":"Other","subject":"Subject",'
+            b'"private_claims":1}', Serialization.COMPACT)
+        actual = self.__jwt.verify(self.__keys, token)
+        self.assertEqual("Issuer", actual.issuer)
+        self.assertIsNone(actual.subject)
+        self.assertEqual({"issuer": "Other", "subject": "Subject",
+                          "private_claims": 1}, actual.private_claims)
+        with self.assertRaises(ValueError):
+            self.__jwt.verify(self.__keys, token, ClaimsSet(subject="Subject"))
+
+    def test_verify_denies_jti_that_is_not_a_string(self):
+        jwt = JWT(JWS(CryptographyModule()),
+                  replay_store=MemoryReplayStore(clock=lambda: self.__now),
+                  clock=lambda: self.__now)
+        for jwt_id in (123, ["jti"]):
+            with self.subTest(jwt_id=jwt_id), self.assertRaises(ValueError):
+                jwt.verify(self.__keys,
+                           self.__create(jwt, expires=1100, jwt_id=jwt_id))
+
+    def test_verify_denies_replay(self):
+        jwt = JWT(JWS(CryptographyModule()),
+                  replay_store=MemoryReplayStore(clock=lambda: self.__now),
+                  clock=lambda: self.__now)
+        token = self.__create(jwt, expires=1100, jwt_id="jti")
+        jwt.verify(self.__keys, token)
+        with self.assertRaises(ValueError):
+            jwt.verify(self.__keys, token)
+        with self.assertRaises(ValueError):
+            jwt.verify(self.__keys, self.__create(jwt, expires=1100))
+
+
+class ClaimsSetTestCase(unittest.TestCase):
+    def test_equal_and_hashable(self):
+        claims_set1 = ClaimsSet(issuer="Issuer", a=1, b={"c": [1]})
+        claims_set2 = ClaimsSet(b={"c": [1]}, a=1, issuer="Issuer")
+        self.assertEqual(claims_set1, claims_set2)
+        self.assertEqual(hash(claims_set1), hash(claims_set2))
+        self.assertNotEqual(claims_set1, ClaimsSet(issuer="Issuer", a=2))
+
+    def test_is_immutable(self):
+        claims_set = ClaimsSet(issuer="Issuer", a={"b": 1})
+        with self.assertRaises(AttributeError):
+            claims_set.issuer = "Other"
+        with self.assertRaises(TypeError):
+            claims_set.private_claims["a"]["b"] = 2
+
@@ -0,0 +1,189 @@
+import os
+import tempfile
+import unittest
+
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeyOp, KeySet, KeyType, Use
+from elfose.jose.core.cryptography import HashingAlgorithm
+from elfose.jose.core.encoding import json_dumps
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.keystore import DerivedKeySet, MappedKeySet, hkdf, \
+    write_key_index
+from elfose.jose.native import CryptographyModule
+
+
+class MappedKeySetTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__directory = tempfile.TemporaryDirectory()
+        self.__path = os.path.join(self.__directory.name, "keys.idx")
+        self.__keys = [Key(KeyType.oct, kid=f"tenant-{i}", k=bytes([i]) * 32,
+                           use=Use.sig, key_ops={KeyOp.sign, KeyOp.verify})
+                       for i in range(50)]
+        write_key_index(self.__path, reversed(self.__keys))
+        self.__key_set = MappedKeySet(self.__path, cache_size=4)
+
+    def tearDown(self) -> None:
+        self.__key_set.close()
+        self.__directory.cleanup()
+
+    def test_get_key_by_id(self):
+        for key in self.__keys:
+            self.assertEqual(key, self.__key_set.get_key_by_id(key.kid))
+
+    def test_get_key_by_id_returns_cached_key(self):
+        key = self.__key_set.get_key_by_id("tenant-1")
+        self.assertIs(key, self.__key_set.get_key_by_id("tenant-1"))
+
+    def test_get_key_by_id_missing(self):
+        self.assertIsNone(self.__key_set.get_key_by_id("tenant-50"))
+        self.assertIsNone(self.__key_set.get_key_by_id(None))
+
+    def test_keys(self):
+        self.assertEqual(set(self.__keys), set(self.__key_set.keys))
+        self.assertEqual(50, len(self.__key_set))
+
+    def test_version_changes_with_file(self):
+        write_key_index(self.__path, self.__keys)
+        with MappedKeySet(self.__path) as key_set:
+            self.assertNotEqual(self.__key_set.version, key_set.version)
+            self.assertEqual(self.__keys[0],
+                             key_set.get_key_by_id("tenant-0"))
+
+    def test_jws_verify(self):
+        jws = JWS(CryptographyModule())
+        token = jws.sign(KeySet([self.__keys[7]]),
+                         DigitalSignatureAlgorithm.HS256, b"payload",
+                         Serialization.COMPACT)
+        self.assertEqual(b"payload", jws.verify(self.__key_set, token))
+
+    def test_write_denies_duplicate_kid(self):
+        with self.assertRaises(ValueError):
+            write_key_index(self.__path, [self.__keys[0], self.__keys[0]])
+
+    def test_write_denies_missing_kid(self):
+        with self.assertRaises(ValueError):
+            write_key_index(self.__path, [Key(KeyType.oct, k=b"k")])
+
+    def test_open_denies_invalid_file(self):
+        with open(self.__path, "wb") as index_file:
+            index_file.write(b"not a key index file at all")
+        with self.assertRaises(ValueError):
+            MappedKeySet(self.__path)
+
+
+class HkdfTests(unittest.TestCase):
+    def test_rfc_5869_vectors(self):
+        module = CryptographyModule()
+        self.assertEqual(bytes.fromhex(
+            "3cb25f25faacd57a90434f64d0362f2a2d2d0a90cf1a5a4c5db02d56ecc4c5bf"
+            "34007208d5b887185865"), hkdf(
+            module, HashingAlgorithm.SHA256, b"\x0b" * 22,
+            bytes(range(13)), bytes(range(0xf0, 0xfa)), 42))
+        self.assertEqual(bytes.fromhex(
+            "8da4e775a563c18f715f802a063c5a31b8a11f5c5ee1879ec3454e5f3c738d2d"
+            "9d201395faa4b61a96c8"), hkdf(
+            module, HashingAlgorithm.SHA256, b"\x0b" * 22, b"", b"", 42))
+
+
+class DerivedKeySetTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__key_set = DerivedKeySet(CryptographyModule(), b"m" * 32,
+                                       epoch=3, cache_size=4)
+        self.__jws = JWS(self.__key_set.cryptography_module)
+
+    def test_get_key(self):
+        key = self.__key_set.get_key("tenant")
+        self.assertEqual("tenant/3", key.kid)
+        self.assertEqual(32, len(key.k))
+        self.assertEqual(key, self.__key_set.get_key_by_id("tenant/3"))
+        self.assertEqual(key, DerivedKeySet(CryptographyModule(), b"m" * 32,
+                                            epoch=3).get_key("tenant"))
+        self.assertNotEqual(key.k, self.__key_set.get_key("tenant", 2).k)
+        self.assertNotEqual(key.k, self.__key_set.get_key("tenant/3").k)
+
+    def test_get_key_returns_cached_key(self):
+        key = self.__key_set.get_key_by_id("tenant/3")
+        self.assertIs(key, self.__key_set.get_key("tenant"))
+
+    def test_get_key_denies_unaccepted_epochs(self):
+        for epoch in (1, 4):
+            with self.subTest(epoch=epoch), self.assertRaises(ValueError):
+                self.__key_set.get_key("tenant", epoch)
+
+    def test_get_key_by_id_invalid(self):
+        for kid in (None, "tenant", "/3", "tenant/1", "tenant/4",
+                    "tenant/03", "tenant/+3", "tenant/\u0663"):
+            with self.subTest(kid=kid):
+                self.assertIsNone(self.__key_set.get_key_by_id(kid))
+
+    def test_keys_are_not_enumerable(self):
+        self.assertEqual([], self.__key_set.keys)
+        with self.assertRaises(ValueError):
+            self.__jws.sign(self.__key_set, DigitalSignatureAlgorithm.HS256,
+                            b"payload", Serialization.COMPACT)
+
+    def test_jws_sign_and_verify(self):
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                signed = self.__jws.sign(self.__key_set.for_tenant("a"),
+                                         DigitalSignatureAlgorithm.HS256,
+                                         b"payload", serialization)
+                if not isinstance(signed, str):
+                    signed = json_dumps(signed)
+                self.assertEqual(b"payload",
+                                 self.__jws.verify(self.__key_set, signed))
+
+    def test_jws_verify_previous_epoch(self):
+        previous = DerivedKeySet(CryptographyModule(), b"m" * 32, epoch=2)
+        signed = self.__jws.sign(previous.for_tenant("a"),
+                                 DigitalSignatureAlgorithm.HS256,
+                                 b"payload", Serialization.COMPACT)
+        self.assertEqual(b"payload",
+                         self.__jws.verify(self.__key_set, signed))
+
+    def test_jws_verify_denies_other_tenant_key(self):
+        key = self.__key_set.get_key("b")
+        signed = self.__jws.sign(
+            KeySet([Key(KeyType.oct, kid="a/3", k=key.k)]),
+            DigitalSignatureAlgorithm.HS256, b"payload",
+            Serialization.COMPACT)
+        with self.assertRaises(ValueError):
+            self.__jws.verify(self.__key_set, signed)
+
+    def test_algorithm_sets_key_length(self):
+        key_set = DerivedKeySet(CryptographyModule(), b"m" * 32,
+                                algorithm=DigitalSignatureAlgorithm.HS512)
+        key = key_set.get_key("tenant")
+        self.assertEqual(64, len(key.k))
+        self.assertEqual(DigitalSignatureAlgorithm.HS512, key.alg)
+
+    def test_init_denies_invalid_values(self):
+        for kwargs in ({"algorithm": DigitalSignatureAlgorithm.ES256},
+                       {"epoch": -1}, {"previous_epochs": -1},
+                       {"master_secret": b"short"}):
+            arguments = {"master_secret": b"m" * 32, **kwargs}
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValueError):
+                DerivedKeySet(CryptographyModule(), **arguments)
+
+
+class KeyDictTests(unittest.TestCase):
+    def test_round_trip(self):
+        key = Key(KeyType.oct, kid="kid", k=b"key", use=Use.sig,
+                  key_ops={KeyOp.sign}, alg=DigitalSignatureAlgorithm.HS256,
+                  x5u="https://example.com/x5u", x5t_s256="thumbprint")
+        self.assertEqual({"kty": "oct", "use": "sig", "key_ops": ["sign"],
+                          "alg": "HS256", "kid": "kid",
+                          "x5u": "https://example.com/x5u",
+                          "x5t#S256": "thumbprint", "k": "a2V5"},
+                         key.to_dict())
+        self.assertEqual(key, Key.from_dict(key.to_dict()))
+
+    def test_from_dict_denies_invalid_values(self):
+        for jwk in ({"kty": "none"}, {"kty": "oct", "use": "none"},
+                    {"kty": "oct", "alg": "none"}):
+            with self.subTest(jwk=jwk), self.assertRaises(ValueError):
+                Key.from_dict(jwk)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import multiprocessing
+import unittest
+
+from elfose.jose.core.replay import BloomFilter, MemoryReplayStore, \
+    SharedMemoryReplayStore
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_add_reports_present(self):
+        bloom_filter = BloomFilter(100, 0.01)
+        self.assertFalse(bloom_filter.add(b"a" * 16))
+        self.assertTrue(bloom_filter.add(b"a" * 16))
+
+    def test_false_positive_rate_within_capacity(self):
+        bloom_filter = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom_filter.add(i.to_bytes(8, "big") * 2)
+        false_positives = sum(
+            bloom_filter.add(i.to_bytes(8, "big") + b"\x01" * 8)
+            for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+
+class MemoryReplayStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__now = 1000.0
+        self.__store = MemoryReplayStore(bucket_seconds=10,
+                                         clock=lambda: self.__now)
+
+    def test_add_denies_replay(self):
+        self.assertTrue(self.__store.add("jti", 1100))
+        self.assertFalse(self.__store.add("jti", 1100))
+        self.assertTrue(self.__store.add("other", 1100))
+
+    def test_add_ignores_expired(self):
+        self.assertTrue(self.__store.add("jti", 1000))
+        self.assertEqual(0, len(self.__store))
+
+    def test_drops_expired_buckets(self):
+        self.__store.add("a", 1005)
+        self.__store.add("b", 1015)
+        self.__store.add("c", 1025)
+        self.__now = 1020
+        self.__store.add("d", 1100)
+        self.assertEqual(2, len(self.__store))
+
+    def test_bloom_filter_mode_denies_replay(self):
+        store = MemoryReplayStore(false_positive_rate=0.001,
+                                  bucket_capacity=100,
+                                  clock=lambda: self.__now)
+        self.assertTrue(store.add("jti", 1100))
+        self.assertFalse(store.add("jti", 1100))
+
+
+def _add(store, jti, expires, results):
+    results.put(store.add(jti, expires))
+
+
+class SharedMemoryReplayStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__now = 1000.0
+        self.__store = SharedMemoryReplayStore(segments=2,
+                                               segment_capacity=4,
+                                               bucket_seconds=100,
+                                               clock=lambda: self.__now)
+
+    def tearDown(self) -> None:
+        self.__store.close()
+
+    def test_add_denies_replay(self):
+        self.assertTrue(self.__store.add("jti", 1050))
+        self.assertFalse(self.__store.add("jti", 1050))
+        self.assertTrue(self.__store.add("other", 1050))
+
+    def test_add_raises_when_segment_full(self):
+        for i in range(4):
+            self.__store.add(str(i), 1050)
+        with self.assertRaises(ValueError):
+            self.__store.add("full", 1050)
+
+    def test_reuses_expired_segment(self):
+        self.__store.add("jti", 1050)
+        self.__now = 1100
+        self.assertTrue(self.__store.add("jti", 1250))
+        self.assertFalse(self.__store.add("jti", 1250))
+
+    def test_raises_when_segment_in_use(self):
+        self.__store.add("jti", 1050)
+        with self.assertRaises(ValueError):
+            self.__store.add("jti", 1250)
+
+    def test_shared_with_forked_processes(self):
+        context = multiprocessing.get_context("fork")
+        store = SharedMemoryReplayStore()
+        results = context.Queue()
+        processes = [context.Process(target=_add,
+                                     args=(store, "jti", 2 ** 40, results))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual([False, False, False, True],
+                         sorted(results.get() for _ in processes))
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import asyncio
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+from elfose.jose.core.encoding import base64_url_encode, json_dumps
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.middleware import BearerTokenASGIMiddleware, \
+    BearerTokenVerifier, BearerTokenWSGIMiddleware, SCOPE_KEY, bearer_token
+from elfose.jose.native import CryptographyModule
+
+
+class CountingJWT(JWT):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.verifications = 0
+
+    def verify(self, *args, **kwargs):
+        self.verifications += 1
+        return super().verify(*args, **kwargs)
+
+
+class MiddlewareTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000
+        self.jwt = CountingJWT(JWS(CryptographyModule()),
+                               clock=lambda: self.now)
+        self.keys = KeySet([Key(KeyType.oct, k=b"k" * 32)])
+        self.verifier = BearerTokenVerifier(self.jwt, self.keys,
+                                            leeway_secs=0,
+                                            clock=lambda: self.now)
+        self.token = self.jwt.create(self.keys,
+                                     DigitalSignatureAlgorithm.HS256,
+                                     ClaimsSet(subject="user", expires=1100),
+                                     Serialization.COMPACT)
+        signature = self.token.split(".")[2]
+        self.malformed_tokens = [
+            ".".join((base64_url_encode(json_dumps(header).encode()),
+                      self.token.split(".")[1], signature))
+            for header in ({"alg": "none"}, {"alg": "HS256", "kid": ["a"]})]
+
+
+class FailingJWT(JWT):
+    def verify(self, *args, **kwargs):
+        raise TypeError("unexpected")
+
+
+class BearerTokenTests(unittest.TestCase):
+    def test_bearer_token(self):
+        self.assertEqual(b"abc", bearer_token(b"Bearer abc"))
+        self.assertEqual("abc", bearer_token("bearer  abc "))
+        self.assertIsNone(bearer_token(b"Basic abc"))
+        self.assertIsNone(bearer_token(b"Bearer "))
+
+
+class BearerTokenVerifierTests(MiddlewareTestCase):
+    def test_verify_caches_claims_set(self):
+        self.assertEqual("user", self.verifier.verify(self.token).subject)
+        self.assertEqual("user", self.verifier.verify(self.token).subject)
+        self.assertEqual(1, self.jwt.verifications)
+
+    def test_verify_does_not_return_expired_claims_set(self):
+        self.verifier.verify(self.token)
+        self.now = 1100
+        with self.assertRaises(ValueError):
+            self.verifier.verify(self.token)
+
+    def test_verify_without_cache(self):
+        verifier = BearerTokenVerifier(self.jwt, self.keys, cache_size=0,
+                                       clock=lambda: self.now)
+        verifier.verify(self.token)
+        verifier.verify(self.token)
+        self.assertEqual(2, self.jwt.verifications)
+
+
+class BearerTokenASGIMiddlewareTests(MiddlewareTestCase):
+    def __call(self, authorization: bytes = None, required: bool = True,
+               scope_type: str = "http"):
+        scopes, sent = [], []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        async def receive():
+            return {"type": "http.request"}
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b"host", b"localhost")]
+        if authorization is not None:
+            headers.append((b"authorization", authorization))
+        middleware = BearerTokenASGIMiddleware(app, self.verifier,
+                                               required=required)
+        asyncio.run(middleware({"type": scope_type, "headers": headers},
+                               receive, send))
+        return scopes, sent
+
+    def test_valid_token(self):
+        scopes, sent = self.__call(b"Bearer " + self.token.encode())
+        self.assertEqual([], sent)
+        self.assertEqual("user", scopes[0][SCOPE_KEY].claims_set.subject)
+
+    def test_rejects_missing_token(self):
+        scopes, sent = self.__call()
+        self.assertEqual([], scopes)
+        self.assertEqual(401, sent[0]["status"])
+        self.assertIn((b"www-authenticate", b"Bearer"), sent[0]["headers"])
+
+    def test_rejects_invalid_token(self):
+        scopes, sent = self.__call(b"Bearer " + self.token[:-2].encode())
+        self.assertEqual([], scopes)
+        self.assertIn((b"www-authenticate", b'Bearer error="invalid_token"'),
+                      sent[0]["headers"])
+
+    def test_rejects_malformed_tokens(self):
+        for token in self.malformed_tokens:
+            with self.subTest(token=token):
+                scopes, sent = self.__call(b"Bearer " + token.encode())
+                self.assertEqual([], scopes)
+                self.assertEqual(401, sent[0]["status"])
+                self.assertIn((b"www-authenticate",
+                               b'Bearer error="invalid_token"'),
+                              sent[0]["headers"])
+
+    def test_closes_websocket_with_invalid_token(self):
+        scopes, sent = self.__call(b"Bearer x", scope_type="websocket")
+        self.assertEqual([{"type": "websocket.close", "code": 1008}], sent)
+
+    def test_not_required_verifies_lazily(self):
+        scopes, sent = self.__call(b"Bearer x", required=False)
+        self.assertEqual(0, self.jwt.verifications)
+        with self.assertRaises(ValueError):
+            scopes[0][SCOPE_KEY].claims_set
+        scopes, sent = self.__call(required=False)
+        self.assertIsNone(scopes[0][SCOPE_KEY])
+
+
+class BearerTokenWSGIMiddlewareTests(MiddlewareTestCase):
+    def __call(self, authorization: str = None, required: bool = True):
+        environs, statuses = [], []
+
+        def app(environ, start_response):
+            environs.append(environ)
+            start_response("200 OK", [])
+            return [b"OK"]
+
+        environ = {}
+        setup_testing_defaults(environ)
+        if authorization is not None:
+            environ["HTTP_AUTHORIZATION"] = authorization
+        middleware = BearerTokenWSGIMiddleware(app, self.verifier,
+                                               required=required)
+        body = middleware(environ, lambda status, headers: statuses.append(
+            (status, headers)))
+        return environs, statuses, b"".join(body)
+
+    def test_valid_token(self):
+        environs, statuses, body = self.__call("Bearer " + self.token)
+        self.assertEqual(b"OK", body)
+        self.assertEqual("user", environs[0][SCOPE_KEY].claims_set.subject)
+
+    def test_rejects_invalid_token(self):
+        environs, statuses, body = self.__call("Bearer " + self.token[:-2])
+        self.assertEqual([], environs)
+        self.assertEqual("401 Unauthorized", statuses[0][0])
+
+    def test_rejects_malformed_tokens(self):
+        for token in self.malformed_tokens:
+            with self.subTest(token=token):
+                environs, statuses, body = self.__call("Bearer " + token)
+                self.assertEqual([], environs)
+                self.assertEqual("401 Unauthorized", statuses[0][0])
+                self.assertIn(("WWW-Authenticate",
+                               'Bearer error="invalid_token"'),
+                              statuses[0][1])
+
+    def test_rejects_token_failing_verification_otherwise(self):
+        self.verifier = BearerTokenVerifier(
+            FailingJWT(JWS(CryptographyModule())), self.keys)
+        environs, statuses, body = self.__call("Bearer " + self.token)
+        self.assertEqual([], environs)
+        self.assertEqual("401 Unauthorized", statuses[0][0])
+
+    def test_not_required(self):
+        environs, statuses, body = self.__call(required=False)
+        self.assertEqual(b"OK", body)
+        self.assertIsNone(environs[0][SCOPE_KEY])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -102,6 +102,38 @@ class HmacTestCase(unittest.TestCase):
                                                   message, digest)
         self.assertFalse(actual)
 
+    def test_hmac_context_sha256(self):
+        expected = unhexlify(
+            "cf90095ab5c06dec2f4de5c51bc924981f3b936f85651042bc49ddb45c883bba")
+        context = self.__module.hmac_context(HashingAlgorithm.SHA256,
+                                             b"secret-key")
+        context.update(b"message-")
+        context.update(b"text")
+        self.assertEqual(expected, context.digest())
+
+
+class Pbkdf2TestCase(unittest.TestCase):
+    def test_pbkdf2_hmac_sha256(self):
+        expected = unhexlify(
+            "120fb6cffcf8b32c43e7225256c4f837a86548c92ccc35480805987cb70be17b")
+        actual = CryptographyModule().pbkdf2_hmac(
+            HashingAlgorithm.SHA256, b"password", b"salt", 1, 32)
+        self.assertEqual(expected, actual)
+
+
+class DigestTestCase(unittest.TestCase):
+    def test_digest_sha256(self):
+        expected = unhexlify(
+            "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824")
+        actual = CryptographyModule().digest(HashingAlgorithm.SHA256,
+                                             b"hello")
+        self.assertEqual(expected, actual)
+
+
+class RandomBytesTestCase(unittest.TestCase):
+    def test_random_bytes_length(self):
+        self.assertEqual(32, len(CryptographyModule().random_bytes(32)))
+
 
 if __name__ == '__main__':
     unittest.main()
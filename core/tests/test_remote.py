@@ -0,0 +1,145 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from elfose.jose.core.cryptography import HashingAlgorithm
+from elfose.jose.core.jwa import DigitalSignatureAlgorithm
+from elfose.jose.core.jwk import Key, KeySet, KeyType
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.native import CryptographyModule as NativeModule
+from elfose.jose.remote import CryptographyModule, LocalTransport, Signer, \
+    SignerServer, Transport, UnixSocketTransport, decode_requests, \
+    decode_responses, encode_requests, encode_responses
+
+
+class BlockingTransport(Transport):
+    """
+    Holds the first batch until released so that later requests queue up
+    """
+
+    def __init__(self, signer: Signer) -> None:
+        self.signer = signer
+        self.batches = []
+        self.release = threading.Event()
+
+    def call(self, requests):
+        self.batches.append(len(requests))
+        self.release.wait()
+        return self.signer.handle(requests)
+
+
+class FailingTransport(Transport):
+    def call(self, requests):
+        raise OSError("connection reset")
+
+
+class RemoteCryptographyModuleTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.native = NativeModule()
+        self.keys = {b"signing-key": b"k" * 32}
+        self.signer = Signer(self.native, self.keys)
+
+    def test_sign_and_verify_through_signer(self):
+        module = CryptographyModule(lambda: LocalTransport(self.signer))
+        self.addCleanup(module.close)
+        key_set = KeySet([Key(KeyType.oct, kid="1", k=b"signing-key")])
+        token = JWS(module).sign_compact(
+            key_set, DigitalSignatureAlgorithm.HS256, b"payload")
+        self.assertEqual(b"payload", JWS(self.native).verify(
+            KeySet([Key(KeyType.oct, kid="1", k=b"k" * 32)]), token))
+        self.assertEqual(b"payload", JWS(module).verify(key_set, token))
+
+    def test_unknown_key_raises_value_error(self):
+        module = CryptographyModule(lambda: LocalTransport(self.signer))
+        self.addCleanup(module.close)
+        with self.assertRaises(ValueError):
+            module.hmac_digest(HashingAlgorithm.SHA256, b"unknown", b"m")
+
+    def test_concurrent_requests_are_coalesced(self):
+        transport = BlockingTransport(self.signer)
+        module = CryptographyModule(lambda: transport, connections=1,
+                                    max_batch_size=8)
+        self.addCleanup(module.close)
+        digests = [None] * 11
+
+        def sign(index):
+            digests[index] = module.hmac_digest(
+                HashingAlgorithm.SHA256, b"signing-key", str(index).encode())
+
+        threads = [threading.Thread(target=sign, args=(index,))
+                   for index in range(len(digests))]
+        threads[0].start()
+        while not transport.batches:
+            threading.Event().wait(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        while module.queued < 10:
+            threading.Event().wait(0.001)
+        transport.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([1, 8, 2], transport.batches)
+        for index, digest in enumerate(digests):
+            self.assertEqual(self.native.hmac_digest(
+                HashingAlgorithm.SHA256, b"k" * 32, str(index).encode()),
+                digest)
+
+    def test_transport_failure_raises_connection_error(self):
+        module = CryptographyModule(FailingTransport)
+        self.addCleanup(module.close)
+        with self.assertRaises(ConnectionError):
+            module.hmac_digest(HashingAlgorithm.SHA256, b"signing-key", b"m")
+
+    def test_other_operations_use_fallback(self):
+        module = CryptographyModule(lambda: LocalTransport(self.signer))
+        with self.assertRaises(NotImplementedError):
+            module.random_bytes(16)
+        module = CryptographyModule(lambda: LocalTransport(self.signer),
+                                    fallback=self.native)
+        self.assertEqual(16, len(module.random_bytes(16)))
+
+    def test_hmac_context(self):
+        module = CryptographyModule(lambda: LocalTransport(self.signer))
+        self.addCleanup(module.close)
+        context = module.hmac_context(HashingAlgorithm.SHA384,
+                                      b"signing-key")
+        context.update(b"mess")
+        context.update(b"age")
+        self.assertEqual(self.native.hmac_digest(
+            HashingAlgorithm.SHA384, b"k" * 32, b"message"), context.digest())
+
+
+class UnixSocketTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "signer.sock")
+        self.server = SignerServer(self.path, Signer(NativeModule()))
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_general_json_over_unix_socket(self):
+        module = CryptographyModule(lambda: UnixSocketTransport(self.path),
+                                    connections=2)
+        self.addCleanup(module.close)
+        key_set = KeySet([Key(KeyType.oct, kid=kid, k=kid.encode() * 32)
+                          for kid in ("1", "2")])
+        jws = JWS(module).sign(key_set, DigitalSignatureAlgorithm.HS512,
+                               b"payload", Serialization.GENERAL_JSON)
+        self.assertEqual(jws, JWS(NativeModule()).sign(
+            key_set, DigitalSignatureAlgorithm.HS512, b"payload",
+            Serialization.GENERAL_JSON))
+
+    def test_encoding_round_trip(self):
+        requests = [(HashingAlgorithm.SHA256, b"key", b"message"),
+                    (HashingAlgorithm.SHA512, b"", b"")]
+        self.assertEqual(requests, decode_requests(encode_requests(requests)))
+        responses = [b"digest", "Unknown key!", b""]
+        self.assertEqual(responses,
+                         decode_responses(encode_responses(responses)))
+        with self.assertRaises(ValueError):
+            decode_requests(encode_requests(requests)[:-1])
@@ -7,5 +7,10 @@ setup(
     package_dir={"": "src"},
     zip_safe=False,
     test_suite="tests",
+    entry_points={
+        "elfose.jose.cryptography_modules": [
+            "pycryptodome = elfose.jose.pycryptodome:CryptographyModule",
+        ],
+    },
     install_requires=["pycryptodome~=3.9"],
 )
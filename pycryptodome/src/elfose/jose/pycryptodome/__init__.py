@@ -1,17 +1,91 @@
+import struct
+from hmac import compare_digest
+
+from Crypto.Cipher import AES
 from Crypto.Hash import HMAC, SHA256, SHA384, SHA512
+from Crypto.PublicKey import ECC
+from Crypto.Protocol.KDF import PBKDF2
+from Crypto.Random import get_random_bytes
 
 from elfose.jose.core.cryptography import CryptographyModule as Base, \
-    HashingAlgorithm
+    EllipticCurve, HashingAlgorithm, HmacContext as BaseHmacContext, \
+    CipherContext as BaseCipherContext, \
+    AuthenticatedEncryptionContext as BaseAuthenticatedEncryptionContext, \
+    AuthenticatedDecryptionContext as BaseAuthenticatedDecryptionContext
+
+KEY_WRAP_DEFAULT_IV = b"\xa6" * 8
+
+
+class HmacContext(BaseHmacContext):
+    def __init__(self, hmac) -> None:
+        self.__hmac = hmac
+
+    def update(self, message: bytes) -> None:
+        self.__hmac.update(message)
+
+    def digest(self) -> bytes:
+        return self.__hmac.digest()
+
+    def copy(self) -> "HmacContext":
+        return HmacContext(self.__hmac.copy())
+
+
+class CipherEncryptionContext(BaseCipherContext):
+    def __init__(self, cipher) -> None:
+        self.__cipher = cipher
+
+    def update(self, data: bytes) -> bytes:
+        return self.__cipher.encrypt(data)
+
+
+class CipherDecryptionContext(BaseCipherContext):
+    def __init__(self, cipher) -> None:
+        self.__cipher = cipher
+
+    def update(self, data: bytes) -> bytes:
+        return self.__cipher.decrypt(data)
+
+
+class AuthenticatedEncryptionContext(BaseAuthenticatedEncryptionContext):
+    def __init__(self, cipher) -> None:
+        self.__cipher = cipher
+
+    def update(self, plaintext: bytes) -> bytes:
+        return self.__cipher.encrypt(plaintext)
+
+    def finalize(self) -> bytes:
+        return self.__cipher.digest()
+
+
+class AuthenticatedDecryptionContext(BaseAuthenticatedDecryptionContext):
+    def __init__(self, cipher) -> None:
+        self.__cipher = cipher
+
+    def update(self, ciphertext: bytes) -> bytes:
+        return self.__cipher.decrypt(ciphertext)
+
+    def finalize(self, tag: bytes) -> None:
+        self.__cipher.verify(tag)
 
 
 class CryptographyModule(Base):
+    def digest(self, hashing_algorithm: HashingAlgorithm,
+               message: bytes) -> bytes:
+        return self.__get_digest_mod(hashing_algorithm).new(message).digest()
+
     def hmac_digest(self, hashing_algorithm: HashingAlgorithm, key: bytes,
                     message: bytes) -> bytes:
         hmac = self.__get_hmac(hashing_algorithm, key, message)
         digest = hmac.digest()
         return digest
 
-    def __get_hmac(self, hashing_algorithm, key, message):
+    def __get_hmac(self, hashing_algorithm, key, message=None):
+        digest_mod = self.__get_digest_mod(hashing_algorithm)
+        hmac = HMAC.new(key, message, digest_mod)
+        return hmac
+
+    @staticmethod
+    def __get_digest_mod(hashing_algorithm):
         if hashing_algorithm is HashingAlgorithm.SHA256:
             digest_mod = SHA256
         elif hashing_algorithm is HashingAlgorithm.SHA384:
@@ -20,8 +94,7 @@ class CryptographyModule(Base):
             digest_mod = SHA512
         else:
             raise NotImplementedError("Hashing algorithm not implemented!")
-        hmac = HMAC.new(key, message, digest_mod)
-        return hmac
+        return digest_mod
 
     def hmac_digest_verify(self, hashing_algorithm: HashingAlgorithm,
                            key: bytes, message: bytes, digest: bytes) -> bool:
@@ -31,3 +104,106 @@ class CryptographyModule(Base):
             return True
         except ValueError:
             return False
+
+    def hmac_context(self, hashing_algorithm: HashingAlgorithm,
+                     key: bytes) -> HmacContext:
+        return HmacContext(self.__get_hmac(hashing_algorithm, key))
+
+    def random_bytes(self, length: int) -> bytes:
+        return get_random_bytes(length)
+
+    def pbkdf2_hmac(self, hashing_algorithm: HashingAlgorithm,
+                    password: bytes, salt: bytes, iterations: int,
+                    length: int) -> bytes:
+        return PBKDF2(password, salt, length, iterations,
+                      hmac_hash_module=self.__get_digest_mod(
+                          hashing_algorithm))
+
+    def aes_cbc_encryptor(self, key: bytes,
+                          iv: bytes) -> CipherEncryptionContext:
+        return CipherEncryptionContext(AES.new(key, AES.MODE_CBC, iv=iv))
+
+    def aes_cbc_decryptor(self, key: bytes,
+                          iv: bytes) -> CipherDecryptionContext:
+        return CipherDecryptionContext(AES.new(key, AES.MODE_CBC, iv=iv))
+
+    def aes_gcm_encryptor(self, key: bytes, iv: bytes,
+                          aad: bytes) -> AuthenticatedEncryptionContext:
+        cipher = AES.new(key, AES.MODE_GCM, nonce=iv)
+        cipher.update(aad)
+        return AuthenticatedEncryptionContext(cipher)
+
+    def aes_gcm_decryptor(self, key: bytes, iv: bytes,
+                          aad: bytes) -> AuthenticatedDecryptionContext:
+        cipher = AES.new(key, AES.MODE_GCM, nonce=iv)
+        cipher.update(aad)
+        return AuthenticatedDecryptionContext(cipher)
+
+    def ec_generate_key_pair(self, curve: EllipticCurve):
+        curve_name, size = self.__get_curve(curve)
+        key = ECC.generate(curve=curve_name)
+        return int(key.d).to_bytes(size, "big"), \
+            int(key.pointQ.x).to_bytes(size, "big"), \
+            int(key.pointQ.y).to_bytes(size, "big")
+
+    def ecdh_shared_secret(self, curve: EllipticCurve, d: bytes, x: bytes,
+                           y: bytes) -> bytes:
+        curve_name, size = self.__get_curve(curve)
+        # construct validates that the point is on the curve
+        public_key = ECC.construct(curve=curve_name,
+                                   point_x=int.from_bytes(x, "big"),
+                                   point_y=int.from_bytes(y, "big"))
+        shared = public_key.pointQ * int.from_bytes(d, "big")
+        if shared.is_point_at_infinity():
+            raise ValueError("Invalid shared secret!")
+        return int(shared.x).to_bytes(size, "big")
+
+    @staticmethod
+    def __get_curve(curve: EllipticCurve):
+        if curve is EllipticCurve.P256:
+            return "P-256", 32
+        elif curve is EllipticCurve.P384:
+            return "P-384", 48
+        elif curve is EllipticCurve.P521:
+            return "P-521", 66
+        else:
+            raise NotImplementedError("Elliptic curve not implemented!")
+
+    def aes_key_wrap(self, wrapping_key: bytes, key: bytes) -> bytes:
+        """
+        AES Key Wrap as described in https://tools.ietf.org/html/rfc3394
+        """
+        if len(key) < 16 or len(key) % 8 != 0:
+            raise ValueError("Key to wrap must be a multiple of 64 bits!")
+        cipher = AES.new(wrapping_key, AES.MODE_ECB)
+        n = len(key) // 8
+        a = KEY_WRAP_DEFAULT_IV
+        r = [key[i * 8:i * 8 + 8] for i in range(n)]
+        for j in range(6):
+            for i in range(n):
+                b = cipher.encrypt(a + r[i])
+                t = struct.pack(">Q", n * j + i + 1)
+                a = bytes(x ^ y for x, y in zip(b[:8], t))
+                r[i] = b[8:]
+        return a + b"".join(r)
+
+    def aes_key_unwrap(self, wrapping_key: bytes,
+                       wrapped_key: bytes) -> bytes:
+        """
+        AES Key Unwrap as described in https://tools.ietf.org/html/rfc3394
+        """
+        if len(wrapped_key) < 24 or len(wrapped_key) % 8 != 0:
+            raise ValueError("Wrapped key must be a multiple of 64 bits!")
+        cipher = AES.new(wrapping_key, AES.MODE_ECB)
+        n = len(wrapped_key) // 8 - 1
+        a = wrapped_key[:8]
+        r = [wrapped_key[i * 8 + 8:i * 8 + 16] for i in range(n)]
+        for j in reversed(range(6)):
+            for i in reversed(range(n)):
+                t = struct.pack(">Q", n * j + i + 1)
+                b = cipher.decrypt(bytes(x ^ y for x, y in zip(a, t)) + r[i])
+                a = b[:8]
+                r[i] = b[8:]
+        if not compare_digest(a, KEY_WRAP_DEFAULT_IV):
+            raise ValueError("Key unwrap integrity check failed!")
+        return b"".join(r)
@@ -1,6 +1,7 @@
 import unittest
 from binascii import unhexlify
-from elfose.jose.core.cryptography import HashingAlgorithm
+from elfose.jose.core.cryptography import EllipticCurve, HashingAlgorithm
+from elfose.jose.core.encoding import base64_url_decode
 from elfose.jose.pycryptodome import CryptographyModule
 
 
@@ -101,6 +102,105 @@ class HmacTestCase(unittest.TestCase):
                                                   message, digest)
         self.assertFalse(actual)
 
+    def test_hmac_context_copy(self):
+        context = self.__module.hmac_context(HashingAlgorithm.SHA256,
+                                             b"secret-key")
+        copy = context.copy()
+        copy.update(b"message-text")
+        self.assertEqual(self.__module.hmac_digest(
+            HashingAlgorithm.SHA256, b"secret-key", b"message-text"),
+            copy.digest())
+        self.assertEqual(self.__module.hmac_digest(
+            HashingAlgorithm.SHA256, b"secret-key", b""), context.digest())
+
+
+class Pbkdf2TestCase(unittest.TestCase):
+    def test_pbkdf2_hmac_sha256(self):
+        expected = unhexlify(
+            "120fb6cffcf8b32c43e7225256c4f837a86548c92ccc35480805987cb70be17b")
+        actual = CryptographyModule().pbkdf2_hmac(
+            HashingAlgorithm.SHA256, b"password", b"salt", 1, 32)
+        self.assertEqual(expected, actual)
+
+
+class EcTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CryptographyModule()
+
+    def tearDown(self) -> None:
+        del self.__module
+
+    def test_ec_generate_key_pair(self):
+        for curve, size in ((EllipticCurve.P256, 32), (EllipticCurve.P384, 48),
+                            (EllipticCurve.P521, 66)):
+            d, x, y = self.__module.ec_generate_key_pair(curve)
+            self.assertEqual((size, size, size), (len(d), len(x), len(y)))
+
+    def test_ecdh_shared_secret_agrees(self):
+        d1, x1, y1 = self.__module.ec_generate_key_pair(EllipticCurve.P256)
+        d2, x2, y2 = self.__module.ec_generate_key_pair(EllipticCurve.P256)
+        self.assertEqual(
+            self.__module.ecdh_shared_secret(EllipticCurve.P256, d1, x2, y2),
+            self.__module.ecdh_shared_secret(EllipticCurve.P256, d2, x1, y1))
+
+    def test_ecdh_shared_secret_denies_point_not_on_curve(self):
+        d, x, y = self.__module.ec_generate_key_pair(EllipticCurve.P256)
+        with self.assertRaises(ValueError):
+            self.__module.ecdh_shared_secret(EllipticCurve.P256, d, x,
+                                             bytes(32))
+
+    def test_digest_sha256(self):
+        expected = base64_url_decode(
+            "LPJNul-wow4m6DsqxbninhsWHlwfp0JecwQzYpOLmCQ")
+        self.assertEqual(expected, self.__module.digest(
+            HashingAlgorithm.SHA256, b"hello"))
+
+
+class AesTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CryptographyModule()
+
+    def tearDown(self) -> None:
+        del self.__module
+
+    def test_aes_key_wrap(self):
+        """
+        Test vector from https://tools.ietf.org/html/rfc3394#section-4.1
+        """
+        expected = unhexlify(
+            "1FA68B0A8112B447AEF34BD8FB5A7B829D3E862371D2CFE5")
+        actual = self.__module.aes_key_wrap(
+            unhexlify("000102030405060708090A0B0C0D0E0F"),
+            unhexlify("00112233445566778899AABBCCDDEEFF"))
+        self.assertEqual(expected, actual)
+
+    def test_aes_key_unwrap(self):
+        expected = unhexlify("00112233445566778899AABBCCDDEEFF")
+        actual = self.__module.aes_key_unwrap(
+            unhexlify("000102030405060708090A0B0C0D0E0F"),
+            unhexlify("1FA68B0A8112B447AEF34BD8FB5A7B829D3E862371D2CFE5"))
+        self.assertEqual(expected, actual)
+
+    def test_aes_key_unwrap_wrong_key(self):
+        with self.assertRaises(ValueError):
+            self.__module.aes_key_unwrap(
+                unhexlify("000102030405060708090A0B0C0D0E0E"),
+                unhexlify("1FA68B0A8112B447AEF34BD8FB5A7B829D3E862371D2CFE5"))
+
+    def test_aes_gcm_encryptor(self):
+        encryptor = self.__module.aes_gcm_encryptor(bytes(16), bytes(12), b"")
+        ciphertext = encryptor.update(bytes(8)) + encryptor.update(bytes(8))
+        self.assertEqual(unhexlify("0388dace60b6a392f328c2b971b2fe78"),
+                         ciphertext)
+        self.assertEqual(unhexlify("ab6e47d42cec13bdf53a67b21257bddf"),
+                         encryptor.finalize())
+
+    def test_aes_gcm_decryptor_denies_invalid_tag(self):
+        decryptor = self.__module.aes_gcm_decryptor(bytes(16), bytes(12), b"")
+        decryptor.update(unhexlify("0388dace60b6a392f328c2b971b2fe78"))
+        with self.assertRaises(ValueError):
+            decryptor.finalize(bytes(16))
+
 
 if __name__ == '__main__':
     unittest.main()
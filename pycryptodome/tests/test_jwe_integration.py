@@ -0,0 +1,442 @@
+import io
+import json
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from elfose.jose.client import JOSE
+from elfose.jose.core.cache import LRUCache
+from elfose.jose.core.encoding import base64_url_decode, json_dumps, \
+    base64_url_encode
+from elfose.jose.core.jwa import CompressionAlgorithm, \
+    ContentEncryptionAlgorithm, ContentEncryptionKeyAlgorithm
+from elfose.jose.core.cryptography import EllipticCurve
+from elfose.jose.core.jwe import JWE, EphemeralKeyPool, concat_kdf
+from elfose.jose.core.jwk import Curve, Key, KeyOp, KeySet, KeyType
+from elfose.jose.core.jws import Serialization
+from elfose.jose.pycryptodome import CryptographyModule
+
+
+class JweDecryptIntegrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__jwe = JWE(CryptographyModule())
+        self.__keys = KeySet([
+            Key(KeyType.oct, k=base64_url_decode("GawgguFyGrWKav7AX4VKUg"))
+        ])
+        self.__jwe_compact = \
+            "eyJhbGciOiJBMTI4S1ciLCJlbmMiOiJBMTI4Q0JDLUhTMjU2In0." \
+            "6KB707dM9YTIgHtLvtgWQ8mKwboJW3of9locizkDTHzBC2IlrT1oOQ." \
+            "AxY8DCtDaGlsbGljb3RoZQ." \
+            "KDlTtXchhZTGufMYmOYGS4HffxPSUrfmqCHXaI9wOGY." \
+            "U0m_YmjN04DJvceFICbCVQ"
+
+    def tearDown(self) -> None:
+        del self.__jwe
+
+    def test_decrypt_a128kw_a128cbc_hs256_compact_serialization(self):
+        """
+        Example JWE from IETF JWE RFC Appendix A.3
+        See https://tools.ietf.org/html/rfc7516#appendix-A.3
+        """
+        actual = self.__jwe.decrypt(self.__keys, self.__jwe_compact)
+        self.assertEqual(b"Live long and prosper.", actual)
+
+    def test_decrypt_stream_a128kw_a128cbc_hs256_compact_serialization(self):
+        output = io.BytesIO()
+        self.__jwe.decrypt_stream(self.__keys,
+                                  io.BytesIO(self.__jwe_compact.encode()),
+                                  output, chunk_size=5)
+        self.assertEqual(b"Live long and prosper.", output.getvalue())
+
+    def test_decrypt_denies_modified_tag(self):
+        jwe = self.__jwe_compact[:-1] + "A"
+        with self.assertRaises(ValueError):
+            self.__jwe.decrypt(self.__keys, jwe)
+
+    def test_decrypt_stream_denies_modified_ciphertext(self):
+        segments = self.__jwe_compact.split(".")
+        segments[3] = "A" + segments[3][1:]
+        with self.assertRaises(ValueError):
+            self.__jwe.decrypt_stream(
+                self.__keys, io.BytesIO(".".join(segments).encode()),
+                io.BytesIO())
+
+
+class JweRoundTripIntegrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CryptographyModule()
+        self.__jwe = JWE(self.__module)
+        self.__plaintext = b"The true sign of intelligence is not " \
+                           b"knowledge but imagination." * 100
+
+    def tearDown(self) -> None:
+        del self.__jwe
+
+    def __key_set(self, algorithm: ContentEncryptionKeyAlgorithm,
+                  encryption: ContentEncryptionAlgorithm) -> KeySet:
+        if algorithm is ContentEncryptionKeyAlgorithm.DIR:
+            length = {"A128CBC-HS256": 32, "A192CBC-HS384": 48,
+                      "A256CBC-HS512": 64, "A128GCM": 16, "A192GCM": 24,
+                      "A256GCM": 32}[encryption.value]
+        else:
+            length = 16
+        return KeySet([Key(KeyType.oct, k=self.__module.random_bytes(length),
+                           kid="key-1")])
+
+    def test_encrypt_decrypt(self):
+        for algorithm in (ContentEncryptionKeyAlgorithm.DIR,
+                          ContentEncryptionKeyAlgorithm.A128KW):
+            for encryption in ContentEncryptionAlgorithm:
+                for serialization in Serialization:
+                    with self.subTest(algorithm=algorithm,
+                                      encryption=encryption,
+                                      serialization=serialization):
+                        key_set = self.__key_set(algorithm, encryption)
+                        jwe = self.__jwe.encrypt(key_set, algorithm,
+                                                 encryption, self.__plaintext,
+                                                 serialization)
+                        if not isinstance(jwe, str):
+                            jwe = json.dumps(jwe)
+                        actual = self.__jwe.decrypt(key_set, jwe)
+                        self.assertEqual(self.__plaintext, actual)
+
+    def test_encrypt_stream_decrypt_stream(self):
+        for algorithm in (ContentEncryptionKeyAlgorithm.DIR,
+                          ContentEncryptionKeyAlgorithm.A128KW):
+            for encryption in ContentEncryptionAlgorithm:
+                for serialization in Serialization:
+                    with self.subTest(algorithm=algorithm,
+                                      encryption=encryption,
+                                      serialization=serialization):
+                        key_set = self.__key_set(algorithm, encryption)
+                        encrypted = io.BytesIO()
+                        self.__jwe.encrypt_stream(
+                            key_set, algorithm, encryption,
+                            io.BytesIO(self.__plaintext), encrypted,
+                            serialization, chunk_size=100)
+                        decrypted = io.BytesIO()
+                        self.__jwe.decrypt_stream(
+                            key_set, io.BytesIO(encrypted.getvalue()),
+                            decrypted, chunk_size=100)
+                        self.assertEqual(self.__plaintext,
+                                         decrypted.getvalue())
+
+    def test_encrypt_stream_matches_decrypt(self):
+        key_set = self.__key_set(ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A256GCM)
+        encrypted = io.BytesIO()
+        self.__jwe.encrypt_stream(key_set,
+                                  ContentEncryptionKeyAlgorithm.A128KW,
+                                  ContentEncryptionAlgorithm.A256GCM,
+                                  io.BytesIO(self.__plaintext), encrypted,
+                                  Serialization.FLATTENED_JSON,
+                                  unprotected_header={"foo": "bar"})
+        jwe = json.loads(encrypted.getvalue())
+        self.assertEqual({"foo": "bar"}, jwe["unprotected"])
+        actual = self.__jwe.decrypt(key_set, encrypted.getvalue().decode())
+        self.assertEqual(self.__plaintext, actual)
+
+    def test_decrypt_stream_denies_header_after_ciphertext(self):
+        key_set = self.__key_set(ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A128GCM)
+        jwe = self.__jwe.encrypt(key_set, ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A128GCM,
+                                 self.__plaintext)
+        reordered = {"ciphertext": jwe.pop("ciphertext")}
+        reordered.update(jwe)
+        with self.assertRaises(ValueError):
+            self.__jwe.decrypt_stream(
+                key_set, io.BytesIO(json.dumps(reordered).encode()),
+                io.BytesIO())
+
+    def test_decrypt_json_with_dots_in_unprotected_header(self):
+        key_set = self.__key_set(ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A128GCM)
+        jwe = self.__jwe.encrypt(key_set, ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A128GCM,
+                                 self.__plaintext,
+                                 unprotected_header={"foo": "a.b.c.d.e"})
+        actual = self.__jwe.decrypt(key_set, "  " + json.dumps(jwe))
+        self.assertEqual(self.__plaintext, actual)
+
+    def test_decrypt_denies_compact_with_wrong_number_of_segments(self):
+        with self.assertRaises(ValueError):
+            self.__jwe.decrypt(KeySet([]), "a.b.c.d")
+
+
+class JoseEncryptionIntegrationTestCase(unittest.TestCase):
+    def test_encrypt_and_decrypt(self):
+        jose = JOSE(KeySet([Key(KeyType.oct, kid="1", k=b"1" * 16)]),
+                    CryptographyModule())
+        for compact_encoding in (True, False):
+            with self.subTest(compact_encoding=compact_encoding):
+                jwe = jose.encrypt("plaintext",
+                                   ContentEncryptionAlgorithm.A128GCM,
+                                   algorithm=ContentEncryptionKeyAlgorithm.DIR,
+                                   compact_encoding=compact_encoding)
+                self.assertEqual(b"plaintext", jose.decrypt(jwe))
+
+
+class JweCompressionIntegrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CryptographyModule()
+        self.__keys = KeySet([
+            Key(KeyType.oct, k=self.__module.random_bytes(16), kid="key-1")
+        ])
+        self.__plaintext = json_dumps(
+            {"roles": ["reader", "writer"] * 500}).encode()
+
+    def test_encrypt_decrypt(self):
+        jwe = JWE(self.__module)
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                token = jwe.encrypt(self.__keys,
+                                    ContentEncryptionKeyAlgorithm.A128KW,
+                                    ContentEncryptionAlgorithm.A128GCM,
+                                    self.__plaintext, serialization,
+                                    compression=CompressionAlgorithm.DEF)
+                if not isinstance(token, str):
+                    token = json.dumps(token)
+                self.assertLess(len(token), len(self.__plaintext) // 10)
+                self.assertEqual(self.__plaintext,
+                                 jwe.decrypt(self.__keys, token))
+
+    def test_encrypt_stream_decrypt_stream(self):
+        jwe = JWE(self.__module)
+        for serialization in Serialization:
+            with self.subTest(serialization=serialization):
+                encrypted = io.BytesIO()
+                jwe.encrypt_stream(self.__keys,
+                                   ContentEncryptionKeyAlgorithm.A128KW,
+                                   ContentEncryptionAlgorithm.A128CBC_HS256,
+                                   io.BytesIO(self.__plaintext), encrypted,
+                                   serialization,
+                                   compression=CompressionAlgorithm.DEF,
+                                   chunk_size=100)
+                decrypted = io.BytesIO()
+                jwe.decrypt_stream(self.__keys,
+                                   io.BytesIO(encrypted.getvalue()),
+                                   decrypted, chunk_size=10)
+                self.assertEqual(self.__plaintext, decrypted.getvalue())
+
+    def test_decrypt_denies_plaintext_over_max_decompressed_length(self):
+        jwe = JWE(self.__module, max_decompressed_length=1024)
+        token = jwe.encrypt(self.__keys, ContentEncryptionKeyAlgorithm.A128KW,
+                            ContentEncryptionAlgorithm.A128GCM,
+                            bytes(1024 * 1024), Serialization.COMPACT,
+                            compression=CompressionAlgorithm.DEF)
+        with self.assertRaises(ValueError):
+            jwe.decrypt(self.__keys, token)
+        with self.assertRaises(ValueError):
+            jwe.decrypt_stream(self.__keys, io.BytesIO(token.encode()),
+                               io.BytesIO())
+
+    def test_decrypt_denies_unprotected_zip(self):
+        jwe = JWE(self.__module)
+        token = jwe.encrypt(self.__keys, ContentEncryptionKeyAlgorithm.A128KW,
+                            ContentEncryptionAlgorithm.A128GCM,
+                            self.__plaintext,
+                            unprotected_header={"zip": "DEF"})
+        with self.assertRaises(ValueError):
+            jwe.decrypt(self.__keys, json.dumps(token))
+
+
+class CountingCryptographyModule(CryptographyModule):
+    def __init__(self) -> None:
+        self.pbkdf2_calls = 0
+
+    def pbkdf2_hmac(self, *args) -> bytes:
+        self.pbkdf2_calls += 1
+        return super().pbkdf2_hmac(*args)
+
+
+class JwePbes2IntegrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CountingCryptographyModule()
+        self.__keys = KeySet([
+            Key(KeyType.oct,
+                k=b"Thus from my lips, by yours, my sin is purged.")
+        ])
+        self.__plaintext = b"Live long and prosper."
+
+    def test_encrypt_decrypt(self):
+        jwe = JWE(self.__module, pbes2_iterations=4096)
+        for algorithm in (ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                          ContentEncryptionKeyAlgorithm.PBES2_HS384_A192KW,
+                          ContentEncryptionKeyAlgorithm.PBES2_HS512_A256KW):
+            with self.subTest(algorithm=algorithm):
+                token = jwe.encrypt(self.__keys, algorithm,
+                                    ContentEncryptionAlgorithm.A128CBC_HS256,
+                                    self.__plaintext, Serialization.COMPACT)
+                protected = json.loads(base64_url_decode(token.split(".")[0]))
+                self.assertEqual(4096, protected["p2c"])
+                self.assertEqual(16, len(base64_url_decode(protected["p2s"])))
+                self.assertEqual(self.__plaintext,
+                                 jwe.decrypt(self.__keys, token))
+
+    def test_decrypt_uses_key_cache(self):
+        jwe = JWE(self.__module, pbes2_iterations=4096,
+                  pbes2_key_cache=LRUCache(16))
+        token = jwe.encrypt(self.__keys,
+                            ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                            ContentEncryptionAlgorithm.A128GCM,
+                            self.__plaintext, Serialization.COMPACT)
+        self.assertEqual(1, self.__module.pbkdf2_calls)
+        for _ in range(3):
+            self.assertEqual(self.__plaintext,
+                             jwe.decrypt(self.__keys, token))
+        self.assertEqual(2, self.__module.pbkdf2_calls)
+
+    def test_decrypt_denies_iterations_over_maximum(self):
+        encrypting = JWE(self.__module, pbes2_iterations=4096)
+        decrypting = JWE(self.__module, pbes2_max_iterations=2048,
+                         pbes2_iterations=2048)
+        token = encrypting.encrypt(
+            self.__keys, ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+            ContentEncryptionAlgorithm.A128GCM, self.__plaintext,
+            Serialization.COMPACT)
+        calls = self.__module.pbkdf2_calls
+        with self.assertRaises(ValueError):
+            decrypting.decrypt(self.__keys, token)
+        self.assertEqual(calls, self.__module.pbkdf2_calls)
+
+    def test_decrypt_denies_recipients_over_maximum(self):
+        jwe = JWE(self.__module, pbes2_iterations=4096, max_recipients=2)
+        token = jwe.encrypt(self.__keys,
+                            ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                            ContentEncryptionAlgorithm.A128GCM,
+                            self.__plaintext, Serialization.GENERAL_JSON)
+        self.assertEqual(self.__plaintext,
+                         jwe.decrypt(self.__keys, json.dumps(token)))
+        token["recipients"] *= 3
+        calls = self.__module.pbkdf2_calls
+        with self.assertRaises(ValueError):
+            jwe.decrypt(self.__keys, json.dumps(token))
+        with self.assertRaises(ValueError):
+            jwe.decrypt_stream(self.__keys,
+                               io.BytesIO(json.dumps(token).encode()),
+                               io.BytesIO())
+        self.assertEqual(calls, self.__module.pbkdf2_calls)
+
+    def test_decrypt_denies_short_salt(self):
+        jwe = JWE(self.__module, pbes2_iterations=4096)
+        token = jwe.encrypt(self.__keys,
+                            ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                            ContentEncryptionAlgorithm.A128GCM,
+                            self.__plaintext, Serialization.COMPACT)
+        segments = token.split(".")
+        protected = json.loads(base64_url_decode(segments[0]))
+        protected["p2s"] = base64_url_encode(b"salt")
+        segments[0] = base64_url_encode(json_dumps(protected).encode())
+        with self.assertRaises(ValueError):
+            jwe.decrypt(self.__keys, ".".join(segments))
+
+    def test_encrypt_decrypt_with_process_pool(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            jwe = JWE(CryptographyModule(), pbes2_iterations=4096,
+                      pbes2_executor=executor)
+            token = jwe.encrypt(
+                self.__keys, ContentEncryptionKeyAlgorithm.PBES2_HS256_A128KW,
+                ContentEncryptionAlgorithm.A128GCM, self.__plaintext,
+                Serialization.COMPACT)
+            self.assertEqual(self.__plaintext,
+                             jwe.decrypt(self.__keys, token))
+
+
+class JweEcdhEsIntegrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__module = CryptographyModule()
+        d, x, y = self.__module.ec_generate_key_pair(EllipticCurve.P256)
+        self.__keys = KeySet([
+            Key(KeyType.EC, crv=Curve.P_256, x=x, y=y, d=d, kid="ec-1",
+                key_ops={KeyOp.derive_key})
+        ])
+        self.__plaintext = b"Live long and prosper."
+
+    def test_concat_kdf(self):
+        """
+        Example key agreement from IETF JWA RFC Appendix C
+        See https://tools.ietf.org/html/rfc7518#appendix-C
+        """
+        shared_secret = self.__module.ecdh_shared_secret(
+            EllipticCurve.P256,
+            base64_url_decode("VEmDZpDXXK8p8N0Cndsxs924q6nS1RXFASRl6BfUqdw"),
+            base64_url_decode("gI0GAILBdu7T53akrFmMyGcsF3n5dO7MmwNBHKW5SV0"),
+            base64_url_decode("SLW_xSffzlPWrHEVI30DHM_4egVwt3NQqeUD7nMFpps"))
+        actual = concat_kdf(self.__module, shared_secret, "A128GCM",
+                            b"Alice", b"Bob", 16)
+        self.assertEqual(base64_url_decode("VqqN6vgjbSBcIijNcacQGg"), actual)
+
+    def test_encrypt_decrypt(self):
+        jwe = JWE(self.__module)
+        for algorithm in (ContentEncryptionKeyAlgorithm.ECDH_ES,
+                          ContentEncryptionKeyAlgorithm.ECDH_ES_A128KW,
+                          ContentEncryptionKeyAlgorithm.ECDH_ES_A256KW):
+            for serialization in Serialization:
+                with self.subTest(algorithm=algorithm,
+                                  serialization=serialization):
+                    token = jwe.encrypt(self.__keys, algorithm,
+                                        ContentEncryptionAlgorithm.A256GCM,
+                                        self.__plaintext, serialization,
+                                        protected_header={
+                                            "apu": base64_url_encode(b"Alice"),
+                                            "apv": base64_url_encode(b"Bob")})
+                    if not isinstance(token, str):
+                        token = json.dumps(token)
+                    self.assertEqual(self.__plaintext,
+                                     jwe.decrypt(self.__keys, token))
+
+    def test_encrypt_with_ephemeral_key_pool(self):
+        with EphemeralKeyPool(self.__module, size=4) as pool:
+            jwe = JWE(self.__module, ephemeral_key_pool=pool)
+            ephemeral_keys = set()
+            for _ in range(8):
+                token = jwe.encrypt(self.__keys,
+                                    ContentEncryptionKeyAlgorithm.ECDH_ES,
+                                    ContentEncryptionAlgorithm.A128GCM,
+                                    self.__plaintext, Serialization.COMPACT)
+                protected = json.loads(base64_url_decode(token.split(".")[0]))
+                ephemeral_keys.add(protected["epk"]["x"])
+                self.assertEqual(self.__plaintext,
+                                 jwe.decrypt(self.__keys, token))
+            self.assertEqual(8, len(ephemeral_keys))
+
+    def test_decrypt_denies_epk_on_other_curve(self):
+        jwe = JWE(self.__module)
+        token = jwe.encrypt(self.__keys, ContentEncryptionKeyAlgorithm.ECDH_ES,
+                            ContentEncryptionAlgorithm.A128GCM,
+                            self.__plaintext, Serialization.COMPACT)
+        segments = token.split(".")
+        protected = json.loads(base64_url_decode(segments[0]))
+        protected["epk"]["crv"] = "P-384"
+        segments[0] = base64_url_encode(json_dumps(protected).encode())
+        with self.assertRaises(ValueError):
+            jwe.decrypt(self.__keys, ".".join(segments))
+
+
+class EphemeralKeyPoolTestCase(unittest.TestCase):
+    def test_refills_in_background(self):
+        with EphemeralKeyPool(CryptographyModule(),
+                              curves=(Curve.P_256, Curve.P_384), size=3,
+                              threads=2) as pool:
+            for _ in range(100):
+                if pool.available(Curve.P_256) == 3 \
+                        and pool.available(Curve.P_384) == 3:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(3, pool.available(Curve.P_256))
+            self.assertEqual(3, pool.available(Curve.P_384))
+
+    def test_key_pairs_are_used_once(self):
+        with EphemeralKeyPool(CryptographyModule(), size=2) as pool:
+            key_pairs = [pool.get(Curve.P_256) for _ in range(10)]
+            self.assertEqual(10, len(set(key_pairs)))
+
+    def test_generates_key_pairs_for_other_curves(self):
+        with EphemeralKeyPool(CryptographyModule(), size=2) as pool:
+            d, x, y = pool.get(Curve.P_521)
+            self.assertEqual(66, len(d))
+
+
+if __name__ == '__main__':
+    unittest.main()
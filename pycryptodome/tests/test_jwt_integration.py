@@ -0,0 +1,126 @@
+import unittest
+
+from elfose.jose.core.encoding import base64_url_decode, json_loads
+from elfose.jose.core.jwa import CompressionAlgorithm, \
+    ContentEncryptionAlgorithm, ContentEncryptionKeyAlgorithm, \
+    DigitalSignatureAlgorithm
+from elfose.jose.core.jwe import JWE
+from elfose.jose.core.jwk import Key, KeyType, KeySet
+from elfose.jose.core.jws import JWS, Serialization
+from elfose.jose.core.jwt import ClaimsSet, JWT
+from elfose.jose.core.replay import MemoryReplayStore
+from elfose.jose.pycryptodome import CryptographyModule
+
+
+class JwtNestedIntegrationTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        cryptography_module = CryptographyModule()
+        self.__jws = JWS(cryptography_module)
+        self.__jwe = JWE(cryptography_module)
+        self.__jwt = JWT(self.__jws, self.__jwe, clock=lambda: 1300819000)
+        self.__signing_keys = KeySet([
+            Key(KeyType.oct, kid="signing", k=b"s" * 32)
+        ])
+        self.__encryption_keys = KeySet([
+            Key(KeyType.oct, kid="encryption", k=b"e" * 16)
+        ])
+        self.__claims_set = ClaimsSet(issuer="Issuer", subject="Subject",
+                                      expires=1300819380, jwt_id="JWT ID",
+                                      admin=True)
+
+    def tearDown(self) -> None:
+        del self.__jwt
+
+    def __create_nested(self, **kwargs) -> str:
+        return self.__jwt.create_nested(
+            self.__signing_keys, DigitalSignatureAlgorithm.HS256,
+            self.__claims_set, self.__encryption_keys,
+            ContentEncryptionKeyAlgorithm.A128KW,
+            ContentEncryptionAlgorithm.A128GCM, **kwargs)
+
+    def test_create_nested_has_cty_jwt(self):
+        jwt = self.__create_nested()
+        protected = json_loads(base64_url_decode(jwt.split(".")[0]))
+        self.assertEqual("JWT", protected["cty"])
+
+    def test_create_nested_contains_signed_jwt(self):
+        jwt = self.__create_nested()
+        expected = self.__jwt.create(self.__signing_keys,
+                                     DigitalSignatureAlgorithm.HS256,
+                                     self.__claims_set, Serialization.COMPACT)
+        self.assertEqual(expected.encode(),
+                         self.__jwe.decrypt(self.__encryption_keys, jwt))
+
+    def test_verify_nested_returns_claims_set(self):
+        jwt = self.__create_nested(compression=CompressionAlgorithm.DEF)
+        actual = self.__jwt.verify_nested(self.__encryption_keys,
+                                          self.__signing_keys, jwt)
+        self.assertEqual("Issuer", actual.issuer)
+        self.assertEqual("Subject", actual.subject)
+        self.assertEqual(1300819380, actual.expires)
+        self.assertEqual("JWT ID", actual.jwt_id)
+        self.assertEqual({"admin": True}, actual.private_claims)
+
+    def test_verify_nested_verifies_claims(self):
+        jwt = self.__create_nested()
+        jwt_at_exp = JWT(self.__jws, self.__jwe, clock=lambda: 1300819380)
+        with self.assertRaisesRegex(ValueError, "expired"):
+            jwt_at_exp.verify_nested(self.__encryption_keys,
+                                     self.__signing_keys, jwt, leeway_secs=0)
+        with self.assertRaisesRegex(ValueError, "issuer"):
+            self.__jwt.verify_nested(self.__encryption_keys,
+                                     self.__signing_keys, jwt,
+                                     ClaimsSet(issuer="Other"))
+
+    def test_verify_nested_denies_replay(self):
+        jwt = JWT(self.__jws, self.__jwe,
+                  replay_store=MemoryReplayStore(clock=lambda: 1300819000),
+                  clock=lambda: 1300819000)
+        nested = self.__create_nested()
+        jwt.verify_nested(self.__encryption_keys, self.__signing_keys, nested)
+        with self.assertRaisesRegex(ValueError, "already been used"):
+            jwt.verify_nested(self.__encryption_keys, self.__signing_keys,
+                              nested)
+
+    def test_verify_nested_denies_invalid_signature(self):
+        jwt = self.__create_nested()
+        keys = KeySet([Key(KeyType.oct, kid="signing", k=b"x" * 32)])
+        with self.assertRaises(ValueError):
+            self.__jwt.verify_nested(self.__encryption_keys, keys, jwt)
+
+    def test_verify_nested_denies_missing_cty(self):
+        signed = self.__jwt.create(self.__signing_keys,
+                                   DigitalSignatureAlgorithm.HS256,
+                                   self.__claims_set, Serialization.COMPACT)
+        jwt = self.__jwe.encrypt(self.__encryption_keys,
+                                 ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A128GCM,
+                                 signed.encode(), Serialization.COMPACT)
+        with self.assertRaises(ValueError):
+            self.__jwt.verify_nested(self.__encryption_keys,
+                                     self.__signing_keys, jwt)
+
+    def test_verify_nested_denies_cty_that_is_not_a_string(self):
+        signed = self.__jwt.create(self.__signing_keys,
+                                   DigitalSignatureAlgorithm.HS256,
+                                   self.__claims_set, Serialization.COMPACT)
+        jwt = self.__jwe.encrypt(self.__encryption_keys,
+                                 ContentEncryptionKeyAlgorithm.A128KW,
+                                 ContentEncryptionAlgorithm.A128GCM,
+                                 signed.encode(), Serialization.COMPACT,
+                                 protected_header={"cty": ["JWT"]})
+        with self.assertRaises(ValueError):
+            self.__jwt.verify_nested(self.__encryption_keys,
+                                     self.__signing_keys, jwt)
+
+    def test_create_nested_requires_jwe(self):
+        with self.assertRaises(ValueError):
+            JWT(self.__jws).create_nested(
+                self.__signing_keys, DigitalSignatureAlgorithm.HS256,
+                self.__claims_set, self.__encryption_keys,
+                ContentEncryptionKeyAlgorithm.A128KW,
+                ContentEncryptionAlgorithm.A128GCM)
+
+
+if __name__ == '__main__':
+    unittest.main()